@@ -1,26 +1,59 @@
 # app_ssml.py
 from flask import Flask, request, jsonify
 from flask_cors import CORS
-from threading import Thread
-from tts_a2f_ssml import tts_with_emotion 
+from py_audio2face import tracing
+from tts_a2f_ssml import tts_with_emotion, warmup_tts, get_synth_pool, get_phrase_cache
+from speech_scheduler import SpeechScheduler, QueueFullError
+
+# ✅ คิวงานพูด: worker จำนวนคงที่ + คิวจำกัดขนาด (A2F มี player เดียว → 1 worker)
+SPEECH_WORKERS = 1
+SPEECH_QUEUE_SIZE = 8
+SPEECH_OVERFLOW = "coalesce"  # drop_oldest / reject / coalesce
+
+# ✅ tracing: TRACE_JSONL=trace.jsonl และ/หรือ TRACE_OTLP_ENDPOINT=http://localhost:4318/v1/traces
+tracing.configure_from_env()
 
 app = Flask(__name__)
 CORS(app)
 
+scheduler = SpeechScheduler(
+    tts_with_emotion, workers=SPEECH_WORKERS, max_queue=SPEECH_QUEUE_SIZE, overflow=SPEECH_OVERFLOW
+)
+
 @app.route("/speak", methods=["POST"])
 def speak():
     data = request.get_json()
     text = data.get("text", "").strip()
     emotion = data.get("emotion", "neutral").strip().lower()
+    avatar = data.get("avatar", "default")
 
     if not text:
         return jsonify({"error": "No text provided"}), 400
 
     # ✅ ส่ง emotion เข้าไปด้วย
-    Thread(target=tts_with_emotion, args=(text, emotion)).start()
+    # correlation id จาก chatbot (ถ้ามี) → span ของ TTS/A2F อยู่ใน turn เดียวกับ STT และ chatbot
+    with tracing.trace_turn(request.headers.get(tracing.CORRELATION_HEADER)) as turn_id:
+        try:
+            scheduler.submit(avatar, text, emotion)
+        except QueueFullError as e:
+            return jsonify({"error": str(e)}), 429
+
+    response = jsonify({"status": "OK", "message": f"กำลังพูด: {text} ({emotion})", "turn_id": turn_id})
+    response.headers[tracing.CORRELATION_HEADER] = turn_id
+    return response, 200
+
 
-    return jsonify({"status": "OK", "message": f"กำลังพูด: {text} ({emotion})"}), 200
+# ✅ ดูความยาวคิวและเวลารอ เพื่อใช้กำหนดขนาดเครื่อง
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    return jsonify({
+        "speech_queue": scheduler.metrics(),
+        "synthesizer_pool": get_synth_pool().stats(),
+        "phrase_cache": get_phrase_cache().stats(),
+        "tracing": tracing.tracer.stats(),
+    }), 200
 
 
 if __name__ == "__main__":
+   warmup_tts()
    app.run(host="0.0.0.0", port=5000)
@@ -0,0 +1,108 @@
+# barge_in.py
+# ตรวจจับการพูดแทรกในเครื่อง (VAD บนเสียงจาก mic_hub) แทนการรอ event recognized ของ Azure STT
+# - on_barge_in() ถูกเรียกทันทีที่ VAD เห็นเสียงพูดติดกัน start_ms (~60-90ms) → avatar หยุดพูดได้เลย
+# - พอคนพูดจบ (เงียบ hangover_ms) ค่อยตัดเสียงช่วงที่พูดแทรก (รวม preroll_ms ก่อนเริ่ม) จาก ring buffer ของ hub
+#   แล้วส่งให้ on_utterance(audio) ใน thread แยก → ถอดความกับ Azure เฉพาะเสียงช่วงนี้เพื่อแยก intent
+# - พูดยาวเกิน max_utterance_s → ตัดส่งเท่าที่มี (เสียงรบกวนต่อเนื่องไม่ทำให้รอ intent ไม่จบ)
+# - VAD พังซ้ำๆ → subscription ถูกปิดและเรียก on_error(e) (ไม่ใช่เงียบไปจนไม่มีใครพูดแทรกได้)
+import threading
+
+from log_writer import write_log
+from py_audio2face import tracing
+from vad import VadStage, FRAME_MS
+
+BARGE_IN_ENERGY_THRESHOLD = 400   # สูงกว่า VAD ปกติ เพราะไมค์ได้ยินเสียง avatar จากลำโพงด้วย
+BARGE_IN_START_MS = 60
+BARGE_IN_HANGOVER_MS = 500
+BARGE_IN_PREROLL_MS = 300
+BARGE_IN_MAX_UTTERANCE_S = 8
+
+
+class BargeInDetector:
+    def __init__(self, hub, on_barge_in, on_utterance=None, aggressiveness=3,
+                 energy_threshold=BARGE_IN_ENERGY_THRESHOLD, start_ms=BARGE_IN_START_MS,
+                 hangover_ms=BARGE_IN_HANGOVER_MS, preroll_ms=BARGE_IN_PREROLL_MS,
+                 max_utterance_s=BARGE_IN_MAX_UTTERANCE_S, vad=None, on_error=None):
+        """
+        hub: MicHub ที่เปิดไมค์ไว้แล้ว
+        on_barge_in(): เรียกจาก thread ของ subscription ทันทีที่เริ่มพูด → ควรทำงานเร็ว (เช่น Event.set())
+        on_utterance(audio): เสียง int16 ช่วงที่พูดแทรก เรียกใน thread ใหม่หลังพูดจบ (None = ไม่ต้องใช้เสียง)
+        aggressiveness, energy_threshold, vad: ส่งต่อให้ VadStage
+        start_ms: ต้องเป็นเสียงพูดติดกันนานเท่านี้ถึงนับว่าพูดแทรก
+        hangover_ms: เงียบนานเท่านี้ถึงนับว่าพูดแทรกจบ
+        preroll_ms: เสียงก่อนจุดที่ VAD จับได้ที่ส่งไปด้วย (ต้นคำมักเบา)
+        on_error(e): ตรวจจับการพูดแทรกหยุดทำงานเพราะ error ซ้ำๆ (ดูได้จาก error / stats() ด้วย)
+        """
+        self.hub = hub
+        self.on_barge_in = on_barge_in
+        self.on_utterance = on_utterance
+        self.on_error = on_error
+        self.error = None
+        self.preroll_samples = int(hub.sample_rate * preroll_ms / 1000)
+        self.max_utterance_samples = int(hub.sample_rate * max_utterance_s)
+
+        self.vad = VadStage(
+            sample_rate=hub.sample_rate, aggressiveness=aggressiveness, energy_threshold=energy_threshold,
+            start_frames=max(1, start_ms // FRAME_MS), hangover_ms=hangover_ms, vad=vad,
+            on_speech_start=self._on_speech_start, on_speech_end=self._on_speech_end
+        )
+        self._subscription = None
+        self._handle_utterance = None  # on_utterance ที่ผูกกับ context (turn) ของผู้เรียก start()
+        self._utterance_start = None   # ตำแหน่ง (นับใน VadStage) ที่เริ่มพูดแทรก (None = ไม่ได้พูดอยู่)
+        self._counters = {"barge_ins": 0, "utterances": 0, "truncated": 0}
+
+    def start(self):
+        self.vad.reset()
+        self._utterance_start = None
+        self.error = None
+        self._handle_utterance = tracing.bind(self.on_utterance) if self.on_utterance is not None else None
+        self._subscription = self.hub.subscribe(self._on_audio, "barge-in", on_error=self._on_error)
+        return self
+
+    def stop(self):
+        if self._subscription is not None:
+            self._subscription.close()
+            self._subscription = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    def stats(self):
+        return {**self._counters, "error": None if self.error is None else repr(self.error), "vad": self.vad.stats()}
+
+    # ---------- thread ของ subscription ----------
+    def _on_audio(self, samples):
+        self.vad.process(samples)
+        if self._utterance_start is not None and \
+                self.vad.position - self._utterance_start >= self.max_utterance_samples:
+            self._counters["truncated"] += 1
+            self._emit(self._utterance_start + self.max_utterance_samples)
+
+    def _on_error(self, e):
+        self.error = e
+        write_log(f"❌ ตรวจจับการพูดแทรกหยุดทำงาน: {e}")
+        if self.on_error is not None:
+            self.on_error(e)
+
+    def _on_speech_start(self, position):
+        self._utterance_start = position
+        self._counters["barge_ins"] += 1
+        self.on_barge_in()
+
+    def _on_speech_end(self, position):
+        if self._utterance_start is not None:
+            self._emit(position)
+
+    def _emit(self, end):
+        start, self._utterance_start = self._utterance_start, None
+        self._counters["utterances"] += 1
+        if self._handle_utterance is None:
+            return
+        # ตำแหน่งของ VadStage นับจาก sample แรกของ subscription → แปลงเป็นตำแหน่งใน hub
+        origin = self._subscription.start_position
+        audio = self.hub.read(max(0, origin + start - self.preroll_samples), origin + end)
+        write_log(f"🎙️ เสียงพูดแทรก {len(audio) / self.hub.sample_rate:.2f} วินาที → ส่งไปแยก intent")
+        threading.Thread(target=self._handle_utterance, args=(audio,), daemon=True).start()
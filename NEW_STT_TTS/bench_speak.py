@@ -0,0 +1,460 @@
+# bench_speak.py
+# วัด latency ของ pipeline พูด (/speak) แยกตามขั้นตอน กับ mock Audio2Face server (ไม่ต้องมี Omniverse และ Azure)
+# - synthesis: Azure ถูกแทนด้วย stub ที่สร้างเสียงตามเวลา first-byte / real-time factor ที่กำหนด
+# - conversion: 24kHz → 44.1kHz ทั้งไฟล์ (convert_buffer) เทียบกับแบบ streaming (StreamConverter)
+# - ส่งเข้า A2F: คัดลอกไฟล์ + REST Player เทียบกับ gRPC streaming
+# - REST: ตั้งค่า A2E ที่ต้องส่งจริง เทียบกับค่าที่ไม่เปลี่ยน (ไม่ส่ง)
+# - end-to-end: tts_with_emotion ตั้งแต่รับข้อความจนเสียงแรกถึง A2F (playback_start) และจนพูดจบ
+#   ที่ concurrency หลายระดับ → p50/p95/p99 และ throughput
+# ผลลัพธ์เขียนเป็น JSON (--output) และเทียบกับผลครั้งก่อนได้ (--baseline) → exit code 1 ถ้า p95 ช้าลงเกิน --tolerance
+#
+#   python bench_speak.py --jobs 20 --concurrency 1 2 4 8 --output bench.json
+#   python bench_speak.py --baseline bench.json
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+import types
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+STUB_SAMPLE_RATE = 24000
+
+SHORT_TEXT = "สวัสดีค่ะ ยินดีต้อนรับ"
+LONG_TEXT = (
+    "สวัสดีค่ะ ยินดีต้อนรับสู่ศูนย์บริการของเรา วันนี้มีอะไรให้ช่วยไหมคะ "
+    "หากต้องการสอบถามเรื่องสินค้า กรุณาบอกชื่อสินค้าได้เลยค่ะ "
+    "ถ้าต้องการติดต่อเจ้าหน้าที่ กรุณารอสักครู่ ระบบกำลังโอนสายให้ค่ะ"
+)
+
+
+def install_azure_stub():
+    """ ถ้าไม่ได้ติดตั้ง Azure Speech SDK: ใส่ module แทนเท่าที่ tts_a2f_ssml / synthesizer_pool ใช้ตอน import
+        (การสังเคราะห์จริงถูกแทนด้วย StubSynthesizerPool อยู่แล้ว) """
+    try:
+        import azure.cognitiveservices.speech  # noqa: F401
+        return False
+    except ImportError:
+        pass
+
+    speechsdk = types.ModuleType("azure.cognitiveservices.speech")
+    speechsdk.SpeechSynthesisOutputFormat = types.SimpleNamespace(
+        Raw24Khz16BitMonoPcm="Raw24Khz16BitMonoPcm", Riff24Khz16BitMonoPcm="Riff24Khz16BitMonoPcm"
+    )
+    speechsdk.ResultReason = types.SimpleNamespace(
+        SynthesizingAudioCompleted="SynthesizingAudioCompleted", Canceled="Canceled"
+    )
+    speechsdk.CancellationReason = types.SimpleNamespace(Error="Error")
+    cognitiveservices = types.ModuleType("azure.cognitiveservices")
+    cognitiveservices.speech = speechsdk
+    azure_pkg = sys.modules.setdefault("azure", types.ModuleType("azure"))
+    azure_pkg.cognitiveservices = cognitiveservices
+    sys.modules["azure.cognitiveservices"] = cognitiveservices
+    sys.modules["azure.cognitiveservices.speech"] = speechsdk
+    return True
+
+
+class StubSynthesizerPool:
+    """ แทน SynthesizerPool โดยไม่เรียก Azure: สร้างเสียง 24kHz 16bit mono ยาวตามจำนวนตัวอักษร
+        first_byte_s: เวลาก่อนได้เสียงก้อนแรก, realtime_factor: สังเคราะห์เร็วกว่าเวลาจริงกี่เท่า """
+    def __init__(self, first_byte_s=0.08, realtime_factor=8.0, seconds_per_char=0.06, chunk_bytes=4800):
+        self.first_byte_s = first_byte_s
+        self.realtime_factor = realtime_factor
+        self.seconds_per_char = seconds_per_char
+        self.chunk_bytes = chunk_bytes
+        self._lock = threading.Lock()
+        self._counters = {"streams": 0, "speaks": 0}
+
+    def _pcm(self, ssml):
+        text = re.sub(r"<[^>]+>", "", ssml)
+        n = max(1, int(len(text) * self.seconds_per_char * STUB_SAMPLE_RATE))
+        t = np.arange(n) / STUB_SAMPLE_RATE
+        return (np.sin(2 * np.pi * 220 * t) * 8000).astype(np.int16).tobytes()
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def warmup(self, keys, per_key=1, timeout=5.0):
+        return [0.0 for _ in keys for _ in range(per_key)]
+
+    def speak(self, ssml_or_text, voice=None, output_format=None, is_ssml=True):
+        from tts_a2f_ssml import speechsdk, write_wav
+        pcm = self._pcm(ssml_or_text)
+        time.sleep(self.first_byte_s + len(pcm) / 2 / STUB_SAMPLE_RATE / self.realtime_factor)
+        wav = io.BytesIO()
+        write_wav(wav, np.frombuffer(pcm, dtype=np.int16), STUB_SAMPLE_RATE)
+        self._count("speaks")
+        return types.SimpleNamespace(reason=speechsdk.ResultReason.SynthesizingAudioCompleted, audio_data=wav.getvalue())
+
+    def stream(self, ssml, voice=None, output_format=None, timeout=30):
+        pcm = self._pcm(ssml)
+        time.sleep(self.first_byte_s)
+        for i in range(0, len(pcm), self.chunk_bytes):
+            chunk = pcm[i:i + self.chunk_bytes]
+            if i:
+                time.sleep(len(chunk) / 2 / STUB_SAMPLE_RATE / self.realtime_factor)
+            yield chunk
+        self._count("streams")
+        return True
+
+    def stats(self):
+        with self._lock:
+            return {"stub": True, **self._counters}
+
+
+# ---------------- สถิติ ----------------
+def percentile(sorted_values, q):
+    """ nearest-rank percentile ของ list ที่เรียงแล้ว """
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(q / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(seconds):
+    """ สรุปเวลา (วินาที) เป็น ms """
+    v = sorted(1000 * s for s in seconds)
+    if not v:
+        return {"count": 0}
+    return {
+        "count": len(v),
+        "mean": sum(v) / len(v),
+        "p50": percentile(v, 50),
+        "p95": percentile(v, 95),
+        "p99": percentile(v, 99),
+        "max": v[-1],
+    }
+
+
+class StageTimer:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = defaultdict(list)
+        self.failures = defaultdict(int)
+
+    def add(self, stage, seconds):
+        with self._lock:
+            self.samples[stage].append(seconds)
+
+    def fail(self, stage):
+        with self._lock:
+            self.failures[stage] += 1
+
+    @contextlib.contextmanager
+    def time(self, stage):
+        start = time.perf_counter()
+        yield
+        self.add(stage, time.perf_counter() - start)
+
+    def summary(self):
+        with self._lock:
+            stages = {stage: summarize(self.samples[stage]) for stage in list(self.samples) + list(self.failures)}
+            for stage, count in self.failures.items():
+                stages[stage]["failures"] = count
+            return stages
+
+
+# ---------------- เวลาเสียงแรกถึง A2F ----------------
+class _Job:
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.playback_start = None
+
+    def mark_playback_start(self):
+        if self.playback_start is None:
+            self.playback_start = time.perf_counter() - self.started_at
+
+
+_current = threading.local()  # งานที่ thread นี้กำลังรัน
+
+
+def instrument_playback_start(tts):
+    """ จับเวลาที่เสียงแรกถูกส่งเข้า A2F: ก้อนแรกที่ gRPC ดึงจาก generator หรือเมื่อ Player/Play ตอบกลับ """
+    a2f = tts.get_a2f()
+    stream_audio = a2f.stream_audio
+    copy_and_send_to_a2f = tts.copy_and_send_to_a2f
+
+    def first_chunk_marked(audio_stream, job):
+        # gRPC ดึง generator ใน thread ของตัวเอง → ส่ง job เข้ามาตรงๆ
+        for chunk in audio_stream:
+            if job is not None:
+                job.mark_playback_start()
+            yield chunk
+
+    def timed_stream_audio(audio_stream, *args, **kwargs):
+        job = getattr(_current, "job", None)
+        return stream_audio(first_chunk_marked(audio_stream, job), *args, **kwargs)
+
+    def timed_copy_and_send_to_a2f(filepath):
+        copy_and_send_to_a2f(filepath)
+        job = getattr(_current, "job", None)
+        if job is not None:
+            job.mark_playback_start()
+
+    a2f.stream_audio = timed_stream_audio
+    tts.copy_and_send_to_a2f = timed_copy_and_send_to_a2f
+
+
+def run_job(handler, *args):
+    """ รัน handler หนึ่งงาน: คืนค่า (เวลาทั้งหมด, เวลาถึงเสียงแรก, สำเร็จไหม) """
+    job = _current.job = _Job()
+    try:
+        result = handler(*args)
+        ok = result is not False
+    except Exception:
+        ok = False
+    finally:
+        _current.job = None
+    return time.perf_counter() - job.started_at, job.playback_start, ok
+
+
+# ---------------- benchmark ----------------
+def setup_pipeline(server, tmp_dir, synth_pool, verbose=False):
+    """ ชี้ tts_a2f_ssml ไปที่ mock server, stub synthesizer และไฟล์ชั่วคราว """
+    install_azure_stub()
+    import tts_a2f_ssml as tts
+    from log_writer import configure_log
+    from phrase_cache import PhraseCache
+    from py_audio2face import Audio2Face
+
+    configure_log(os.path.join(tmp_dir, "log.txt"), echo=verbose)
+
+    tts.A2F_API_URL = server.api_url
+    tts.A2F_GRPC_PORT = server.grpc_port
+    tts.A2F_AUDIO_DIR = os.path.join(tmp_dir, "a2f_audio")
+    tts.CONVERTED_WAV_PATH = os.path.join(tmp_dir, "autoplay_converted.wav")
+    tts._synth_pool = synth_pool
+    tts._phrase_cache = PhraseCache(os.path.join(tmp_dir, "phrase_cache"), samplerate=tts.A2F_SAMPLE_RATE)
+    tts._a2f = Audio2Face(api_url=server.api_url, a2f_install_path=tmp_dir)
+
+    a2f = tts.get_a2f()
+    a2f.init_a2f(streaming=True)
+    a2f.post("A2F/Player/SetRootPath", {"a2f_player": tts.A2F_PLAYER_PATH, "dir_path": tts.A2F_AUDIO_DIR})
+    instrument_playback_start(tts)
+    return tts
+
+
+def bench_stages(tts, timer, repeat, text=SHORT_TEXT):
+    """ แต่ละขั้นตอนแยกกัน ทีละครั้ง (ไม่มีงานอื่นแย่ง) """
+    ssml = tts.build_ssml(text)
+    a2f = tts.get_a2f()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        chunks = []
+        for chunk in tts.synthesize_pcm_stream(ssml):
+            if not chunks:
+                timer.add("synthesis_first_chunk", time.perf_counter() - start)
+            chunks.append(chunk)
+        timer.add("synthesis", time.perf_counter() - start)
+        pcm = np.frombuffer(b"".join(chunks), dtype=np.int16)
+
+        wav = io.BytesIO()
+        tts.write_wav(wav, pcm, tts.STREAM_SAMPLE_RATE)
+        with timer.time("conversion_file"):
+            audio, rate = tts.read_wav(io.BytesIO(wav.getvalue()))
+            converted = tts.convert_buffer(audio, rate, tts.A2F_SAMPLE_RATE)
+            tts.write_wav(tts.CONVERTED_WAV_PATH, converted, tts.A2F_SAMPLE_RATE)
+        with timer.time("conversion_stream"):
+            converter = tts.StreamConverter(tts.STREAM_SAMPLE_RATE, tts.A2F_SAMPLE_RATE)
+            for chunk in chunks:
+                converter.process(np.frombuffer(chunk, dtype=np.int16))
+            converter.flush()
+
+        a2f.a2f_state.invalidate()
+        with timer.time("a2f_rest_setters"):
+            tts.enable_emotion_streaming()
+            tts.enable_auto_generate_emotion()
+        with timer.time("a2f_rest_setters_unchanged"):
+            tts.enable_emotion_streaming()
+            tts.enable_auto_generate_emotion()
+
+        with timer.time("send_file_copy"):
+            tts.copy_and_send_to_a2f(tts.CONVERTED_WAV_PATH)
+        with timer.time("send_grpc_stream"):
+            a2f.stream_audio(
+                [converted], samplerate=tts.A2F_SAMPLE_RATE, grpc_port=tts.A2F_GRPC_PORT,
+                block_until_playback_is_finished=False
+            )
+
+
+def bench_speak(tts, timer, repeat):
+    """ end-to-end ทีละงาน: ไฟล์ / streaming / pipeline (ข้อความยาว) / phrase cache """
+    runs = [
+        ("speak_file", False, SHORT_TEXT, True),
+        ("speak_streaming", True, SHORT_TEXT, True),
+        ("speak_pipelined", True, LONG_TEXT, True),
+        ("speak_cached", True, SHORT_TEXT, False),
+    ]
+    for name, stream_to_a2f, text, unique in runs:
+        tts.STREAM_TO_A2F = stream_to_a2f
+        if not unique:
+            tts.tts_with_emotion(text)  # เก็บลง cache ก่อน
+        for i in range(repeat):
+            # ขึ้นต้นข้อความไม่ซ้ำกัน → ไม่โดน phrase cache แม้แต่ช่วงแรกของ pipeline (ยกเว้น speak_cached)
+            total, playback_start, ok = run_job(tts.tts_with_emotion, f"{i} {name} {text}" if unique else text)
+            if not ok:
+                timer.fail(name)
+                continue
+            timer.add(name, total)
+            if playback_start is not None:
+                timer.add(f"{name}.playback_start", playback_start)
+    tts.STREAM_TO_A2F = True
+
+
+def bench_concurrency(tts, server, jobs, concurrency):
+    """ งาน streaming พร้อมกัน concurrency งาน: latency, เวลาถึงเสียงแรก และ throughput """
+    texts = [f"{SHORT_TEXT} c{concurrency} {i}" for i in range(jobs)]
+    audio_before = server.stats()["streaming"]["audio_s"]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda text: run_job(tts.tts_with_emotion, text), texts))
+    wall = time.perf_counter() - start
+    audio_s = server.stats()["streaming"]["audio_s"] - audio_before
+
+    return {
+        "concurrency": concurrency,
+        "jobs": jobs,
+        "failures": sum(1 for _, _, ok in results if not ok),
+        "wall_s": wall,
+        "jobs_per_s": jobs / wall,
+        "audio_s_per_s": audio_s / wall,
+        "latency": summarize([total for total, _, _ in results]),
+        "playback_start": summarize([p for _, p, _ in results if p is not None]),
+    }
+
+
+def run_benchmark(
+        jobs=20,
+        concurrency=(1, 2, 4, 8),
+        repeat=10,
+        synth_first_byte_ms=80,
+        synth_realtime_factor=8.0,
+        rest_latency_ms=2,
+        playback_speed=20.0,
+        verbose=False
+):
+    """ รัน benchmark ทั้งหมดกับ mock server ใหม่ แล้วคืนค่าผลเป็น dict (เขียนเป็น JSON ได้) """
+    from log_writer import close_log
+    from py_audio2face.mock_server import MockAudio2FaceServer
+
+    config = {
+        "jobs": jobs, "concurrency": list(concurrency), "repeat": repeat,
+        "synth_first_byte_ms": synth_first_byte_ms, "synth_realtime_factor": synth_realtime_factor,
+        "rest_latency_ms": rest_latency_ms, "playback_speed": playback_speed,
+    }
+    timer = StageTimer()
+    server = MockAudio2FaceServer(latency=rest_latency_ms / 1000, playback_speed=playback_speed, seed=0).start()
+    synth_pool = StubSynthesizerPool(first_byte_s=synth_first_byte_ms / 1000, realtime_factor=synth_realtime_factor)
+    quiet = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir, quiet:
+            tts = setup_pipeline(server, tmp_dir, synth_pool, verbose)
+            bench_stages(tts, timer, repeat)
+            bench_speak(tts, timer, repeat)
+            levels = [bench_concurrency(tts, server, jobs, c) for c in concurrency]
+            tts.get_a2f().close_streaming_sessions()
+            close_log()
+    finally:
+        server.stop()
+
+    return {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": config,
+        "stages": timer.summary(),
+        "concurrency": levels,
+        "synth_pool": synth_pool.stats(),
+        "mock": server.stats(),
+    }
+
+
+def compare_with_baseline(results, baseline, tolerance=0.25, min_delta_ms=2.0):
+    """ คืนค่ารายการขั้นตอนที่ p95 ช้าลงเกิน tolerance (สัดส่วน) และเกิน min_delta_ms """
+    def regressed(name, new, old):
+        if not new.get("count") or not old.get("count"):
+            return None
+        if new["p95"] > old["p95"] * (1 + tolerance) and new["p95"] - old["p95"] > min_delta_ms:
+            return f"{name}: p95 {old['p95']:.1f} → {new['p95']:.1f} ms"
+        return None
+
+    found = []
+    for stage, summary in results["stages"].items():
+        if stage in baseline.get("stages", {}):
+            found.append(regressed(stage, summary, baseline["stages"][stage]))
+
+    old_levels = {level["concurrency"]: level for level in baseline.get("concurrency", [])}
+    for level in results["concurrency"]:
+        old = old_levels.get(level["concurrency"])
+        if old is None:
+            continue
+        for metric in ("latency", "playback_start"):
+            found.append(regressed(f"concurrency {level['concurrency']} {metric}", level[metric], old[metric]))
+    return [f for f in found if f]
+
+
+def print_report(results):
+    print(f"\n{'stage':<36}{'n':>5}{'p50':>10}{'p95':>10}{'p99':>10}  (ms)")
+    for stage, s in results["stages"].items():
+        if s["count"]:
+            print(f"{stage:<36}{s['count']:>5}{s['p50']:>10.1f}{s['p95']:>10.1f}{s['p99']:>10.1f}")
+
+    print(f"\n{'concurrency':>11}{'jobs/s':>9}{'audio s/s':>11}{'fail':>6}"
+          f"{'latency p50/p95/p99':>28}{'first audio p50/p95/p99':>30}")
+    for level in results["concurrency"]:
+        lat, first = level["latency"], level["playback_start"]
+        lat_text = f"{lat['p50']:.0f}/{lat['p95']:.0f}/{lat['p99']:.0f}" if lat["count"] else "-"
+        first_text = f"{first['p50']:.0f}/{first['p95']:.0f}/{first['p99']:.0f}" if first["count"] else "-"
+        print(f"{level['concurrency']:>11}{level['jobs_per_s']:>9.2f}{level['audio_s_per_s']:>11.2f}"
+              f"{level['failures']:>6}{lat_text:>28}{first_text:>30}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="latency benchmark ของ pipeline พูด กับ mock Audio2Face server")
+    parser.add_argument("--jobs", type=int, default=20, help="จำนวนงานต่อระดับ concurrency")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--repeat", type=int, default=10, help="จำนวนรอบของการวัดแต่ละขั้นตอน")
+    parser.add_argument("--synth-first-byte-ms", type=float, default=80)
+    parser.add_argument("--synth-rtf", type=float, default=8.0, help="stub สังเคราะห์เร็วกว่าเวลาจริงกี่เท่า")
+    parser.add_argument("--rest-latency-ms", type=float, default=2)
+    parser.add_argument("--playback-speed", type=float, default=20.0, help="mock เล่นเสียงเร็วกว่าเวลาจริงกี่เท่า")
+    parser.add_argument("--output", help="เขียนผลเป็น JSON")
+    parser.add_argument("--baseline", help="JSON จากครั้งก่อน สำหรับตรวจว่าช้าลงไหม")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="p95 ช้าลงได้ไม่เกินสัดส่วนนี้")
+    parser.add_argument("--verbose", action="store_true", help="แสดง log ของ pipeline")
+    args = parser.parse_args()
+
+    results = run_benchmark(
+        jobs=args.jobs, concurrency=args.concurrency, repeat=args.repeat,
+        synth_first_byte_ms=args.synth_first_byte_ms, synth_realtime_factor=args.synth_rtf,
+        rest_latency_ms=args.rest_latency_ms, playback_speed=args.playback_speed, verbose=args.verbose
+    )
+    print_report(results)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+        print(f"\n💾 เขียนผลลัพธ์: {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare_with_baseline(results, baseline, tolerance=args.tolerance)
+        if regressions:
+            print("\n❌ ช้าลงกว่า baseline:")
+            for r in regressions:
+                print("   ", r)
+            sys.exit(1)
+        print("\n✅ ไม่ช้าลงกว่า baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+# echo_canceller.py
+# ตัดเสียง avatar ที่ลำโพงรั่วเข้าไมค์ (acoustic echo) ก่อนถึง VAD/STT โดยใช้ PCM ที่ส่งให้ลำโพงจริงเป็น reference
+# - push_reference(chunk): เรียกพร้อมกับ stream.write(chunk) → เก็บลง ring buffer ตามเส้นเวลาเดียวกับไมค์ (ตำแหน่งของ hub)
+# - หา delay ระหว่างลำโพง → ไมค์ด้วย cross-correlation ผ่าน FFT (ทุก lag พร้อมกัน) แล้วหา gain แบบ least squares
+# - ต่อ frame 30ms (คำนวณทั้งชุดที่ได้จาก hub พร้อมกัน): ลบ gain × reference ที่เลื่อนตาม delay ออกจากเสียงไมค์
+#   ถ้าที่เหลือยังเป็นแค่เศษ echo (พลังงานต่ำกว่า gate_ratio × echo) → ปิดเสียงทั้ง frame, ถ้ามีคนพูดทับ → ส่งเสียงที่ลบแล้ว
+# - ผลลัพธ์อยู่ใน output (MicHub ที่ไม่ผูกกับอุปกรณ์) → subscribe / read / azure_audio_config ได้เหมือน hub ปกติ
+import threading
+
+import numpy as np
+
+from mic_hub import BUFFER_S, MicHub, RingBuffer, get_mic_hub
+
+FRAME_MS = 30
+ECHO_MAX_DELAY_MS = 400    # latency ของ output + ระยะลำโพงถึงไมค์ที่ค้นหา
+ECHO_WINDOW_MS = 500       # ความยาวเสียงที่ใช้หา delay แต่ละครั้ง
+ECHO_UPDATE_MS = 250       # หา delay ใหม่ทุกเท่านี้ (เฉพาะตอนที่ลำโพงมีเสียง)
+ECHO_MIN_COHERENCE = 0.3   # correlation ต่ำกว่านี้ = ไม่เชื่อ delay ที่หาได้ (เช่น มีคนพูดทับทั้งช่วง)
+ECHO_GATE_RATIO = 0.5      # ลบแล้วเหลือพลังงาน < ratio × echo → ถือว่าเป็น echo ล้วน ปิดเสียง
+REFERENCE_FLOOR = 100      # RMS ของ reference ที่ต่ำกว่านี้ = ลำโพงเงียบ ไม่ต้องทำอะไร
+
+
+class EchoCanceller:
+    def __init__(self, hub, max_delay_ms=ECHO_MAX_DELAY_MS, window_ms=ECHO_WINDOW_MS, update_ms=ECHO_UPDATE_MS,
+                 min_coherence=ECHO_MIN_COHERENCE, gate_ratio=ECHO_GATE_RATIO, reference_floor=REFERENCE_FLOOR,
+                 buffer_s=BUFFER_S):
+        """
+        hub: MicHub ของไมค์จริง
+        max_delay_ms: delay สูงสุดที่ค้นหา
+        window_ms, update_ms, min_coherence: การหา delay (ดูค่าคงที่ด้านบน)
+        gate_ratio: เกณฑ์ปิดเสียง frame ที่เหลือแต่ echo (0 = ลบอย่างเดียว ไม่ปิดเสียง)
+        reference_floor: RMS ของ reference ที่ถือว่าลำโพงเงียบ
+        """
+        self.hub = hub
+        self.sample_rate = hub.sample_rate
+        self.frame_samples = int(self.sample_rate * FRAME_MS / 1000)
+        self.max_delay = int(self.sample_rate * max_delay_ms / 1000)
+        self.window = int(self.sample_rate * window_ms / 1000)
+        self.update_interval = int(self.sample_rate * update_ms / 1000)
+        self.min_coherence = min_coherence
+        self.gate_ratio = gate_ratio
+        self._reference_floor = reference_floor ** 2 * self.frame_samples
+
+        self.reference = RingBuffer(int(self.sample_rate * buffer_s))
+        self.output = MicHub(sample_rate=self.sample_rate, buffer_s=buffer_s)  # เสียงที่ตัด echo แล้ว
+
+        self.delay = None          # delay ล่าสุด (sample), None = ยังหาไม่ได้
+        self.gain = 0.0
+        self._reference_lock = threading.Lock()
+        self._subscription = None
+        self._next_update = 0
+        self._counters = {"frames": 0, "echo_frames": 0, "gated": 0, "delay_updates": 0,
+                          "echo_energy": 0.0, "residual_energy": 0.0}
+
+    def start(self):
+        """ เริ่มตัด echo จากเสียงของ hub, คืนค่า output (hub ของเสียงที่ตัดแล้ว) """
+        if self._subscription is None:
+            self._subscription = self.hub.subscribe(self._on_audio, "echo-canceller")
+        return self.output
+
+    def stop(self):
+        if self._subscription is not None:
+            self._subscription.close()
+            self._subscription = None
+
+    # ---------- ฝั่งลำโพง ----------
+    def push_reference(self, samples):
+        """ PCM int16 (sample rate เดียวกับไมค์) ที่กำลังจะเขียนลงลำโพง
+            เสียงที่เขียนต่อเนื่องกันวางต่อกัน, ถ้าลำโพงเงียบไประยะหนึ่งจะเริ่มใหม่ที่ตำแหน่งปัจจุบันของไมค์ """
+        with self._reference_lock:
+            self.reference.skip_to(self.hub.position)
+            self.reference.write(samples)
+
+    # ---------- ฝั่งไมค์ (thread ของ subscription) ----------
+    def _reference_at(self, start, n):
+        """ reference ช่วง [start, start+n) ตามตำแหน่งของไมค์ ส่วนที่ไม่มีข้อมูลเป็น 0 """
+        out = np.zeros(n, dtype=np.float32)
+        if start + n <= 0:
+            return out
+        offset = max(0, -start)
+        data, _, lost = self.reference.read(start + offset, start + n)
+        out[offset + lost:offset + lost + len(data)] = data
+        return out
+
+    def _on_audio(self, samples):
+        subscription = self._subscription
+        if subscription is None:  # ยังไม่ได้ subscription กลับมาจาก start()
+            self.output.feed(samples)
+            return
+        end = subscription.position       # เสียงชุดนี้คือ [end - n, end) ของ hub
+        n = len(samples)
+        bounds = np.arange(0, n, self.frame_samples)
+        self._counters["frames"] += len(bounds)
+
+        if end >= self._next_update:
+            self._update_delay(end)
+        if self.delay is None or self.gain <= 0:
+            self.output.feed(samples)
+            return
+
+        echo = self._reference_at(end - n - self.delay, n)
+        echo *= self.gain
+        # พลังงานต่อ frame 30ms ของทั้งชุดในครั้งเดียว
+        echo_energy = np.add.reduceat(echo * echo, bounds)
+        active = echo_energy >= self._reference_floor * self.gain ** 2
+        if not active.any():
+            self.output.feed(samples)  # ลำโพงเงียบ → ไม่มี echo ให้ตัด
+            return
+
+        residual = samples.astype(np.float32)
+        residual -= echo
+        residual_energy = np.add.reduceat(residual * residual, bounds)
+        gated = active & (residual_energy < self.gate_ratio * echo_energy)
+
+        lengths = np.diff(np.append(bounds, n))
+        out = np.clip(residual, -32768, 32767).astype(np.int16)
+        passthrough = np.repeat(~active, lengths)
+        out[passthrough] = samples[passthrough]
+        out[np.repeat(gated, lengths)] = 0
+
+        self._counters["echo_frames"] += int(active.sum())
+        self._counters["gated"] += int(gated.sum())
+        self._counters["echo_energy"] += float(echo_energy[gated].sum())
+        self._counters["residual_energy"] += float(residual_energy[gated].sum())
+        self.output.feed(out)
+
+    def _update_delay(self, end):
+        """ หา lag ที่ reference ตรงกับเสียงไมค์ช่วง [end - window, end) มากที่สุด """
+        self._next_update = end + self.update_interval
+        reference = self._reference_at(end - self.window - self.max_delay, self.window + self.max_delay)
+        if float(np.dot(reference[self.max_delay:], reference[self.max_delay:])) < \
+                self._reference_floor * self.window / self.frame_samples:
+            return  # ลำโพงเงียบในช่วงนี้
+        mic = self.hub.read(end - self.window, end).astype(np.float32)
+        if len(mic) < self.window:
+            return
+
+        # corr[k] = Σ mic[i]·reference[i + k]  สำหรับ k = 0..max_delay (lag = max_delay - k) ในการคำนวณเดียว
+        nfft = 1 << int(np.ceil(np.log2(len(reference) + self.window)))
+        corr = np.fft.irfft(np.fft.rfft(reference, nfft) * np.conj(np.fft.rfft(mic, nfft)), nfft)[:self.max_delay + 1]
+        # พลังงานของ reference ในแต่ละหน้าต่างที่เลื่อน (cumsum แทนการวนลูป)
+        squares = np.concatenate(([0.0], np.cumsum(reference.astype(np.float64) ** 2)))
+        reference_energy = squares[self.window:self.window + self.max_delay + 1] - squares[:self.max_delay + 1]
+        mic_energy = float(np.dot(mic, mic))
+        # lag ที่ reference เกือบเงียบทั้งหน้าต่างไม่นับ (หารด้วยค่าเกือบ 0 ให้ค่าสูงปลอม)
+        audible = reference_energy > self._reference_floor
+        coherence = np.where(audible, corr / np.sqrt(np.maximum(reference_energy * mic_energy, 1e-9)), 0.0)
+
+        k = int(np.argmax(coherence))
+        if coherence[k] < self.min_coherence or reference_energy[k] <= 0:
+            return
+        self.delay = self.max_delay - k
+        gain = float(corr[k] / reference_energy[k])   # least squares: mic ≈ gain × reference ที่เลื่อนแล้ว
+        self.gain = gain if self.gain <= 0 else 0.7 * self.gain + 0.3 * gain
+        self._counters["delay_updates"] += 1
+
+    def stats(self):
+        counters = dict(self._counters)
+        echo_energy = counters.pop("echo_energy")
+        residual_energy = counters.pop("residual_energy")
+        erle_db = 10 * np.log10(echo_energy / residual_energy) if residual_energy > 0 else None
+        return {
+            **counters,
+            "delay_ms": None if self.delay is None else 1000 * self.delay / self.sample_rate,
+            "gain": self.gain,
+            "erle_db": erle_db,   # echo ลดลงเท่าไหร่จากการลบ (วัดเฉพาะ frame ที่มีแต่ echo ก่อนปิดเสียง)
+        }
+
+
+# ---------- ตัวตัด echo ที่ใช้ร่วมกันทั้งโปรแกรม ----------
+_canceller = None
+_canceller_lock = threading.Lock()
+
+
+def get_echo_canceller():
+    """ EchoCanceller บน mic hub กลาง (เริ่มครั้งแรกที่เรียก), ใช้ .output แทน hub สำหรับ VAD/STT """
+    global _canceller
+    with _canceller_lock:
+        if _canceller is None:
+            _canceller = EchoCanceller(get_mic_hub())
+            _canceller.start()
+        return _canceller
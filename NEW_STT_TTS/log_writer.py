@@ -0,0 +1,237 @@
+# log_writer.py
+# Log ลงไฟล์แบบไม่ block: write_log() แค่ใส่ข้อความลงคิว แล้ว thread พื้นหลังเป็นคนเขียน/print
+# - เรียกจาก callback ของ Azure SDK หรือ thread เสียงได้ โดยไม่ต้องรอ disk
+# - คิวจำกัดขนาด: ถ้าเต็ม (disk ช้ามาก) → ทิ้งข้อความใหม่และนับจำนวนไว้ ไม่ block ผู้เรียก
+# - เขียนเป็นชุด: ข้อความที่รออยู่ทั้งหมดถูกเขียนแล้ว flush ครั้งเดียว
+# - หมุนไฟล์ตามขนาด (max_bytes) และตามเวลา (rotate_interval_s): log.txt → log.txt.1 → log.txt.2 ...
+# - ใช้ร่วมกัน: mic_to_text, tts_a2f_ssml, FastAPI/Flask service (LogWriterHandler สำหรับ logging ของ uvicorn)
+import atexit
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+
+from py_audio2face import tracing
+
+LOG_FILE = "log.txt"
+LOG_MAX_BYTES = 10 * 1024 * 1024
+LOG_BACKUP_COUNT = 5
+LOG_ROTATE_INTERVAL_S = 24 * 3600
+LOG_QUEUE_SIZE = 10000
+LOG_BATCH_SIZE = 500
+
+
+class BufferedLogWriter:
+    def __init__(self, path=LOG_FILE, max_bytes=LOG_MAX_BYTES, backup_count=LOG_BACKUP_COUNT,
+                 rotate_interval_s=LOG_ROTATE_INTERVAL_S, queue_size=LOG_QUEUE_SIZE, batch_size=LOG_BATCH_SIZE,
+                 echo=True):
+        """
+        path: ไฟล์ log
+        max_bytes: หมุนไฟล์เมื่อใหญ่เกินนี้ (0 = ไม่หมุนตามขนาด)
+        backup_count: จำนวนไฟล์เก่าที่เก็บไว้ (log.txt.1 ... log.txt.N)
+        rotate_interval_s: หมุนไฟล์เมื่อเปิดไฟล์นี้มานานเกินนี้ (0 = ไม่หมุนตามเวลา)
+        queue_size: จำนวนข้อความที่รอเขียนได้สูงสุด
+        batch_size: จำนวนข้อความสูงสุดต่อการเขียนหนึ่งครั้ง
+        echo: print ข้อความออกจอด้วย (จาก thread พื้นหลัง), ปิดรายข้อความได้ด้วย write(..., echo=False)
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.rotate_interval_s = rotate_interval_s
+        self.batch_size = batch_size
+        self.echo = echo
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._file = None
+        self._opened_at = None
+        self._closed = False
+        self._counters = {"written": 0, "dropped": 0, "batches": 0, "rotations": 0, "errors": 0}
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._thread.start()
+
+    # ---------- ผู้เรียก (ไม่ block) ----------
+    def write(self, message, timestamp=None, echo=True):
+        """ ใส่ข้อความลงคิว, คืนค่า False ถ้าคิวเต็มแล้วข้อความถูกทิ้ง
+            timestamp: ถ้าระบุ (time.time()) บรรทัดในไฟล์จะขึ้นต้นด้วย [เวลา] ส่วนบนจอแสดงแค่ข้อความ
+            echo: False → ลงไฟล์อย่างเดียว (เช่น log ของ uvicorn ที่แสดงบนจออยู่แล้ว) """
+        if self._closed:
+            return False
+        try:
+            self._queue.put_nowait((timestamp, message, echo))
+            return True
+        except queue.Full:
+            self._counters["dropped"] += 1
+            return False
+
+    def flush(self, timeout=5.0):
+        """ รอจนข้อความที่เข้าคิวก่อนหน้านี้ถูกเขียนลงไฟล์ """
+        if self._closed:
+            return True
+        done = threading.Event()
+        try:
+            self._queue.put(done, timeout=timeout)
+        except queue.Full:
+            return False
+        return done.wait(timeout)
+
+    def close(self, timeout=5.0):
+        if self._closed:
+            return
+        self.flush(timeout)
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    def stats(self):
+        return {**self._counters, "queued": self._queue.qsize(), "path": self.path}
+
+    # ---------- thread พื้นหลัง ----------
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            batch, markers = [], []
+            while True:
+                if item is None:
+                    self._write_batch(batch)
+                    self._close_file()
+                    for m in markers:
+                        m.set()
+                    return
+                if isinstance(item, threading.Event):
+                    markers.append(item)  # flush(): ตั้งค่าหลังเขียนทุกอย่างที่มาก่อนหน้า
+                else:
+                    batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+
+            self._write_batch(batch)
+            for m in markers:
+                m.set()
+
+    def _write_batch(self, batch):
+        if not batch:
+            return
+        if self.echo:
+            try:
+                sys.stdout.write("".join(message + "\n" for _, message, echo in batch if echo))
+                sys.stdout.flush()
+            except Exception:
+                pass
+        text = "".join(
+            (f"[{time.ctime(timestamp)}] {message}\n" if timestamp is not None else message + "\n")
+            for timestamp, message, _ in batch
+        )
+        try:
+            if self._should_rotate(len(text.encode("utf-8"))):
+                self._rotate()
+            if self._file is None:
+                self._open()
+            self._file.write(text)
+            self._file.flush()
+            self._counters["written"] += len(batch)
+            self._counters["batches"] += 1
+        except Exception as e:
+            self._counters["errors"] += 1
+            if self._counters["errors"] == 1:
+                print(f"❌ เขียน log ไม่สำเร็จ ({self.path}): {e}")
+            self._close_file()
+
+    # ---------- ไฟล์ ----------
+    def _open(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        self._file = open(self.path, "a", encoding="utf-8")
+        self._opened_at = time.time()
+
+    def _close_file(self):
+        if self._file is not None:
+            try:
+                self._file.close()
+            finally:
+                self._file = None
+
+    def _should_rotate(self, pending_bytes):
+        # หมุนก่อนเขียนถ้าชุดนี้จะทำให้ไฟล์เกิน max_bytes (ไฟล์ว่างไม่หมุน แม้ชุดเดียวจะใหญ่กว่า max_bytes)
+        if self.max_bytes and os.path.exists(self.path):
+            size = os.path.getsize(self.path)
+            if size > 0 and size + pending_bytes > self.max_bytes:
+                return True
+        if self.rotate_interval_s and self._file is not None:
+            return time.time() - self._opened_at >= self.rotate_interval_s
+        return False
+
+    def _rotate(self):
+        self._close_file()
+        if self.backup_count > 0:
+            for i in range(self.backup_count - 1, 0, -1):
+                src = f"{self.path}.{i}"
+                if os.path.exists(src):
+                    os.replace(src, f"{self.path}.{i + 1}")
+            if os.path.exists(self.path):
+                os.replace(self.path, f"{self.path}.1")
+        elif os.path.exists(self.path):
+            os.remove(self.path)
+        self._counters["rotations"] += 1
+
+
+class LogWriterHandler(logging.Handler):
+    """ ส่ง log ของ logging (เช่น uvicorn, fastapi) เข้า BufferedLogWriter ตัวเดียวกัน """
+    def __init__(self, writer=None, level=logging.INFO):
+        super().__init__(level)
+        self.writer = writer
+        self.setFormatter(logging.Formatter("%(name)s %(levelname)s: %(message)s"))
+
+    def emit(self, record):
+        try:
+            (self.writer or get_log_writer()).write(self.format(record), record.created, echo=False)
+        except Exception:
+            self.handleError(record)
+
+
+# ---------- writer ที่ใช้ร่วมกันทั้งโปรแกรม ----------
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def configure_log(path=LOG_FILE, **kwargs):
+    """ ตั้งค่า writer กลาง (ปิดตัวเดิมถ้ามี), kwargs ดู BufferedLogWriter """
+    global _writer
+    with _writer_lock:
+        old, _writer = _writer, BufferedLogWriter(path, **kwargs)
+    if old is not None:
+        old.close()
+    return _writer
+
+
+def get_log_writer():
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = BufferedLogWriter(LOG_FILE)
+    return _writer
+
+
+def write_log(*parts):
+    """ เหมือน print(*parts) แต่ลงไฟล์ log ด้วย โดยไม่ block ผู้เรียก """
+    message = " ".join(str(p) for p in parts)
+    turn_id = tracing.current_turn_id()   # ถ้าอยู่ในรอบสนทนา → ใส่ correlation id ไว้หน้าข้อความ
+    if turn_id:
+        message = f"[{turn_id[:8]}] {message}"
+    get_log_writer().write(message, time.time())
+
+
+@atexit.register
+def close_log():
+    """ เขียนข้อความที่ค้างในคิวให้หมดแล้วปิดไฟล์ (write_log ครั้งต่อไปจะเปิด writer ใหม่ที่ LOG_FILE) """
+    global _writer
+    with _writer_lock:
+        old, _writer = _writer, None
+    if old is not None:
+        old.close()
@@ -0,0 +1,336 @@
+# mic_hub.py
+# เปิดไมค์ครั้งเดียว (sd.InputStream ตัวเดียวตลอดอายุโปรแกรม) แล้วแจกเสียงให้หลายผู้ใช้พร้อมกัน
+# - callback ของไมค์แค่คัดลอกเสียงลง ring buffer แล้วขยับตำแหน่งเขียน → ไม่มี lock, ไม่รอผู้ใช้คนไหน
+# - ผู้ใช้แต่ละราย (subscription) มี thread และ cursor ของตัวเอง: VAD, Azure PushAudioInputStream (STT), ตัวบันทึกไฟล์
+# - ผู้ใช้ที่ช้าเกินจน ring buffer วนทับ → ข้ามเสียงที่หายไปและนับไว้ใน stats() ไม่ทำให้คนอื่นช้าตาม
+# - เริ่ม/หยุด subscription ได้โดยไม่ต้องเปิด/ปิดอุปกรณ์ และย้อนหลังได้ (preroll_ms) → ไม่มีช่องว่างระหว่าง barge-in กับ STT
+# - callback ที่ error ติดกันหลายครั้งถูกปิดและแจ้ง on_error(e) ให้เจ้าของรู้ แทนที่จะเงียบหายไป
+import atexit
+import threading
+import wave
+
+import numpy as np
+
+from log_writer import write_log
+
+try:
+    import sounddevice as sd
+    sounddevice_installed = True
+except ImportError:
+    sounddevice_installed = False
+
+SAMPLE_RATE = 16000   # รูปแบบเดียวกับที่ Azure STT และ webrtcvad ใช้: mono int16 16kHz
+BLOCK_MS = 30         # ขนาด block ของไมค์ (= ขนาด frame ของ webrtcvad)
+BUFFER_S = 10         # ความยาวเสียงที่ ring buffer เก็บย้อนหลังได้
+POLL_INTERVAL_S = 0.1
+MAX_CONSECUTIVE_ERRORS = 20   # callback error ติดกันเท่านี้ → ปิด subscription แล้วเรียก on_error
+ERROR_LOG_EVERY = 100         # หลัง error ครั้งแรก log ซ้ำทุกๆ เท่านี้ครั้ง
+
+
+class RingBuffer:
+    """ writer เดียว (callback ของไมค์) / reader หลายตัวที่ถือ cursor ของตัวเอง โดยไม่ใช้ lock
+        ตำแหน่งทั้งหมดนับเป็น sample ตั้งแต่เริ่ม (เพิ่มขึ้นเรื่อยๆ ไม่วนกลับ) """
+    def __init__(self, capacity, dtype=np.int16):
+        self.capacity = capacity
+        self.write_pos = 0
+        self._buf = np.zeros(capacity, dtype=dtype)
+
+    def write(self, samples):
+        n = len(samples)
+        if n > self.capacity:  # block ใหญ่กว่าทั้ง buffer → เก็บแค่ส่วนท้าย
+            samples = samples[-self.capacity:]
+            self.write_pos += n - self.capacity
+            n = self.capacity
+        start = self.write_pos % self.capacity
+        first = min(n, self.capacity - start)
+        self._buf[start:start + first] = samples[:first]
+        self._buf[:n - first] = samples[first:]
+        self.write_pos += n  # ขยับตำแหน่งหลังจากเสียงอยู่ใน buffer แล้วเท่านั้น
+
+    def skip_to(self, position):
+        """ เลื่อนตำแหน่งเขียนไปที่ position โดยเติมความเงียบ (0) ในช่วงที่ข้าม """
+        gap = position - self.write_pos
+        if gap <= 0:
+            return
+        if gap >= self.capacity:
+            self._buf[:] = 0
+        else:
+            start = self.write_pos % self.capacity
+            first = min(gap, self.capacity - start)
+            self._buf[start:start + first] = 0
+            self._buf[:gap - first] = 0
+        self.write_pos = position
+
+    def read(self, cursor, end=None):
+        """ คัดลอกเสียงช่วง [cursor, end) (end=None → ถึงตำแหน่งเขียนล่าสุด)
+            คืนค่า (samples, ตำแหน่งถัดไป, จำนวน sample ที่ถูกเขียนทับไปก่อนอ่านทัน) """
+        write_pos = self.write_pos
+        end = write_pos if end is None else min(end, write_pos)
+        lost = 0
+        if end - cursor > self.capacity:
+            lost = end - self.capacity - cursor
+            cursor = end - self.capacity
+        if end <= cursor:
+            return self._buf[:0].copy(), max(cursor, end), lost
+
+        start = cursor % self.capacity
+        first = min(end - cursor, self.capacity - start)
+        data = np.concatenate((self._buf[start:start + first], self._buf[:end - cursor - first]))
+
+        # ระหว่างคัดลอก writer อาจวนมาทับส่วนต้นของช่วงนี้ → ตัดส่วนที่ไม่น่าเชื่อถือทิ้ง
+        overrun = min(self.write_pos - self.capacity - cursor, len(data))
+        if overrun > 0:
+            data = data[overrun:]
+            lost += overrun
+        return data, end, lost
+
+
+class MicSubscription:
+    def __init__(self, hub, callback, name, frame_samples, start_pos, on_close=None, on_error=None,
+                 max_errors=MAX_CONSECUTIVE_ERRORS):
+        """
+        callback(samples): ได้เสียง int16 (np.ndarray) ตามลำดับ ไม่ซ้ำ ไม่ขาด (เว้นแต่ตามไม่ทันจน buffer วนทับ)
+        frame_samples: ส่งเป็น frame ขนาดคงที่ (เช่น 480 = 30ms สำหรับ webrtcvad), None = ส่งเท่าที่มี
+        start_pos: ตำแหน่งเริ่มอ่านใน ring buffer (ย้อนหลังได้)
+        on_close(): เรียกครั้งเดียวหลังส่งเสียงที่ค้างให้ callback หมดแล้ว
+        on_error(e): เรียกครั้งเดียว (ใน thread ของ subscription) เมื่อ callback error ติดกัน max_errors ครั้ง
+                     แล้ว subscription ถูกปิด
+        """
+        self.hub = hub
+        self.callback = callback
+        self.name = name
+        self.frame_samples = frame_samples
+        self.on_close = on_close
+        self.on_error = on_error
+        self.max_errors = max_errors
+        self.start_position = start_pos   # ตำแหน่งใน hub ของ sample แรกที่ callback จะได้รับ
+        self.position = start_pos
+        self.dropped = 0
+        self.errors = 0
+        self.error = None       # error ที่ทำให้ subscription ถูกปิด (None = ยังทำงานปกติ)
+
+        self._consecutive_errors = 0
+        self._pending = None    # เศษที่ยังไม่ครบ frame
+        self._wake = threading.Event()
+        self._closing = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"mic-{name}", daemon=True)
+        self._thread.start()
+
+    def close(self, timeout=2.0):
+        """ หยุดรับเสียง: เสียงที่เข้ามาก่อนหน้านี้ยังถูกส่งให้ callback จนหมด """
+        self.hub._unsubscribe(self)
+        self._closing.set()
+        self._wake.set()
+        if threading.current_thread() is not self._thread:
+            self._thread.join(timeout)
+
+    def raise_if_failed(self):
+        """ ให้เจ้าของ subscription รู้ว่า callback พังจนถูกปิดไปแล้ว """
+        if self.error is not None:
+            raise RuntimeError(f"mic subscription '{self.name}' ถูกปิดเพราะ callback error") from self.error
+
+    def _run(self):
+        try:
+            while True:
+                self._wake.wait(POLL_INTERVAL_S)
+                self._wake.clear()
+                closing = self._closing.is_set()
+                data, self.position, lost = self.hub.ring.read(self.position)
+                if lost:
+                    self.dropped += lost
+                    self._pending = None  # frame ที่ค้างไม่ต่อเนื่องกับเสียงใหม่แล้ว
+                if len(data):
+                    self._deliver(data)
+                if closing:
+                    return
+        finally:
+            if self.on_close is not None:
+                try:
+                    self.on_close()
+                except Exception as e:
+                    write_log(f"❌ ปิด mic subscription '{self.name}' ไม่สำเร็จ: {e}")
+
+    def _deliver(self, data):
+        if self.frame_samples:
+            if self._pending is not None:
+                data = np.concatenate((self._pending, data))
+                self._pending = None
+            usable = len(data) - len(data) % self.frame_samples
+            if usable < len(data):
+                self._pending = data[usable:]
+            for i in range(0, usable, self.frame_samples):
+                self._call(data[i:i + self.frame_samples])
+        else:
+            self._call(data)
+
+    def _call(self, samples):
+        if self.error is not None:
+            return
+        try:
+            self.callback(samples)
+            self._consecutive_errors = 0
+        except Exception as e:
+            self.errors += 1
+            self._consecutive_errors += 1
+            if self.errors == 1 or self.errors % ERROR_LOG_EVERY == 0:
+                write_log(f"❌ mic subscription '{self.name}' error (ครั้งที่ {self.errors}): {e}")
+            if self._consecutive_errors >= self.max_errors:
+                self._fail(e)
+
+    def _fail(self, e):
+        """ callback ใช้ไม่ได้แล้ว → เลิกส่งเสียง แล้วแจ้งเจ้าของ """
+        self.error = e
+        write_log(f"❌ ปิด mic subscription '{self.name}' หลัง error ติดกัน {self._consecutive_errors} ครั้ง: {e}")
+        self.hub._unsubscribe(self, failed=True)
+        self._closing.set()
+        if self.on_error is not None:
+            try:
+                self.on_error(e)
+            except Exception as handler_error:
+                write_log(f"❌ on_error ของ mic subscription '{self.name}' error: {handler_error}")
+
+
+class MicHub:
+    def __init__(self, sample_rate=SAMPLE_RATE, block_ms=BLOCK_MS, buffer_s=BUFFER_S, device=None):
+        """
+        sample_rate: sample rate ของไมค์และของเสียงที่แจกให้ทุก subscription (mono int16)
+        block_ms: ขนาด block ที่ขอจากไมค์
+        buffer_s: ความยาว ring buffer (subscription ที่ช้ากว่านี้จะเสียเสียงส่วนที่ถูกทับ)
+        device: อุปกรณ์ของ sounddevice (None = ไมค์เริ่มต้น)
+        """
+        self.sample_rate = sample_rate
+        self.block_samples = int(sample_rate * block_ms / 1000)
+        self.device = device
+        self.ring = RingBuffer(int(sample_rate * buffer_s))
+
+        self._stream = None
+        self._lock = threading.Lock()   # ใช้ตอน subscribe/unsubscribe เท่านั้น (callback ของไมค์ไม่แตะ)
+        self._subscriptions = ()        # tuple ใหม่ทุกครั้งที่เปลี่ยน → callback วนอ่านได้โดยไม่ต้อง lock
+        self._counters = {"blocks": 0, "overflows": 0, "subscriptions": 0, "failed": 0}
+
+    # ---------- อุปกรณ์ ----------
+    def start(self):
+        """ เปิดไมค์ (ครั้งเดียว, เรียกซ้ำได้) """
+        with self._lock:
+            if self._stream is not None:
+                return self
+            if not sounddevice_installed:
+                raise RuntimeError("MicHub ต้องใช้ sounddevice: pip install sounddevice")
+            stream = sd.InputStream(
+                samplerate=self.sample_rate, channels=1, dtype="int16",
+                blocksize=self.block_samples, device=self.device, callback=self._on_audio
+            )
+            stream.start()
+            self._stream = stream
+        write_log(f"🎙️ เปิดไมค์ ({self.sample_rate} Hz, block {self.block_samples} samples)")
+        return self
+
+    def stop(self):
+        """ ปิด subscription ทั้งหมดแล้วปิดไมค์ """
+        for sub in self._subscriptions:
+            sub.close()
+        with self._lock:
+            stream, self._stream = self._stream, None
+        if stream is not None:
+            stream.stop()
+            stream.close()
+
+    @property
+    def running(self):
+        return self._stream is not None
+
+    def _on_audio(self, indata, frames, time_info, status):
+        if status:
+            self._counters["overflows"] += 1
+        self.feed(indata[:, 0])
+
+    def feed(self, samples):
+        """ ใส่เสียง int16 เข้า ring buffer แล้วปลุกทุก subscription (callback ของไมค์เรียกตัวนี้,
+            ใช้ป้อนเสียงจากไฟล์แทนไมค์ได้ด้วย) """
+        self.ring.write(samples)
+        self._counters["blocks"] += 1
+        for sub in self._subscriptions:
+            sub._wake.set()
+
+    # ---------- ผู้ใช้เสียง ----------
+    @property
+    def position(self):
+        """ ตำแหน่ง (sample) ล่าสุดที่เขียนแล้ว ใช้กับ read() หรือเป็นจุดเริ่มของ subscription """
+        return self.ring.write_pos
+
+    def read(self, start, end=None):
+        """ ดึงเสียงย้อนหลังช่วง [start, end) ที่ยังอยู่ใน ring buffer """
+        return self.ring.read(start, end)[0]
+
+    def subscribe(self, callback, name="subscriber", frame_ms=None, preroll_ms=0, on_close=None, on_error=None):
+        """ เริ่มส่งเสียงให้ callback ใน thread ของ subscription เอง
+            preroll_ms: เริ่มจากเสียงย้อนหลังเท่านี้ (เช่น เสียงช่วงที่ VAD เพิ่งจับได้ว่าเริ่มพูด)
+            on_error(e): callback error ติดกันจนถูกปิด (ดู MicSubscription) """
+        frame_samples = int(self.sample_rate * frame_ms / 1000) if frame_ms else None
+        start_pos = max(0, self.position - int(self.sample_rate * preroll_ms / 1000))
+        sub = MicSubscription(self, callback, name, frame_samples, start_pos, on_close, on_error)
+        with self._lock:
+            self._subscriptions = self._subscriptions + (sub,)
+            self._counters["subscriptions"] += 1
+        return sub
+
+    def _unsubscribe(self, sub, failed=False):
+        with self._lock:
+            self._subscriptions = tuple(s for s in self._subscriptions if s is not sub)
+            if failed:
+                self._counters["failed"] += 1
+
+    def azure_audio_config(self, name="stt", preroll_ms=0):
+        """ AudioConfig ของ Azure ที่อ่านจาก hub (PushAudioInputStream) แทน use_default_microphone=True
+            คืนค่า (audio_config, subscription) → เรียก subscription.close() เมื่อเลิกใช้ recognizer """
+        import azure.cognitiveservices.speech as speechsdk
+
+        stream_format = speechsdk.audio.AudioStreamFormat(
+            samples_per_second=self.sample_rate, bits_per_sample=16, channels=1)
+        push_stream = speechsdk.audio.PushAudioInputStream(stream_format=stream_format)
+        sub = self.subscribe(lambda samples: push_stream.write(samples.tobytes()), name,
+                             preroll_ms=preroll_ms, on_close=push_stream.close)
+        return speechsdk.audio.AudioConfig(stream=push_stream), sub
+
+    def record(self, path, preroll_ms=0):
+        """ บันทึกเสียงจากไมค์ลงไฟล์ .wav จนกว่าจะเรียก subscription.close() """
+        wav = wave.open(path, "wb")
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(self.sample_rate)
+        return self.subscribe(lambda samples: wav.writeframes(samples.tobytes()), f"record:{path}",
+                              preroll_ms=preroll_ms, on_close=wav.close)
+
+    def stats(self):
+        subscriptions = self._subscriptions
+        return {
+            **self._counters,
+            "running": self.running,
+            "position": self.position,
+            "active": [{"name": s.name, "lag": self.position - s.position, "dropped": s.dropped, "errors": s.errors}
+                       for s in subscriptions],
+        }
+
+
+# ---------- hub ที่ใช้ร่วมกันทั้งโปรแกรม ----------
+_hub = None
+_hub_lock = threading.Lock()
+
+
+def get_mic_hub():
+    """ hub กลางที่เปิดไมค์ไว้แล้ว (เปิดครั้งแรกที่เรียก) """
+    global _hub
+    with _hub_lock:
+        if _hub is None:
+            _hub = MicHub()
+        hub = _hub
+    return hub.start()
+
+
+@atexit.register
+def close_mic_hub():
+    global _hub
+    with _hub_lock:
+        hub, _hub = _hub, None
+    if hub is not None:
+        hub.stop()
@@ -2,9 +2,6 @@
 import cv2                        # OpenCV สำหรับการประมวลผลภาพ
 import mediapipe as mp             # MediaPipe สำหรับตรวจจับคนในกล้อง
 import azure.cognitiveservices.speech as speechsdk  # Azure Speech SDK สำหรับ STT
-import sounddevice as sd           # สำหรับจัดการเสียงจากไมค์
-import numpy as np                 # จัดการข้อมูลเสียงแบบ array
-import webrtcvad                   # ตรวจจับเสียงพูด/เสียงเงียบ (VAD)
 import requests                    # ส่ง request ไป API
 import threading                   # รันหลาย thread พร้อมกัน
 import time                        # จับเวลา
@@ -12,6 +9,10 @@ import os                          # จัดการไฟล์
 from dotenv import load_dotenv     # โหลดตัวแปรจาก .env
 from pathlib import Path           # จัดการ path
 import keyboard                    # ตรวจจับการกดปุ่มบนคีย์บอร์ด
+from py_audio2face import tracing  # span + correlation id ของแต่ละรอบสนทนา
+from log_writer import configure_log, write_log  # log ลงไฟล์ผ่าน thread พื้นหลัง
+from mic_hub import get_mic_hub    # ไมค์ตัวเดียวที่เปิดค้างไว้ แจกเสียงให้ VAD และ STT
+from vad import VadStage           # ตรวจจับเสียงพูด/เสียงเงียบ (webrtcvad + energy gate)
 
 
 # ---------- โหลด API KEY จากไฟล์ .env ----------
@@ -22,14 +23,14 @@ AZURE_SPEECH_KEY = os.getenv("AZURE_SPEECH_KEY")    # คีย์ของ Azur
 AZURE_REGION = os.getenv("AZURE_SPEECH_REGION")     # Region ของ Azure Speech
 API_ASKDAMO = "http://localhost:3000/0921_chatbot_demo/api/askDamo"  # API สำหรับ chatbot
 
+# ✅ tracing: ตั้ง TRACE_JSONL=trace.jsonl และ/หรือ TRACE_OTLP_ENDPOINT=http://localhost:4318/v1/traces ใน .env
+tracing.configure_from_env()
+
 
 # ---------- ตั้งค่า Log ----------
+# write_log ไม่เปิด/ปิดไฟล์เองแล้ว: แค่เข้าคิว → ไม่ block callback ของ Azure (ดู log_writer.py)
 LOG_FILE = "log.txt"
-
-def write_log(message):
-    print(message)
-    with open(LOG_FILE, "a", encoding="utf-8") as f:
-        f.write(f"[{time.ctime()}] {message}\n")
+configure_log(LOG_FILE)
 
 
 # ---------- ตั้งค่า MediaPipe สำหรับตรวจจับคน ----------
@@ -38,26 +39,26 @@ selfie_segmentation = mp_selfie_segmentation.SelfieSegmentation(model_selection=
 
 
 # ---------- ตรวจจับความเงียบด้วย webrtcvad ----------
-def wait_for_silence(vad_aggressiveness=2, silence_duration=3, sample_rate=16000):
-    vad = webrtcvad.Vad(vad_aggressiveness)     # สร้างตัวตรวจจับเสียงพูด
-    silence_start = None
-    block_duration = 0.03  # 30ms
-
-    def is_speech(audio_chunk):
-        audio_bytes = (audio_chunk * 32768).astype(np.int16).tobytes()
-        return vad.is_speech(audio_bytes, sample_rate)
+def wait_for_silence(vad_aggressiveness=2, silence_duration=3):
+    hub = get_mic_hub()                         # ใช้ไมค์ตัวเดียวกับ STT (ไม่เปิดอุปกรณ์ใหม่)
+    # เสียงจาก hub เป็น int16 อยู่แล้ว → VadStage ตัด frame แบบไม่คัดลอก, ข้าม frame ที่เบามาก, นับความเงียบเป็น sample
+    vad = VadStage(sample_rate=hub.sample_rate, aggressiveness=vad_aggressiveness)
+    silence_samples = int(silence_duration * hub.sample_rate)
+    silent = threading.Event()
+
+    def on_audio(samples):
+        vad.process(samples)
+        if vad.silence_samples >= silence_samples:
+            silent.set()  # ถ้าเงียบต่อเนื่องเกิน silence_duration → หยุด
 
     try:
-        with sd.InputStream(samplerate=sample_rate, channels=1, dtype='float32') as stream:
-            while True:
-                audio_chunk, _ = stream.read(int(sample_rate * block_duration))
-                if is_speech(audio_chunk):
-                    silence_start = None  # มีเสียงพูด → รีเซ็ตตัวจับเวลา
-                else:
-                    if silence_start is None:
-                        silence_start = time.time()  # เริ่มจับเวลาเมื่อเจอเสียงเงียบ
-                    elif time.time() - silence_start >= silence_duration:
-                        break  # ถ้าเงียบต่อเนื่องเกิน silence_duration → หยุด
+        # VAD พังซ้ำๆ → subscription ถูกปิด ต้องปลุกตัวที่รออยู่ แล้วแจ้ง error ด้านล่าง
+        subscription = hub.subscribe(on_audio, "vad", on_error=lambda e: silent.set())
+        try:
+            silent.wait()
+        finally:
+            subscription.close()
+        subscription.raise_if_failed()
     except Exception as e:
         write_log(f"❌ Error in VAD: {e}")
 
@@ -69,21 +70,39 @@ def listen_and_send(stop_event):
     speech_config.set_property(
         speechsdk.PropertyId.SpeechServiceResponse_PostProcessingOption, "TrueText")  # ✅ ใส่จุด/เว้นวรรคอัตโนมัติ
 
-    audio_config = speechsdk.audio.AudioConfig(use_default_microphone=True)
+    # ✅ อ่านเสียงจาก mic hub ผ่าน PushAudioInputStream แทนการเปิดไมค์เริ่มต้นใหม่ทุกครั้งที่เจอคน
+    audio_config, mic_subscription = get_mic_hub().azure_audio_config("stt")
 
     recognizer = speechsdk.SpeechRecognizer(speech_config=speech_config, audio_config=audio_config)
+    session_started_at = [time.perf_counter()]
+
+    def session_started(evt):
+        session_started_at[0] = time.perf_counter()
 
     def recognized(evt):
         if evt.result.reason == speechsdk.ResultReason.RecognizedSpeech:
             text = evt.result.text.strip()
             if text:
-                write_log(f"📝 ได้ข้อความ: {text}")
-                try:
-                    response = requests.post(API_ASKDAMO, json={"question": text})
-                    response.raise_for_status()
-                    write_log("✅ ส่งข้อความสำเร็จ")
-                except Exception as e:
-                    write_log(f"❌ ส่ง API ผิดพลาด: {e}")
+                # ✅ แต่ละข้อความที่ได้ = หนึ่งรอบสนทนา (turn) → ทุก span/log ต่อจากนี้ใช้ correlation id เดียวกัน
+                with tracing.trace_turn() as turn_id:
+                    # offset/duration เป็นหน่วย 100ns นับจากเริ่ม session → เวลาที่ Azure ใช้หลังพูดจบ (โดยประมาณ)
+                    speech_end = session_started_at[0] + (evt.result.offset + evt.result.duration) / 1e7
+                    with tracing.span("stt.recognized", chars=len(text),
+                                      duration_ms=evt.result.duration / 1e4,
+                                      latency_ms=1000 * (time.perf_counter() - speech_end)):
+                        write_log(f"📝 ได้ข้อความ: {text}")
+
+                    try:
+                        with tracing.span("chatbot.askdamo") as span:
+                            response = requests.post(
+                                API_ASKDAMO, json={"question": text},
+                                headers={tracing.CORRELATION_HEADER: turn_id}
+                            )
+                            span.set(status_code=response.status_code)
+                            response.raise_for_status()
+                        write_log("✅ ส่งข้อความสำเร็จ")
+                    except Exception as e:
+                        write_log(f"❌ ส่ง API ผิดพลาด: {e}")
 
     def session_stopped(evt):
         write_log("🛑 หยุดฟัง")
@@ -93,6 +112,7 @@ def listen_and_send(stop_event):
         write_log(f"❌ การฟังยกเลิก: {evt}")
         stop_event.set()
 
+    recognizer.session_started.connect(session_started)
     recognizer.recognized.connect(recognized)
     recognizer.session_stopped.connect(session_stopped)
     recognizer.canceled.connect(canceled)
@@ -106,6 +126,7 @@ def listen_and_send(stop_event):
 
     recognizer.stop_continuous_recognition()
     recognizer.recognized.disconnect_all()
+    mic_subscription.close()   # ปิดเฉพาะ push stream ของรอบนี้ ไมค์ยังเปิดอยู่
 
 
 # ---------- เริ่มเปิดกล้อง ----------
@@ -115,6 +136,7 @@ mic_on = False                     # สถานะว่าไมค์เป
 mic_thread = None                  # Thread สำหรับไมค์
 stop_event = threading.Event()     # Signal สำหรับหยุดไมค์
 
+get_mic_hub()                      # เปิดไมค์ครั้งเดียวตอนเริ่มโปรแกรม
 write_log("🎉 ยินดีต้อนรับ! พร้อมแล้ว พูดอะไรกับฉันก็ได้เลย 😎")
 
 while cap.isOpened():              # ทำงานจนกว่าจะปิดกล้อง
@@ -0,0 +1,171 @@
+# phrase_cache.py
+# cache เสียงของประโยคที่ avatar พูดซ้ำบ่อย (คำทักทาย, fallback, คำยืนยัน)
+# - key = (voice, emotion, SSML ที่ normalize แล้ว)
+# - เก็บ PCM ที่แปลงเป็นรูปแบบของ A2F แล้ว (mono int16 44.1kHz) → hit ไม่ต้องเรียก Azure และไม่ต้องแปลงไฟล์
+# - 2 ชั้น: memory (LRU จำกัดจำนวน byte) และ disk (ไฟล์ .pcm จำกัดขนาดรวม, ลบไฟล์ที่ใช้ล่าสุดนานที่สุดก่อน)
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+def normalize_ssml(ssml):
+    """ ตัดช่องว่างที่ไม่มีผลต่อเสียง เพื่อให้ข้อความเดียวกันได้ key เดียวกัน """
+    ssml = re.sub(r"\s+", " ", ssml.strip())
+    return re.sub(r">\s+<", "><", ssml)
+
+
+class PhraseCache:
+    def __init__(self, cache_dir, samplerate=44100, memory_bytes=64 * 1024 * 1024, disk_bytes=512 * 1024 * 1024):
+        """
+        cache_dir: โฟลเดอร์เก็บไฟล์ .pcm (None = ใช้เฉพาะ memory)
+        samplerate: sample rate ของ PCM ที่เก็บ (เป็นส่วนหนึ่งของ key)
+        memory_bytes: ขนาดสูงสุดของ memory tier
+        disk_bytes: ขนาดรวมสูงสุดของไฟล์ใน disk tier
+        """
+        self.cache_dir = cache_dir
+        self.samplerate = samplerate
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()  # key -> np.ndarray (int16), เก่าสุดอยู่หน้า
+        self._memory_used = 0
+        self._disk = OrderedDict()    # key -> ขนาดไฟล์, เรียงตามเวลาใช้ล่าสุด
+        self._disk_used = 0
+        self._counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "evicted": 0}
+
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+            self._load_disk_index()
+
+    # ---------- key ----------
+    def make_key(self, voice, emotion, ssml):
+        raw = "|".join([str(voice), str(emotion), str(self.samplerate), normalize_ssml(ssml)])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    # ---------- disk tier ----------
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + ".pcm")
+
+    def _load_disk_index(self):
+        # เรียงตาม mtime → ไฟล์ที่ใช้ล่าสุดนานที่สุดถูกลบก่อน แม้หลังรีสตาร์ทโปรแกรม
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".pcm"):
+                continue
+            st = os.stat(os.path.join(self.cache_dir, name))
+            entries.append((st.st_mtime, name[:-4], st.st_size))
+        for _, key, size in sorted(entries):
+            self._disk[key] = size
+            self._disk_used += size
+
+    def _read_disk(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                pcm = np.frombuffer(f.read(), dtype=np.int16)
+            os.utime(path)  # บันทึกลำดับการใช้งานลงไฟล์
+        except OSError:
+            self._drop_disk(key)
+            return None
+        self._disk.move_to_end(key)
+        return pcm
+
+    def _write_disk(self, key, pcm):
+        path = self._path(key)
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(pcm.tobytes())
+        os.replace(tmp, path)
+
+        self._drop_disk(key)
+        self._disk[key] = pcm.nbytes
+        self._disk_used += pcm.nbytes
+        while self._disk_used > self.disk_bytes and len(self._disk) > 1:
+            old_key = next(iter(self._disk))
+            self._drop_disk(old_key)
+            try:
+                os.remove(self._path(old_key))
+            except OSError:
+                pass
+            self._counters["evicted"] += 1
+
+    def _drop_disk(self, key):
+        size = self._disk.pop(key, None)
+        if size is not None:
+            self._disk_used -= size
+
+    # ---------- memory tier ----------
+    def _remember(self, key, pcm):
+        if pcm.nbytes > self.memory_bytes:
+            return
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_used -= old.nbytes
+        self._memory[key] = pcm
+        self._memory_used += pcm.nbytes
+        while self._memory_used > self.memory_bytes:
+            _, dropped = self._memory.popitem(last=False)
+            self._memory_used -= dropped.nbytes
+
+    # ---------- ใช้งาน ----------
+    def get(self, key):
+        """ คืนค่า PCM int16 (read-only) หรือ None ถ้าไม่มีใน cache """
+        with self._lock:
+            pcm = self._memory.get(key)
+            if pcm is not None:
+                self._memory.move_to_end(key)
+                self._counters["memory_hits"] += 1
+                return pcm
+
+            if self.cache_dir and key in self._disk:
+                pcm = self._read_disk(key)
+                if pcm is not None:
+                    self._remember(key, pcm)
+                    self._counters["disk_hits"] += 1
+                    return pcm
+
+            self._counters["misses"] += 1
+            return None
+
+    def put(self, key, pcm):
+        """ เก็บ PCM ที่แปลงแล้ว (mono int16 ที่ self.samplerate) """
+        pcm = np.ascontiguousarray(pcm, dtype=np.int16).reshape(-1)
+        pcm.setflags(write=False)
+        with self._lock:
+            self._remember(key, pcm)
+            if self.cache_dir:
+                try:
+                    self._write_disk(key, pcm)
+                except OSError as e:
+                    print("⚠️ เขียน phrase cache ลง disk ไม่สำเร็จ:", e)
+            self._counters["stores"] += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self._counters["memory_hits"] + self._counters["disk_hits"] + self._counters["misses"]
+            hits = lookups - self._counters["misses"]
+            return {
+                **self._counters,
+                "hit_rate": hits / lookups if lookups else 0.0,
+                "memory_items": len(self._memory),
+                "memory_bytes": self._memory_used,
+                "disk_items": len(self._disk),
+                "disk_bytes": self._disk_used,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._memory_used = 0
+            for key in list(self._disk):
+                try:
+                    os.remove(self._path(key))
+                except OSError:
+                    pass
+            self._disk.clear()
+            self._disk_used = 0
@@ -0,0 +1,222 @@
+# playback.py
+# เล่นเสียงผ่าน callback ของ sd.OutputStream จาก buffer เดียว โดยมี cursor ระดับ sample
+# - pause()/stop() จากที่ไหนก็ได้ (เช่น callback ของ barge-in): block ถัดไปของลำโพง fade-out แล้วเงียบ → หยุดภายใน 1 block
+# - position = sample ถัดไปที่ยังไม่ได้เล่น (รวมช่วงที่ fade แล้ว) → resume() เล่นต่อจากตรงนั้นพร้อม fade-in
+#   ไม่ต้องสังเคราะห์ใหม่ และไม่เล่นซ้ำส่วนที่คนฟังได้ยินไปแล้ว
+# - on_output(samples): ได้ PCM ทุก block ที่ส่งให้ลำโพงจริง (เช่น EchoCanceller.push_reference)
+#   error ของ on_output ไม่ทำให้เสียงสะดุด: นับไว้ใน stats() และ log ครั้งแรก (ไม่เลิกเรียก → reference ไม่หายถาวร)
+# - load() สลับ (audio, cursor, state) ใต้ lock และเพิ่ม generation: block ที่ render อยู่ตอน load() จะไม่เขียน
+#   cursor/FINISHED ของเสียงเก่าทับเสียงใหม่
+# - render(out) คือสิ่งที่ callback ทำ: เติมเสียง block ถัดไปลง out (ใช้ทดสอบหรือเขียนลงไฟล์ได้โดยไม่ต้องมีลำโพง)
+import threading
+
+import numpy as np
+
+from log_writer import write_log
+
+try:
+    import sounddevice as sd
+    sounddevice_installed = True
+except ImportError:
+    sounddevice_installed = False
+
+SAMPLE_RATE = 16000
+BLOCK_MS = 10
+FADE_MS = 10
+
+IDLE = "idle"
+PLAYING = "playing"
+PAUSING = "pausing"
+PAUSED = "paused"
+STOPPING = "stopping"
+FINISHED = "finished"
+
+
+class PlaybackEngine:
+    def __init__(self, sample_rate=SAMPLE_RATE, block_ms=BLOCK_MS, fade_ms=FADE_MS, device=None, on_output=None):
+        """
+        sample_rate: sample rate ของเสียงที่เล่น (mono int16)
+        block_ms: ขนาด block ของ callback = เวลาตอบสนองสูงสุดต่อ pause()/stop()
+        fade_ms: ความยาว fade-out ตอนหยุด และ fade-in ตอนเล่นต่อ (ไม่มีเสียงคลิก)
+        device: อุปกรณ์ของ sounddevice (None = ลำโพงเริ่มต้น)
+        on_output(samples): ถูกเรียกจาก callback ของลำโพง → ต้องเร็วและไม่ block
+        """
+        self.sample_rate = sample_rate
+        self.block_samples = int(sample_rate * block_ms / 1000)
+        self.fade_samples = max(1, int(sample_rate * fade_ms / 1000))
+        self.device = device
+        self.on_output = on_output
+
+        self._audio = np.zeros(0, dtype=np.int16)
+        self._cursor = 0
+        self._fade_in = False
+        self.state = IDLE
+        self._stopped = threading.Event()   # หยุดแล้ว: PAUSED / FINISHED / IDLE
+        self._stopped.set()
+        self._lock = threading.Lock()       # ใช้ตอนเปิดอุปกรณ์เท่านั้น
+        self._state_lock = threading.Lock() # (audio, cursor, state) ระหว่างคำสั่งควบคุมกับ callback
+        self._generation = 0                # เพิ่มทุกครั้งที่ load()
+        self._stream = None
+        self.output_errors = 0              # จำนวนครั้งที่ on_output error
+        self.last_output_error = None
+
+    # ---------- อุปกรณ์ ----------
+    def start(self):
+        """ เปิดลำโพง (ครั้งเดียว ใช้ต่อไปเรื่อยๆ), callback ส่งความเงียบเมื่อไม่มีอะไรเล่น """
+        with self._lock:
+            if self._stream is None:
+                if not sounddevice_installed:
+                    raise RuntimeError("PlaybackEngine ต้องใช้ sounddevice: pip install sounddevice")
+                stream = sd.OutputStream(
+                    samplerate=self.sample_rate, channels=1, dtype="int16", blocksize=self.block_samples,
+                    latency="low", device=self.device, callback=self._callback
+                )
+                stream.start()
+                self._stream = stream
+        return self
+
+    def close(self):
+        with self._lock:
+            stream, self._stream = self._stream, None
+        if stream is not None:
+            stream.stop()
+            stream.close()
+
+    @property
+    def running(self):
+        return self._stream is not None
+
+    # ---------- ควบคุม ----------
+    def load(self, audio, start=0):
+        """ ตั้งเสียงที่จะเล่นและตำแหน่งเริ่ม (sample) แล้วเริ่มเล่นใน block ถัดไป """
+        audio = np.asarray(audio, dtype=np.int16)
+        with self._state_lock:
+            self._generation += 1
+            self._audio = audio
+            self._cursor = min(max(0, int(start)), len(audio))
+            self._fade_in = start > 0
+            self._stopped.clear()
+            self.state = PLAYING
+        return self
+
+    def play(self, audio, start=0):
+        """ เล่น audio ตั้งแต่ sample ที่ start (เปิดลำโพงถ้ายังไม่เปิด) """
+        self.start()
+        return self.load(audio, start)
+
+    def pause(self, wait=True, timeout=1.0):
+        """ fade-out แล้วหยุดที่ block ถัดไป, คืนค่าตำแหน่งที่จะเล่นต่อ
+            wait=False: แค่สั่ง (เรียกจาก callback ของ thread อื่นได้) """
+        with self._state_lock:
+            if self.state == PLAYING:
+                self.state = PAUSING
+        if wait and self.running:
+            self._stopped.wait(timeout)
+        return self._cursor
+
+    def resume(self):
+        """ เล่นต่อจากตำแหน่งที่หยุด (fade-in) """
+        with self._state_lock:
+            if self.state in (PAUSING, PAUSED):
+                self._fade_in = True
+                self._stopped.clear()
+                self.state = PLAYING
+
+    def stop(self, wait=True, timeout=1.0):
+        """ fade-out แล้วเลิกเล่นเสียงนี้, คืนค่าตำแหน่งที่หยุด """
+        with self._state_lock:
+            if self.state in (PLAYING, PAUSING):
+                self.state = STOPPING
+            elif self.state == PAUSED:
+                self.state = FINISHED
+                self._stopped.set()
+        if wait and self.running:
+            self._stopped.wait(timeout)
+        return self._cursor
+
+    def wait(self, timeout=None):
+        """ รอจนเล่นจบหรือถูก pause/stop แล้วคืนค่า state (FINISHED / PAUSED / ...) """
+        self._stopped.wait(timeout)
+        return self.state
+
+    @property
+    def position(self):
+        """ sample ถัดไปที่จะเล่น (= จุด resume) """
+        return self._cursor
+
+    @property
+    def duration(self):
+        return len(self._audio)
+
+    @property
+    def remaining(self):
+        return len(self._audio) - self._cursor
+
+    def stats(self):
+        return {
+            "state": self.state,
+            "position": self._cursor,
+            "duration": len(self._audio),
+            "output_errors": self.output_errors,
+            "last_output_error": None if self.last_output_error is None else repr(self.last_output_error),
+        }
+
+    # ---------- callback ของลำโพง ----------
+    def _callback(self, outdata, frames, time_info, status):
+        self.render(outdata[:, 0])
+
+    def render(self, out):
+        """ เติม PCM block ถัดไปลง out (int16) แล้วขยับ cursor """
+        with self._state_lock:
+            state, audio, cursor, generation = self.state, self._audio, self._cursor, self._generation
+            if state not in (PLAYING, PAUSING, STOPPING):
+                out[:] = 0
+                return
+            fade_in, self._fade_in = self._fade_in, False
+
+        take = min(len(out), len(audio) - cursor)
+        out[:take] = audio[cursor:cursor + take]
+        out[take:] = 0
+
+        if fade_in:
+            k = min(take, self.fade_samples)
+            out[:k] = out[:k] * np.linspace(0.0, 1.0, k, endpoint=False)
+
+        if state != PLAYING:
+            # fade-out ภายใน block นี้ แล้วเงียบ; ส่วนที่ fade ถือว่าได้ยินแล้ว → resume ต่อจากหลังช่วงนี้
+            k = min(take, self.fade_samples)
+            out[:k] = out[:k] * np.linspace(1.0, 0.0, k, endpoint=False)
+            out[k:] = 0
+            cursor, new_state = cursor + k, PAUSED if state == PAUSING else FINISHED
+        else:
+            cursor += take
+            new_state = FINISHED if cursor >= len(audio) else PLAYING
+
+        with self._state_lock:
+            if generation != self._generation:
+                # load() ระหว่าง block นี้: ทิ้ง block ของเสียงเก่า ไม่เขียน cursor/state ทับเสียงใหม่
+                out[:] = 0
+                return
+            self._cursor = cursor
+            # pause()/resume()/stop() ระหว่าง block นี้ชนะ: block ถัดไปจะทำตามคำสั่งใหม่
+            done = new_state != state and self.state == state
+            if done:
+                self.state = new_state
+
+        self._output(out)
+        if done:
+            with self._state_lock:
+                if generation == self._generation:
+                    self._stopped.set()
+
+    def _output(self, out):
+        if self.on_output is not None:
+            try:
+                self.on_output(out)
+            except Exception as e:
+                # ไม่ให้ error ของ reference ทำให้เสียงพูดสะดุด แต่ยังเรียกต่อ (เช่น error ชั่วคราว)
+                # ตัวตัด echo ที่ไม่ได้ reference → เสียง avatar เองกลายเป็นการพูดแทรก จึงต้องให้เห็นใน log
+                self.output_errors += 1
+                self.last_output_error = e
+                if self.output_errors == 1:
+                    write_log(f"❌ on_output ของลำโพง error (ตัวตัด echo ไม่ได้ reference): {e}")
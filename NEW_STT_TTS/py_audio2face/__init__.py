@@ -1 +1,6 @@
 from py_audio2face.audio2face import Audio2Face
+from py_audio2face.async_audio2face import AsyncAudio2Face
+from py_audio2face.audio2face_pool import Audio2FacePool
+from py_audio2face.export_cache import ExportCache
+from py_audio2face.modules._streaming import StreamingSession
+from py_audio2face.modules._supervisor import HeadlessSupervisor
@@ -0,0 +1,754 @@
+"""
+asyncio counterpart of Audio2Face for event loop based services (FastAPI, aiohttp, ...).
+All REST calls run on one pooled httpx.AsyncClient, so a single worker can drive many avatars concurrently.
+Every method is a coroutine and can be cancelled (e.g. asyncio.wait_for or task.cancel()); a cancelled call
+closes its connection and raises asyncio.CancelledError in the caller.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import time
+from typing import AsyncIterator, Callable, Union
+
+from py_audio2face import tracing, utils
+from py_audio2face.modules.clients._http_client import _A2F_HTTP_STATS
+from py_audio2face.modules._audio2emotion import _A2F_Audio2Emotion
+from py_audio2face.modules._export import _A2FExport
+from py_audio2face.modules._state import _A2F_STATE_MIRROR, UNCHANGED_RESPONSE, is_ok_response
+from py_audio2face.modules._scene import _A2F_SCENE_REGISTRY, get_instance_paths
+from py_audio2face.modules._supervisor import HeadlessSupervisor, get_headless_launcher
+from py_audio2face.export_cache import ExportCache
+from py_audio2face.settings import (
+    DEFAULT_A2E_INSTANCE, DEFAULT_PLAYER_INSTANCE, DEFAULT_SOLVER_INSTANCE, DEFAULT_OUTPUT_DIR,
+    DEFAULT_AUDIO_STREAM_PLAYER_INSTANCE, DEFAULT_AUDIO_STREAM_GRPC_PORT, DEFAULT_AUDIO_STREAM_MESSAGE_MS,
+    DEFAULT_HTTP_POOL_SIZE, DEFAULT_HTTP_TIMEOUT, DEFAULT_HTTP_ROUTE_TIMEOUTS,
+    DEFAULT_HTTP_MAX_RETRIES, DEFAULT_HTTP_RETRY_BACKOFF, DEFAULT_HTTP_NON_IDEMPOTENT_ROUTES,
+    DEFAULT_HEADLESS_STARTUP_TIMEOUT
+)
+
+try:
+    import httpx
+    async_installed = True
+except Exception as e:
+    async_installed = False
+
+try:
+    import grpc
+    import numpy as np
+    from py_audio2face.modules.clients.grpc_stub import audio2face_pb2, audio2face_pb2_grpc
+    from py_audio2face.modules._framing import PcmFramer
+    from py_audio2face.modules._streaming import GRPC_KEEPALIVE_OPTIONS, StreamingProgress
+    streaming_installed = True
+except Exception as e:
+    streaming_installed = False
+
+
+class AsyncAudio2Face:
+    def __init__(
+            self,
+            api_url="http://localhost:8011",
+            a2f_install_path: str = None,
+            output_dir: str = None,
+            http_pool_size: int = DEFAULT_HTTP_POOL_SIZE,
+            http_timeouts: dict = None,
+            http_max_retries: int = DEFAULT_HTTP_MAX_RETRIES,
+            export_cache_dir: str = None
+    ):
+        """
+        api_url (str): The API endpoint for Audio2Face.
+        a2f_install_path (str): Path to the Audio2Face installation directory. If None it's tried to get it from
+            the default dir. Only needed to start the headless server.
+        output_dir (str): Optional output directory for generated animations.
+        http_pool_size (int): Max. number of concurrent connections to the headless server.
+        http_timeouts (dict): Timeouts in seconds per api route. Merged with the defaults.
+        http_max_retries (int): How often a request is retried if the connection was refused or reset. Resets of
+            non idempotent routes (self.http_non_idempotent_routes) are not retried.
+        export_cache_dir (str): If set, exports are cached there and reruns skip unchanged files.
+        """
+        if not async_installed:
+            raise ImportError(
+                "httpx is not installed. "
+                "Please install it via 'pip install py_audio2face[async]'"
+            )
+
+        self.api_url = api_url
+        if a2f_install_path is None:
+            a2f_install_path = utils.get_audio2face_install_path()
+        if a2f_install_path is not None and a2f_install_path[-1] != "/":
+            a2f_install_path += "/"
+
+        self.a2f_install_path = a2f_install_path
+        self.output_dir = output_dir
+        self.process_audio2face = None
+        self.headless_supervisor = None
+
+        self.http_client = httpx.AsyncClient(
+            base_url=api_url,
+            limits=httpx.Limits(max_connections=http_pool_size, max_keepalive_connections=http_pool_size),
+            timeout=DEFAULT_HTTP_TIMEOUT
+        )
+        self.http_timeouts = {**DEFAULT_HTTP_ROUTE_TIMEOUTS, **(http_timeouts or {})}
+        self.http_max_retries = http_max_retries
+        self.http_retry_backoff = DEFAULT_HTTP_RETRY_BACKOFF
+        self.http_non_idempotent_routes = set(DEFAULT_HTTP_NON_IDEMPOTENT_ROUTES)
+        self.http_stats = _A2F_HTTP_STATS()
+        self.a2f_state = _A2F_STATE_MIRROR()
+
+        self.scene_registry = _A2F_SCENE_REGISTRY()
+        self._init_lock = asyncio.Lock()
+
+        self.a2e_settings = _A2F_Audio2Emotion.get_default_a2e_settings()
+        self.emotion = None  # the emotion vector of the last set_emotion call
+
+        self.export_cache = ExportCache(export_cache_dir) if export_cache_dir else None
+
+        # (grpc_host, grpc_port) -> grpc.aio channel, kept open between stream_audio calls
+        self.grpc_channels = {}
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.aclose()
+
+    async def aclose(self):
+        """ Closes all pooled connections and the gRPC channels """
+        await self.close_streaming_sessions()
+        await self.http_client.aclose()
+
+    # ---------------- http client ----------------
+    async def _send(self, method: str, api_route: str, payload=None, retries: int = None):
+        retries = self.http_max_retries if retries is None else retries
+        timeout = self.http_timeouts.get(api_route, DEFAULT_HTTP_TIMEOUT)
+        start = time.perf_counter()
+        attempt = 0
+        with tracing.span("a2f.rest", route=api_route, method=method) as span:
+            try:
+                while True:
+                    try:
+                        response = await self.http_client.request(
+                            method, f"/{api_route}", json=payload, timeout=timeout
+                        )
+                        break
+                    except (httpx.ConnectError, httpx.RemoteProtocolError) as e:
+                        self.a2f_state.invalidate()
+                        self.scene_registry.server_lost()
+                        # a reset after sending may have run the request already, only resend if that's harmless
+                        idempotent = method == "GET" or api_route not in self.http_non_idempotent_routes
+                        if attempt >= retries or not (isinstance(e, httpx.ConnectError) or idempotent):
+                            raise
+                        await asyncio.sleep(self.http_retry_backoff * 2 ** attempt)
+                        attempt += 1
+            except Exception:
+                self.http_stats.record(api_route, time.perf_counter() - start, retries=attempt, error=True)
+                span.set(retries=attempt)
+                raise
+
+            try:
+                server_s = response.elapsed.total_seconds()
+            except RuntimeError:  # elapsed is only set once the response stream was closed
+                server_s = 0.0
+            self.http_stats.record(api_route, time.perf_counter() - start, server_s, retries=attempt)
+            span.set(status_code=response.status_code, retries=attempt)
+        return response
+
+    async def make_request(self, api_route, retries: int = None):
+        url = f"{self.api_url}/{api_route}"
+        try:
+            response = await self._send("GET", api_route, retries=retries)
+            res = response.json()
+        except Exception as e:
+            res = str(e)
+            print(f"API {url} call error: {str(e)}")
+
+        return res
+
+    async def post(self, api_route: str, payload):
+        url = f"{self.api_url}/{api_route}"
+        res = None
+        try:
+            response = await self._send("POST", api_route, payload=payload)
+            res = response.json()
+        except ValueError as e:
+            print(f"Response of API {url} is not JSON format. Intended?")
+        except Exception as e:
+            res = str(e)
+            print(f"API {url} call error: {str(e)}")
+
+        return res
+
+    async def post_state(self, api_route: str, a2f_instance: str, values: dict):
+        """ Posts only the values that changed. See Audio2Face.post_state """
+        changed = self.a2f_state.changes(api_route, a2f_instance, values)
+        if not changed:
+            return dict(UNCHANGED_RESPONSE)
+
+        res = await self.post(api_route, payload={"a2f_instance": a2f_instance, **changed})
+        if is_ok_response(res):
+            self.a2f_state.commit(api_route, a2f_instance, changed)
+        else:
+            self.a2f_state.forget(api_route, a2f_instance)
+            self.scene_registry.invalidate_scene()
+        return res
+
+    async def start_headless_server(
+            self,
+            timeout: float = DEFAULT_HEADLESS_STARTUP_TIMEOUT,
+            auto_restart: bool = True,
+            log_path: str = None,
+            echo: bool = False
+    ):
+        """
+        Starts the headless server if it's not running and waits until it answers the status check.
+        See Audio2Face.start_headless_server
+        """
+        # check if already running
+        status = await self.make_request("status", retries=0)
+        if status == "OK":
+            print("audio2face running")
+            self.scene_registry.server_seen_up()
+            return status
+
+        print("starting audio2face headless")
+        if self.a2f_install_path is None:
+            raise FileNotFoundError(
+                "Audio2Face installation path is not provided and not found in the registry. "
+                "Install Audio2Face and provide the installation path manually."
+            )
+        launcher = get_headless_launcher(self.a2f_install_path)
+
+        def on_started(pid):
+            self.a2f_state.invalidate()
+            self.scene_registry.server_started(pid)
+
+        self.headless_supervisor = HeadlessSupervisor(
+            launcher, api_url=self.api_url, auto_restart=auto_restart, on_started=on_started,
+            log_path=log_path, echo=echo
+        )
+        self.process_audio2face = self.headless_supervisor.start()
+
+        print("wait until audio2face is ready")
+        loop = asyncio.get_running_loop()
+        if await loop.run_in_executor(None, self.headless_supervisor.wait_ready, timeout):
+            status = "OK"
+            self.scene_registry.server_seen_up()
+        else:
+            status = "timeout" if self.headless_supervisor.running else "exited"
+
+        print(f"status {status}, startup phases (s): {self.headless_supervisor.phase_timings}")
+        return status
+
+    def shutdown_a2f(self):
+        if self.headless_supervisor is not None:
+            self.headless_supervisor.stop()
+            return
+        try:
+            self.process_audio2face.kill()
+        except:
+            print("Can't kill a2f process. Was started separately?")
+
+    # ---------------- general ----------------
+    async def init_a2f(self, streaming: bool = False):
+        """
+        Starts the audio2face headless server if a2f not running and loads the (streaming) scene.
+        Concurrent callers wait for the first one instead of loading the scene twice.
+        Returns without any request if the scene was loaded on the currently running server.
+        """
+        mark_usd_file = utils.get_mark_usd_file_path(streaming)
+        if self.scene_registry.is_loaded(mark_usd_file):
+            return
+        async with self._init_lock:
+            if self.scene_registry.is_loaded(mark_usd_file):
+                return
+
+            await self.start_headless_server()
+            await self.load_scene(mark_usd_file)
+
+    @property
+    def loaded_scene(self):
+        """ The scene loaded on the currently running server, None if unknown """
+        return self.scene_registry.usd_file if self.scene_registry.is_loaded() else None
+
+    @loaded_scene.setter
+    def loaded_scene(self, usd_file_path: str):
+        if usd_file_path is None:
+            self.scene_registry.invalidate_scene()
+        else:
+            self.scene_registry.server_seen_up()
+            self.scene_registry.set_loaded(usd_file_path)
+
+    async def ensure_scene(self):
+        """ Re-checks (and if needed reloads) the scene in use, the default scene if none was loaded yet """
+        if self.scene_registry.is_loaded():
+            return
+        usd_file = self.scene_registry.usd_file
+        if usd_file is None:
+            await self.init_a2f()
+            return
+        async with self._init_lock:
+            if self.scene_registry.is_loaded():
+                return
+            await self.start_headless_server()
+            await self.load_scene(usd_file)
+
+    async def get_scene(self):
+        return await self.make_request("A2F/GetInstances")
+
+    async def load_scene(self, usd_file_path: str = ""):
+        scene = await self.get_scene()
+        instances = get_instance_paths(scene)
+        if instances and (self.scene_registry.usd_file == usd_file_path or usd_file_path in str(scene)):
+            self.scene_registry.set_loaded(usd_file_path, instances)
+            return
+
+        print(f"load scene {usd_file_path}")
+        payload = {
+            "file_name": usd_file_path
+        }
+
+        resp = await self.post("A2F/USD/Load", payload)
+        self.a2f_state.invalidate()
+        if is_ok_response(resp):
+            self.scene_registry.set_loaded(usd_file_path, get_instance_paths(await self.get_scene()))
+        else:
+            self.scene_registry.invalidate_scene()
+        return resp
+
+    async def set_frame(self, frame: int, as_timestamp: bool = False, a2f_instance: str = None):
+        a2f_instance = a2f_instance or DEFAULT_A2E_INSTANCE
+
+        payload = {
+          "a2f_instance": a2f_instance,
+          "frame": frame,
+          "as_timestamp": as_timestamp
+        }
+
+        return await self.post("A2F/Player/SetFrame", payload)
+
+    # ---------------- player ----------------
+    async def set_root_path(self, sounds_folder):
+        if os.path.isfile(sounds_folder):
+            sounds_folder = os.path.dirname(sounds_folder)
+
+        if not os.path.isabs(sounds_folder):
+            sounds_folder = os.path.join(os.getcwd(), sounds_folder)
+
+        payload = {
+            "a2f_player": DEFAULT_PLAYER_INSTANCE,
+            "dir_path": sounds_folder
+        }
+
+        return await self.post("A2F/Player/SetRootPath", payload=payload)
+
+    async def set_track(self, input_sound_path: str):
+        if not os.path.isfile(input_sound_path):
+            raise FileNotFoundError(f"File {input_sound_path} doesn't exist")
+
+        payload = {
+            "a2f_player": DEFAULT_PLAYER_INSTANCE,
+            "file_name": os.path.basename(input_sound_path),
+            "time_range": [0, -1]
+        }
+
+        return await self.post("A2F/Player/SetTrack", payload=payload)
+
+    # ---------------- export ----------------
+    async def export(
+            self,
+            output_path: str,
+            fps: int = 60,
+            format: str = "usd",
+            emotion_auto_detect: bool = False,
+            raise_on_error: bool = False
+    ):
+        """
+        Export the blend shapes to a file. See Audio2Face.export
+        """
+        if output_path is None:
+            print(f"output path is not provided, using default: {DEFAULT_OUTPUT_DIR}")
+            output_path = DEFAULT_OUTPUT_DIR
+
+        if not os.path.isabs(output_path):
+            output_path = os.path.join(os.getcwd(), output_path)
+
+        if not os.path.isdir(os.path.dirname(output_path)):
+            print(f"creating output dir: {output_path}")
+            os.makedirs(os.path.dirname(output_path), exist_ok=True)
+
+        if emotion_auto_detect:
+            await self.generate_emotion_keys()
+
+        response = await self.export_blend_shape(output_path=output_path, fps=fps, format=format)
+        if not isinstance(response, dict) or response.get('status', 'ERROR') == 'ERROR':
+            message = response.get('message') if isinstance(response, dict) else response
+            if raise_on_error:
+                raise RuntimeError(f"BlendShape Export of {output_path} failed: {message}")
+            print(f"BlendShape Export failed: {message}")
+
+        return output_path
+
+    async def export_blend_shape(self, output_path: str, fps: int = 60, format: str = "usd"):
+        payload = {
+            "solver_node": DEFAULT_SOLVER_INSTANCE,
+            "export_directory": os.path.dirname(output_path),
+            "file_name": os.path.basename(output_path),
+            "format": format,
+            "batch": False,
+            "fps": fps
+        }
+
+        return await self.post("A2F/Exporter/ExportBlendshapes", payload=payload)
+
+    # ---------------- audio2emotion ----------------
+    get_default_a2e_settings = staticmethod(_A2F_Audio2Emotion.get_default_a2e_settings)
+
+    async def a2e_set_settings(
+            self,
+            a2e_emotion_strength: float = 0.5,
+            a2e_smoothing_exp: int = 0,
+            a2e_max_emotions: int = 5,
+            a2e_contrast: float = 1.0,
+            preferred_emotion: list = None,
+            a2e_preferred_emotion_strength: float = 0.5,
+            **kwargs
+    ):
+        """
+        Sets the settings for the audio2emotion generation. See Audio2Face.a2e_set_settings
+        """
+        await self.ensure_scene()
+
+        settings = {}
+        def add_to_dict(key, value):
+            if value is not None:
+                settings[key] = value
+
+        add_to_dict("a2e_emotion_strength", a2e_emotion_strength)
+        add_to_dict("a2e_smoothing_exp", a2e_smoothing_exp)
+        add_to_dict("a2e_max_emotions", a2e_max_emotions)
+        add_to_dict("a2e_contrast", a2e_contrast)
+        add_to_dict("preferred_emotion", preferred_emotion)
+        add_to_dict("a2e_preferred_emotion_strength", a2e_preferred_emotion_strength)
+
+        self.a2e_settings.update(settings)
+        return await self.post_state("A2F/A2E/SetSettings", self.a2e_settings["a2f_instance"], settings)
+
+    async def a2e_set_settings_from_dict(self, settings: dict):
+        return await self.a2e_set_settings(**settings)
+
+    async def set_enable_auto_generate_on_track_change(
+            self, enable: bool = True, a2f_instance: str = DEFAULT_A2E_INSTANCE
+    ):
+        return await self.post_state("A2F/A2E/EnableAutoGenerateOnTrackChange", a2f_instance, {"enable": enable})
+
+    async def set_enable_streaming(self, enable: bool = True, a2f_instance: str = DEFAULT_A2E_INSTANCE):
+        return await self.post_state("A2F/A2E/EnableStreaming", a2f_instance, {"enable": enable})
+
+    async def set_emotion(
+            self,
+            amazement: float | None = 0.0,
+            anger: float | None = 0.0,
+            cheekiness: float | None = 0.0,
+            disgust: float | None = 0.0,
+            fear: float | None = 0.0,
+            grief: float | None = 0.0,
+            joy: float | None = 0.0,
+            outofbreath: float | None = 0.0,
+            pain: float | None = 0.0,
+            sadness: float | None = 0.0,
+            update_settings: bool = True
+    ):
+        """
+        Sets the emotions on a global level for the whole track. See Audio2Face.set_emotion
+        """
+        await self.ensure_scene()
+
+        self.emotion = [
+            v if v is not None else 0.0
+            for v in (amazement, anger, cheekiness, disgust, fear, grief, joy, outofbreath, pain, sadness)
+        ]
+
+        if update_settings:
+            await self.a2e_set_settings(preferred_emotion=list(self.emotion))
+
+        return await self.post_state("A2F/A2E/SetEmotion", DEFAULT_A2E_INSTANCE, {"emotion": self.emotion})
+
+    async def generate_emotion_keys(self):
+        return await self.post("A2F/A2E/GenerateKeys", payload=self.a2e_settings)
+
+    async def get_emotion_names(self):
+        return await self.make_request("A2F/A2E/GetEmotionNames")
+
+    async def get_emotion(self, frame: int = 0):
+        payload = {
+            "a2f_instance": DEFAULT_A2E_INSTANCE,
+            "as_vector": True,
+            "frame": frame,
+            "as_timestamp": False
+        }
+
+        return await self.post("A2F/A2E/GetEmotion", payload=payload)
+
+    # ---------------- streaming ----------------
+    def get_grpc_channel(self, grpc_port: int = DEFAULT_AUDIO_STREAM_GRPC_PORT, grpc_host: str = "localhost"):
+        """
+        Returns the cached grpc.aio channel to the streaming server. See Audio2Face.get_streaming_session
+        The channel is recreated if it went into TRANSIENT_FAILURE or SHUTDOWN.
+        """
+        if not streaming_installed:
+            raise ImportError(
+                "py_audio2face[streaming] is not installed. "
+                "Please install it via 'pip install py_audio2face[streaming]'"
+            )
+
+        key = (grpc_host, grpc_port)
+        channel = self.grpc_channels.get(key)
+        if channel is not None and channel.get_state() in (
+                grpc.ChannelConnectivity.TRANSIENT_FAILURE, grpc.ChannelConnectivity.SHUTDOWN
+        ):
+            print(f"gRPC channel to {grpc_host}:{grpc_port} is {channel.get_state()}. Reconnecting.")
+            channel = None
+        if channel is None:
+            channel = grpc.aio.insecure_channel(f"{grpc_host}:{grpc_port}", options=GRPC_KEEPALIVE_OPTIONS)
+            self.grpc_channels[key] = channel
+        return channel
+
+    async def close_streaming_sessions(self):
+        channels, self.grpc_channels = self.grpc_channels, {}
+        for channel in channels.values():
+            await channel.close()
+
+    async def stream_audio(
+            self,
+            audio_stream: AsyncIterator[Union[np.ndarray, bytes]],
+            samplerate: int,
+            block_until_playback_is_finished: bool = True,
+            instance_name: str = DEFAULT_AUDIO_STREAM_PLAYER_INSTANCE,
+            grpc_port: int = DEFAULT_AUDIO_STREAM_GRPC_PORT,
+            message_ms: float = DEFAULT_AUDIO_STREAM_MESSAGE_MS,
+            bytes_dtype: str = "float32",
+            target_samplerate: int | None = None
+    ) -> bool:
+        """
+        Stream audio data to the Audio2Face Streaming Audio Player with grpc.aio. See Audio2Face.stream_audio
+        The gRPC channel is kept open between calls, see get_grpc_channel.
+        :param audio_stream: async or sync iterable yielding audio chunks (numpy arrays or bytes)
+        :return: True if streaming was successful, False otherwise
+        """
+        return await self._push_audio(
+            audio_stream, samplerate, block_until_playback_is_finished, instance_name, grpc_port,
+            message_ms, bytes_dtype, target_samplerate
+        )
+
+    def stream_audio_in_background(
+            self,
+            audio_stream: AsyncIterator[Union[np.ndarray, bytes]],
+            samplerate: int,
+            block_until_playback_is_finished: bool = True,
+            instance_name: str = DEFAULT_AUDIO_STREAM_PLAYER_INSTANCE,
+            grpc_port: int = DEFAULT_AUDIO_STREAM_GRPC_PORT,
+            message_ms: float = DEFAULT_AUDIO_STREAM_MESSAGE_MS,
+            bytes_dtype: str = "float32",
+            target_samplerate: int | None = None,
+            on_progress: Callable[[StreamingProgress], None] | None = None
+    ) -> asyncio.Task:
+        """
+        Non blocking version of stream_audio. See Audio2Face.stream_audio_in_background
+        Returns an asyncio.Task (the async counterpart of StreamingHandle): task.cancel() stops the stream midway
+        (e.g. on barge-in), awaiting the task returns the success flag.
+        on_progress receives StreamingProgress events (samples sent, estimated playback position, end state).
+        """
+        return asyncio.ensure_future(self._push_audio(
+            audio_stream, samplerate, block_until_playback_is_finished, instance_name, grpc_port,
+            message_ms, bytes_dtype, target_samplerate, on_progress
+        ))
+
+    async def _push_audio(
+            self, audio_stream, samplerate, block_until_playback_is_finished, instance_name, grpc_port,
+            message_ms, bytes_dtype, target_samplerate, on_progress=None
+    ) -> bool:
+        if not streaming_installed:
+            raise ImportError(
+                "py_audio2face[streaming] is not installed. "
+                "Please install it via 'pip install py_audio2face[streaming]'"
+            )
+
+        await self.init_a2f(streaming=True)
+        channel = self.get_grpc_channel(grpc_port)
+
+        framer = PcmFramer(
+            samplerate, target_ms=message_ms, bytes_dtype=bytes_dtype, target_samplerate=target_samplerate
+        )
+        samples_sent = 0
+        first_audio_time = None
+
+        def emit(state: str, error: Exception | None = None):
+            if on_progress is None:
+                return
+            if first_audio_time is None:
+                played = 0
+            elif state == "finished":
+                played = samples_sent
+            else:
+                played = min(int((time.perf_counter() - first_audio_time) * framer.out_samplerate), samples_sent)
+            try:
+                on_progress(StreamingProgress(state, samples_sent, played, framer.out_samplerate, error))
+            except Exception as e:
+                print(f"streaming progress callback failed: {e}")
+
+        async def request_generator():
+            nonlocal samples_sent, first_audio_time
+            start_marker = audio2face_pb2.PushAudioRequestStart(
+                samplerate=framer.out_samplerate,
+                instance_name=instance_name,
+                block_until_playback_is_finished=block_until_playback_is_finished
+            )
+            yield audio2face_pb2.PushAudioStreamRequest(start_marker=start_marker)
+
+            async def chunks():
+                if hasattr(audio_stream, "__aiter__"):
+                    async for c in audio_stream:
+                        yield c
+                else:
+                    for c in audio_stream:
+                        yield c
+
+            async for chunk in chunks():
+                for data in framer.push(chunk):
+                    if first_audio_time is None:
+                        span.add_event("first_audio")
+                        first_audio_time = time.perf_counter()
+                    yield audio2face_pb2.PushAudioStreamRequest(audio_data=data)
+                    samples_sent += len(data) // 4  # float32
+                    emit("sending")
+            for data in framer.flush():
+                yield audio2face_pb2.PushAudioStreamRequest(audio_data=data)
+                samples_sent += len(data) // 4
+                emit("sending")
+
+        try:
+            with tracing.span("a2f.stream", instance=instance_name, samplerate=samplerate) as span:
+                stub = audio2face_pb2_grpc.Audio2FaceStub(channel)
+                try:
+                    response = await stub.PushAudioStream(request_generator())
+                except grpc.RpcError:
+                    self.scene_registry.server_lost()
+                    raise
+                span.set(success=response.success)
+        except asyncio.CancelledError:
+            emit("cancelled")
+            raise
+        except Exception as e:
+            emit("failed", e)
+            raise
+
+        if not response.success:
+            self.scene_registry.invalidate_scene()
+        emit("finished")
+        return response.success
+
+    # ---------------- high level ----------------
+    # the cache lookup does no I/O against the server, so the sync implementation is shared
+    get_cached_export = _A2FExport.get_cached_export
+
+    async def export_and_cache(
+            self,
+            cache_key: str | None,
+            output_path: str,
+            fps: int = 60,
+            format: str = "usd",
+            emotion_auto_detect: bool = False,
+            raise_on_error: bool = False
+    ):
+        """
+        export() and record the result in the export cache. See Audio2Face.export_and_cache
+        """
+        if cache_key is None:
+            return await self.export(
+                output_path=output_path, fps=fps, format=format,
+                emotion_auto_detect=emotion_auto_detect, raise_on_error=raise_on_error
+            )
+
+        try:
+            of = await self.export(
+                output_path=output_path, fps=fps, format=format,
+                emotion_auto_detect=emotion_auto_detect, raise_on_error=True
+            )
+        except RuntimeError as e:
+            if raise_on_error:
+                raise
+            print(e)
+            return os.path.abspath(output_path)
+
+        self.export_cache.store(cache_key, of, format)
+        return of
+
+    async def audio2face_single(
+            self,
+            audio_file_path: str,
+            output_path: str,
+            fps: int = 60,
+            emotion_auto_detect: bool = True,
+            format: str = "usd"
+    ) -> str:
+        """
+        Generate the face animation from a single audio file. See Audio2Face.audio2face_single
+        """
+        cache_key, cached = self.get_cached_export(audio_file_path, output_path, fps, format, emotion_auto_detect)
+        if cached is not None:
+            return cached
+
+        await self.init_a2f()
+
+        await self.set_root_path(audio_file_path)
+        await self.set_track(audio_file_path)
+
+        of = await self.export_and_cache(
+            cache_key, output_path=output_path, fps=fps, emotion_auto_detect=emotion_auto_detect, format=format
+        )
+        if self.export_cache is not None:
+            self.export_cache.flush()
+        return of
+
+    async def audio2face_folder(
+            self,
+            input_folder: str,
+            output_folder: str,
+            fps: int = 60,
+            emotion: bool = False,
+            format: str = "usd"
+    ) -> list:
+        """
+        Generate the face animations from all audio files in a folder. See Audio2Face.audio2face_folder
+        The files are processed one after another, because the headless player has a single track.
+        """
+        audio_files = utils.get_files_in_dir(input_folder, [".wav", ".mp3"])
+
+        output_files = []
+        initialized = False
+        for af in audio_files:
+            outfile_name = utils.get_animation_output_path(af, output_folder)
+
+            cache_key, cached = self.get_cached_export(af, outfile_name, fps, format, emotion)
+            if cached is not None:
+                output_files.append(cached)
+                continue
+
+            # the server is only needed if something has to be exported
+            if not initialized:
+                await self.init_a2f()
+                await self.set_root_path(input_folder)
+                initialized = True
+
+            await self.set_track(af)
+
+            of = await self.export_and_cache(
+                cache_key, output_path=outfile_name, fps=fps, emotion_auto_detect=emotion, format=format
+            )
+            output_files.append(of)
+
+        if self.export_cache is not None:
+            self.export_cache.flush()
+
+        return output_files
@@ -6,17 +6,24 @@ The script includes methods to
 - Export the generated animations to the unreal engine 5 scene
 """
 
-import os
+import time
 import tqdm
 
-from py_audio2face.modules.clients._http_client import _A2F_HTTP_CLIENT
+from py_audio2face.modules.clients._http_client import _A2F_HTTP_CLIENT, _A2F_HTTP_STATS
 from py_audio2face.modules._general import _A2FGeneral
 from py_audio2face.modules._player import _A2FPlayer
 from py_audio2face.modules._audio2emotion import _A2F_Audio2Emotion
 from py_audio2face.modules._export import _A2FExport
 from py_audio2face.modules._streaming import _A2F_streaming
+from py_audio2face.modules._state import _A2F_STATE_MIRROR
+from py_audio2face.modules._scene import _A2F_SCENE_REGISTRY
 
 from py_audio2face import utils
+from py_audio2face.export_cache import ExportCache
+from py_audio2face.settings import (
+    DEFAULT_HTTP_POOL_SIZE, DEFAULT_HTTP_ROUTE_TIMEOUTS, DEFAULT_HTTP_MAX_RETRIES, DEFAULT_HTTP_RETRY_BACKOFF,
+    DEFAULT_HTTP_NON_IDEMPOTENT_ROUTES
+)
 
 
 class Audio2Face(
@@ -31,40 +38,66 @@ class Audio2Face(
             self,
             api_url="http://localhost:8011",
             a2f_install_path: str = None,
-            output_dir: str = None
+            output_dir: str = None,
+            http_pool_size: int = DEFAULT_HTTP_POOL_SIZE,
+            http_timeouts: dict = None,
+            http_max_retries: int = DEFAULT_HTTP_MAX_RETRIES,
+            export_cache_dir: str = None
     ):
         """
         api_url (str): The API endpoint for Audio2Face.
-        a2f_install_path (str): Path to the Audio2Face installation directory. If its tried to get it from defualt dir
+        a2f_install_path (str): Path to the Audio2Face installation directory. If None it's tried to get it from
+            the default dir. Only needed to start the headless server, a remote or already running server works without.
         output_dir (str): Optional output directory for generated animations.
+        http_pool_size (int): Number of kept-alive connections to the headless server.
+        http_timeouts (dict): Timeouts in seconds per api route, e.g. {"A2F/USD/Load": 60}. Merged with the defaults.
+        http_max_retries (int): How often a request is retried if the connection was refused or reset. Resets of
+            non idempotent routes (self.http_non_idempotent_routes) are not retried.
+        export_cache_dir (str): If set, exports are cached there and reruns skip unchanged files.
         """
         self.api_url = api_url
         if a2f_install_path is None:
             a2f_install_path = utils.get_audio2face_install_path()
-            if a2f_install_path is None:
-                raise FileNotFoundError(
-                    "Audio2Face installation path is not provided and not found in the registry. "
-                    "Install Audio2Face and provide the installation path manually."
-                )
-        if a2f_install_path[-1] != "/":
+        if a2f_install_path is not None and a2f_install_path[-1] != "/":
             a2f_install_path += "/"
 
         self.a2f_install_path = a2f_install_path
         self.output_dir = output_dir
         self.process_audio2face = None  # process object for audio2face from subprocess
+        self.headless_supervisor = None  # watches process_audio2face if we started the server
 
-        self.loaded_scene = None  # the current loaded scene. Checked in init_a2f for not loading the same scene again
+        # keep-alive http session and the latency counters of all calls
+        self.http_session = self.create_http_session(http_pool_size)
+        self.http_timeouts = {**DEFAULT_HTTP_ROUTE_TIMEOUTS, **(http_timeouts or {})}
+        self.http_max_retries = http_max_retries
+        self.http_retry_backoff = DEFAULT_HTTP_RETRY_BACKOFF
+        self.http_non_idempotent_routes = set(DEFAULT_HTTP_NON_IDEMPOTENT_ROUTES)
+        self.http_stats = _A2F_HTTP_STATS()
+        self.file_timings = []  # [(audio_file, wall_time_s, http_time_s)] of the last audio2face_folder run
+
+        # last acknowledged instance settings, setters only send what changed
+        self.a2f_state = _A2F_STATE_MIRROR()
+
+        # server epoch and the scene loaded in it. Checked in init_a2f for not loading the same scene again
+        self.scene_registry = _A2F_SCENE_REGISTRY()
 
         # audio2emotion
         self.a2e_settings = self.get_default_a2e_settings()
+        self.emotion = None  # the emotion vector of the last set_emotion call
+
+        self.export_cache = ExportCache(export_cache_dir) if export_cache_dir else None
+
+        # (grpc_host, grpc_port, instance_name) -> StreamingSession, kept open between stream_audio calls
+        self.streaming_sessions = {}
 
     def init_a2f(self, streaming: bool = False):
         """
         Starts the audio2face headless server if a2f not running.
         Sends the arkit_resolved mark_usd_file / streaming file to the audio2face server to initialize the scene.
+        Returns without any request if the scene was loaded on the currently running server.
         """
         mark_usd_file = utils.get_mark_usd_file_path(streaming)
-        if self.loaded_scene == mark_usd_file:
+        if self.scene_registry.is_loaded(mark_usd_file):
             return
 
         self.start_headless_server()
@@ -87,12 +120,21 @@ class Audio2Face(
             default settings, use the set_emotion method.
         return: the path of the output file
         """
+        cache_key, cached = self.get_cached_export(audio_file_path, output_path, fps, format, emotion_auto_detect)
+        if cached is not None:
+            return cached
+
         self.init_a2f()
 
         self.set_root_path(audio_file_path)
         self.set_track(audio_file_path)
 
-        return self.export(output_path=output_path, fps=fps, emotion_auto_detect=emotion_auto_detect, format=format)
+        of = self.export_and_cache(
+            cache_key, output_path=output_path, fps=fps, emotion_auto_detect=emotion_auto_detect, format=format
+        )
+        if self.export_cache is not None:
+            self.export_cache.flush()
+        return of
 
     def audio2face_folder(
             self, 
@@ -110,24 +152,43 @@ class Audio2Face(
         emotion_auto_detect (bool): Whether to generate emotion_auto_detect keys from the audio files.
         :return: a list of the paths of the output files
         """
-        self.init_a2f()
-
-        self.set_root_path(input_folder)
-
         audio_files = utils.get_files_in_dir(input_folder, [".wav", ".mp3"])
 
         # iterate and convert files
         audio_files_tqdm = tqdm.tqdm(audio_files)
         output_files = []
+        self.file_timings = []
+        initialized = False
         for af in audio_files_tqdm:
             audio_files_tqdm.set_description(f"Processing {af}")
-            self.set_track(af)
+            start, http_start = time.perf_counter(), self.http_stats.total_time()
 
             # outfile name will be base file name of af_a2f_animation
-            outfile_name, ext = os.path.basename(af).rsplit(".", 1)
-            outfile_name = f"{output_folder}/{outfile_name}_a2f_animation"
+            outfile_name = utils.get_animation_output_path(af, output_folder)
+
+            cache_key, cached = self.get_cached_export(af, outfile_name, fps, format, emotion)
+            if cached is not None:
+                output_files.append(cached)
+                continue
+
+            # the server is only needed if something has to be exported
+            if not initialized:
+                self.init_a2f()
+                self.set_root_path(input_folder)
+                initialized = True
 
-            of = self.export(output_path=outfile_name, fps=fps, emotion_auto_detect=emotion, format=format)
+            self.set_track(af)
+
+            of = self.export_and_cache(
+                cache_key, output_path=outfile_name, fps=fps, emotion_auto_detect=emotion, format=format
+            )
             output_files.append(of)
+            self.file_timings.append(
+                (af, time.perf_counter() - start, self.http_stats.total_time() - http_start)
+            )
+
+        if self.export_cache is not None:
+            self.export_cache.flush()
+            print(f"export cache: {self.export_cache.stats()}")
 
         return output_files
\ No newline at end of file
@@ -0,0 +1,215 @@
+"""
+Batch lip-sync export with several audio2face headless servers at once.
+Every server (api_url) is driven by its own worker thread. Files are dealt round-robin into per worker queues;
+a worker that runs dry steals from the back of the longest other queue. A file that fails on one server is
+handed to a server that hasn't tried it yet.
+"""
+
+from __future__ import annotations
+
+import threading
+from collections import deque
+
+import tqdm
+
+from py_audio2face import utils
+from py_audio2face.audio2face import Audio2Face
+from py_audio2face.export_cache import ExportCache
+
+
+class Audio2FacePool:
+    def __init__(
+            self,
+            api_urls: list,
+            a2f_install_path: str = None,
+            max_consecutive_failures: int = 3,
+            export_cache_dir: str = None,
+            **a2f_kwargs
+    ):
+        """
+        api_urls (list): API endpoints of the headless servers, e.g. ["http://localhost:8011", "http://localhost:8012"]
+        a2f_install_path (str): Path to the Audio2Face installation directory. See Audio2Face.
+        max_consecutive_failures (int): A server is taken out of the pool after this many failed files in a row.
+        export_cache_dir (str): If set, all instances share one export cache there. See ExportCache.
+        a2f_kwargs: Further arguments for every Audio2Face instance (http_pool_size, http_timeouts, ...).
+        """
+        if len(api_urls) == 0:
+            raise ValueError("At least one api_url is needed")
+
+        self.instances = [
+            Audio2Face(api_url=api_url, a2f_install_path=a2f_install_path, **a2f_kwargs)
+            for api_url in api_urls
+        ]
+        self.max_consecutive_failures = max_consecutive_failures
+
+        self.export_cache = ExportCache(export_cache_dir) if export_cache_dir else None
+        for a2f in self.instances:
+            a2f.export_cache = self.export_cache
+
+        self._cond = threading.Condition()
+        self._queues = []  # one deque of file indices per instance
+        self._alive = []   # False once an instance was taken out of the pool
+        self._tried = {}   # file index -> set of instance indices that failed on it
+        self._in_flight = 0  # files currently processed by a worker
+        self.failed_files = []
+
+    def _pop(self, worker: int):
+        if self._queues[worker]:
+            return self._queues[worker].popleft()
+
+        # steal from the back of the longest queue; only files this worker hasn't failed on yet
+        victims = sorted(range(len(self._queues)), key=lambda i: len(self._queues[i]), reverse=True)
+        for victim in victims:
+            q = self._queues[victim]
+            for i in range(len(q) - 1, -1, -1):
+                if worker not in self._tried.get(q[i], ()):
+                    idx = q[i]
+                    del q[i]
+                    return idx
+        return None
+
+    def _next_file(self, worker: int):
+        """
+        Pops the next file index for a worker. Steals from other queues if the own one is empty.
+        Waits while other workers are busy, because their files might fail and be handed over.
+        Returns None if all work is done.
+        """
+        with self._cond:
+            while True:
+                idx = self._pop(worker)
+                if idx is not None:
+                    self._in_flight += 1
+                    return idx
+                if self._in_flight == 0:
+                    return None
+                self._cond.wait()
+
+    def _done(self):
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify_all()
+
+    def _reschedule(self, idx: int, worker: int, audio_file: str):
+        """ Hands a failed file to the alive instance with the shortest queue that hasn't tried it yet. """
+        with self._cond:
+            tried = self._tried.setdefault(idx, set())
+            tried.add(worker)
+            candidates = [
+                i for i in range(len(self._queues))
+                if self._alive[i] and i not in tried
+            ]
+            if not candidates:
+                print(f"Giving up on {audio_file}. Failed on all audio2face instances.")
+                self.failed_files.append(audio_file)
+                return False
+
+            target = min(candidates, key=lambda i: len(self._queues[i]))
+            self._queues[target].appendleft(idx)
+            self._cond.notify_all()
+            return True
+
+    def _retire(self, worker: int):
+        """ Takes an instance out of the pool and redistributes its files. """
+        with self._cond:
+            self._alive[worker] = False
+            orphans = list(self._queues[worker])
+            self._queues[worker].clear()
+
+        for idx in orphans:
+            self._reschedule(idx, worker, self._files[idx])
+
+    def _work(self, worker: int, input_folder: str, output_folder: str, fps: int, emotion: bool, format: str,
+              outputs: list, progress: tqdm.tqdm):
+        a2f = self.instances[worker]
+        try:
+            a2f.init_a2f()
+            a2f.set_root_path(input_folder)
+        except Exception as e:
+            print(f"audio2face instance {a2f.api_url} not usable: {e}")
+            self._retire(worker)
+            return
+
+        failures = 0
+        while True:
+            idx = self._next_file(worker)
+            if idx is None:
+                return
+
+            af = self._files[idx]
+            output_path = utils.get_animation_output_path(af, output_folder)
+            try:
+                cache_key, cached = a2f.get_cached_export(af, output_path, fps, format, emotion)
+                if cached is None:
+                    a2f.set_track(af)
+                    cached = a2f.export_and_cache(
+                        cache_key, output_path=output_path,
+                        fps=fps, emotion_auto_detect=emotion, format=format, raise_on_error=True
+                    )
+                outputs[idx] = cached
+                failures = 0
+                progress.update(1)
+            except Exception as e:
+                print(f"{a2f.api_url} failed on {af}: {e}")
+                failures += 1
+                retire = failures >= self.max_consecutive_failures
+                if retire:
+                    print(f"Taking {a2f.api_url} out of the pool after {failures} failures in a row")
+                    self._retire(worker)
+                if not self._reschedule(idx, worker, af):
+                    progress.update(1)
+                if retire:
+                    self._done()
+                    return
+            self._done()
+
+    def audio2face_folder(
+            self,
+            input_folder: str,
+            output_folder: str,
+            fps: int = 60,
+            emotion: bool = False,
+            format: str = "usd"
+    ) -> list:
+        """
+        Generate the face animations from all audio files in a folder, spread across all instances of the pool.
+        input_folder (str): Path to the folder containing the audio files.
+        output_folder (str): Path to the output folder for the animations.
+        fps (int): Frames per second of the output animations.
+        emotion (bool): Whether to generate emotion keys from the audio files.
+        :return: a list of the paths of the output files in the order of the input files.
+            None for files that failed on every instance (also listed in self.failed_files).
+        """
+        self._files = utils.get_files_in_dir(input_folder, [".wav", ".mp3"])
+        n_workers = len(self.instances)
+
+        self._queues = [deque(range(w, len(self._files), n_workers)) for w in range(n_workers)]
+        self._alive = [True] * n_workers
+        self._tried = {}
+        self._in_flight = 0
+        self.failed_files = []
+
+        outputs = [None] * len(self._files)
+        progress = tqdm.tqdm(total=len(self._files))
+        workers = [
+            threading.Thread(
+                target=self._work,
+                args=(w, input_folder, output_folder, fps, emotion, format, outputs, progress),
+                daemon=True
+            )
+            for w in range(n_workers)
+        ]
+        for t in workers:
+            t.start()
+        for t in workers:
+            t.join()
+        progress.close()
+
+        if self.export_cache is not None:
+            self.export_cache.flush()
+            print(f"export cache: {self.export_cache.stats()}")
+
+        return outputs
+
+    def shutdown_a2f(self):
+        for a2f in self.instances:
+            a2f.shutdown_a2f()
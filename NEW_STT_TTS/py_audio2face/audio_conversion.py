@@ -0,0 +1,214 @@
+"""
+In-process audio conversion to the format audio2face expects (mono, 44.1 kHz, 16 bit).
+Works on whole in-memory buffers and on streamed chunks. Replaces spawning ffmpeg per utterance.
+- to_mono: vectorized downmix of (samples, channels) arrays
+- PolyphaseResampler: rational resampler with windowed sinc filter taps cached per (src, dst) rate pair
+- to_float32 / to_int16: dtype conversion with scaling and clipping
+"""
+
+from __future__ import annotations
+
+import wave
+from functools import lru_cache
+from math import gcd
+
+import numpy as np
+
+A2F_SAMPLE_RATE = 44100
+INT16_SCALE = np.float32(1.0 / 32768.0)
+
+
+# ---------------- dtype ----------------
+def to_float32(audio: np.ndarray) -> np.ndarray:
+    """ int16 / int32 / uint8 / float PCM to float32 in [-1, 1] """
+    audio = np.asarray(audio)
+    if audio.dtype == np.float32:
+        return audio
+    if audio.dtype == np.int16:
+        return np.multiply(audio, INT16_SCALE, dtype=np.float32)
+    if audio.dtype == np.int32:
+        return np.multiply(audio, np.float32(1.0 / 2147483648.0), dtype=np.float32)
+    if audio.dtype == np.uint8:
+        return np.multiply(audio.astype(np.float32) - 128.0, np.float32(1.0 / 128.0), dtype=np.float32)
+    return audio.astype(np.float32)
+
+
+def to_int16(audio: np.ndarray) -> np.ndarray:
+    """ PCM of any dtype to int16. Float input is expected in [-1, 1] and clipped. """
+    audio = np.asarray(audio)
+    if audio.dtype == np.int16:
+        return audio
+    audio = to_float32(audio) * np.float32(32768.0)
+    np.rint(audio, out=audio)
+    np.clip(audio, -32768, 32767, out=audio)
+    return audio.astype(np.int16)
+
+
+# ---------------- channels ----------------
+def to_mono(audio: np.ndarray) -> np.ndarray:
+    """ Downmixes a (samples, channels) array by averaging the channels. 1-D arrays are returned as is. """
+    audio = np.asarray(audio)
+    if audio.ndim == 1:
+        return audio
+    if audio.shape[1] == 1:
+        return audio[:, 0]
+    if audio.dtype == np.int16:
+        # sum in int32 to avoid the overflow, then back to int16
+        return (audio.sum(axis=1, dtype=np.int32) // audio.shape[1]).astype(np.int16)
+    return audio.mean(axis=1, dtype=np.float32)
+
+
+# ---------------- resampling ----------------
+@lru_cache(maxsize=32)
+def _polyphase_filter(up: int, down: int, zero_crossings: int) -> np.ndarray:
+    """
+    Kaiser windowed sinc low pass designed at the upsampled rate, split into `up` phases.
+    Returns an (up, taps_per_phase) float32 array with the gain of `up` included.
+    Row p holds the taps for output phase p, ordered so that row @ x[i - taps + 1: i + 1] is the output.
+    """
+    taps_per_phase = 2 * zero_crossings * max(1, -(-down // up))
+    n = taps_per_phase * up
+    cutoff = 0.5 / max(up, down)  # cycles per upsampled sample
+    t = np.arange(n) - (n - 1) / 2
+    h = 2 * cutoff * np.sinc(2 * cutoff * t) * np.kaiser(n, 8.0)
+    h *= up / h.sum()
+    # h[p + k * up] multiplies x[i - k]  ->  reverse k so a forward dot product can be used
+    return np.ascontiguousarray(h.reshape(taps_per_phase, up).T[:, ::-1], dtype=np.float32)
+
+
+class PolyphaseResampler:
+    """
+    Streaming rational resampler (src_rate -> dst_rate). Chunks can have any length; pushing the audio in
+    chunks gives the same output as resampling it at once. The filter delay is compensated, call flush()
+    after the last chunk to get the tail.
+    """
+    def __init__(self, src_rate: int, dst_rate: int, zero_crossings: int = 8):
+        g = gcd(int(src_rate), int(dst_rate))
+        self.src_rate = src_rate
+        self.dst_rate = dst_rate
+        self.up = int(dst_rate) // g
+        self.down = int(src_rate) // g
+        self.phases = _polyphase_filter(self.up, self.down, zero_crossings)
+        self.taps = self.phases.shape[1]
+        self.delay = (self.taps * self.up - 1) // 2  # group delay in upsampled samples
+
+        # pending input; _buffer[0] is input sample number _offset. Starts with zeros as history.
+        self._buffer = np.zeros(self.taps - 1, dtype=np.float32)
+        self._offset = -(self.taps - 1)
+        self._n_in = 0
+        self._n_out = 0
+        self._window = np.arange(self.taps)
+
+    def _produce(self, n_end: int) -> np.ndarray:
+        n = np.arange(self._n_out, n_end, dtype=np.int64)
+        if len(n) == 0:
+            return np.empty(0, dtype=np.float32)
+        t = n * self.down + self.delay
+        last = t // self.up            # newest input sample of each output
+        phase = t % self.up
+        idx = (last - self._offset - (self.taps - 1))[:, None] + self._window[None, :]
+        out = np.einsum("ij,ij->i", self._buffer[idx], self.phases[phase]).astype(np.float32, copy=False)
+        self._n_out = n_end
+
+        # keep only the history the next output needs
+        next_first = (self._n_out * self.down + self.delay) // self.up - (self.taps - 1)
+        drop = max(0, min(next_first - self._offset, len(self._buffer)))
+        self._buffer = self._buffer[drop:]
+        self._offset += drop
+        return out
+
+    def process(self, chunk: np.ndarray) -> np.ndarray:
+        chunk = to_float32(chunk)
+        if self.up == self.down:
+            return chunk
+        self._buffer = np.concatenate((self._buffer, chunk))
+        self._n_in += len(chunk)
+        # outputs whose newest input sample is already available
+        n_end = max(self._n_out, (self._n_in * self.up - self.delay + self.down - 1) // self.down)
+        return self._produce(n_end)
+
+    def flush(self) -> np.ndarray:
+        if self.up == self.down:
+            return np.empty(0, dtype=np.float32)
+        n_total = -(-self._n_in * self.up // self.down)
+        if n_total <= self._n_out:
+            return np.empty(0, dtype=np.float32)
+        newest = ((n_total - 1) * self.down + self.delay) // self.up
+        pad = newest - (self._offset + len(self._buffer)) + 1
+        if pad > 0:
+            self._buffer = np.concatenate((self._buffer, np.zeros(pad, dtype=np.float32)))
+        return self._produce(n_total)
+
+
+def resample(audio: np.ndarray, src_rate: int, dst_rate: int) -> np.ndarray:
+    """ Resamples a whole mono buffer. Returns float32. """
+    if src_rate == dst_rate:
+        return to_float32(audio)
+    r = PolyphaseResampler(src_rate, dst_rate)
+    return np.concatenate((r.process(audio), r.flush()))
+
+
+# ---------------- whole buffers and streams ----------------
+def convert_buffer(audio: np.ndarray, src_rate: int, dst_rate: int = A2F_SAMPLE_RATE, dtype="int16") -> np.ndarray:
+    """ Downmix, resample and convert a whole buffer. audio is (samples,) or (samples, channels). """
+    audio = resample(to_mono(audio), src_rate, dst_rate)
+    return to_int16(audio) if np.dtype(dtype) == np.int16 else audio.astype(dtype, copy=False)
+
+
+class StreamConverter:
+    """ convert_buffer for streamed chunks. Chunks are (samples,) or (samples, channels) arrays. """
+    def __init__(self, src_rate: int, dst_rate: int = A2F_SAMPLE_RATE, dtype="int16"):
+        self.resampler = PolyphaseResampler(src_rate, dst_rate)
+        self.dtype = np.dtype(dtype)
+
+    def _out(self, audio: np.ndarray) -> np.ndarray:
+        return to_int16(audio) if self.dtype == np.int16 else audio.astype(self.dtype, copy=False)
+
+    def process(self, chunk: np.ndarray) -> np.ndarray:
+        return self._out(self.resampler.process(to_mono(chunk)))
+
+    def flush(self) -> np.ndarray:
+        return self._out(self.resampler.flush())
+
+
+# ---------------- wav files ----------------
+_WAV_DTYPES = {1: np.uint8, 2: np.int16, 4: np.int32}
+
+
+def read_wav(path) -> (np.ndarray, int):
+    """ Reads an integer PCM wav file. Returns ((samples,) or (samples, channels) array, samplerate) """
+    with wave.open(path if isinstance(path, str) else path, "rb") as wf:
+        width = wf.getsampwidth()
+        channels = wf.getnchannels()
+        rate = wf.getframerate()
+        frames = wf.readframes(wf.getnframes())
+
+    if width == 3:
+        raw = np.frombuffer(frames, dtype=np.uint8).reshape(-1, 3)
+        audio = (raw[:, 0].astype(np.int32) << 8 | raw[:, 1].astype(np.int32) << 16 | raw[:, 2].astype(np.int32) << 24)
+    elif width in _WAV_DTYPES:
+        audio = np.frombuffer(frames, dtype=_WAV_DTYPES[width])
+    else:
+        raise ValueError(f"Unsupported sample width {width} in {path}")
+
+    if channels > 1:
+        audio = audio.reshape(-1, channels)
+    return audio, rate
+
+
+def write_wav(path, audio: np.ndarray, samplerate: int):
+    """ Writes a mono or (samples, channels) buffer as 16 bit PCM wav """
+    audio = to_int16(audio)
+    channels = 1 if audio.ndim == 1 else audio.shape[1]
+    with wave.open(path if isinstance(path, str) else path, "wb") as wf:
+        wf.setnchannels(channels)
+        wf.setsampwidth(2)
+        wf.setframerate(samplerate)
+        wf.writeframes(np.ascontiguousarray(audio).tobytes())
+
+
+def convert_wav_file(input_path: str, output_path: str, dst_rate: int = A2F_SAMPLE_RATE):
+    """ Converts a wav file to mono 16 bit at dst_rate. Raises on unreadable input. """
+    audio, rate = read_wav(input_path)
+    write_wav(output_path, convert_buffer(audio, rate, dst_rate, "int16"), dst_rate)
+    return output_path
@@ -0,0 +1,176 @@
+"""
+Persistent cache for exported animations.
+An export is identified by the hash of the audio bytes and everything that changes the animation
+(a2e settings, emotion vector, fps, format). Reruns skip files whose output still exists and is unchanged.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+
+
+class ExportCache:
+    INDEX_FILE = "export_cache_index.json"
+    VERSION = 1
+
+    def __init__(self, cache_dir: str, save_every: int = 20):
+        """
+        cache_dir (str): Directory of the cache index. The animations themselves stay at their output paths.
+        save_every (int): The index is written to disk after this many new entries and on flush().
+        """
+        self.cache_dir = cache_dir
+        self.index_path = os.path.join(cache_dir, self.INDEX_FILE)
+        self.save_every = save_every
+
+        self._lock = threading.Lock()
+        self._unsaved = 0
+        self.entries = {}      # key -> {"output": path, "size": bytes, "mtime_ns": int, "created": time}
+        self.audio_hashes = {}  # abs audio path -> [size, mtime_ns, sha256], avoids rehashing unchanged files
+        self.hits = 0
+        self.misses = 0
+        self.invalidated = 0
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        if not os.path.isfile(self.index_path):
+            return
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                index = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Export cache index {self.index_path} unreadable, starting empty: {e}")
+            return
+        if index.get("version") != self.VERSION:
+            return
+        self.entries = index.get("entries", {})
+        self.audio_hashes = index.get("audio_hashes", {})
+
+    def flush(self):
+        """ Writes the index to disk (atomic replace). """
+        with self._lock:
+            index = {"version": self.VERSION, "entries": self.entries, "audio_hashes": self.audio_hashes}
+            tmp_path = f"{self.index_path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(index, f)
+            os.replace(tmp_path, self.index_path)
+            self._unsaved = 0
+
+    def hash_audio(self, audio_file_path: str) -> str:
+        """ sha256 of the audio bytes. Reuses the stored hash if size and mtime of the file didn't change. """
+        path = os.path.abspath(audio_file_path)
+        st = os.stat(path)
+        with self._lock:
+            known = self.audio_hashes.get(path)
+        if known is not None and known[0] == st.st_size and known[1] == st.st_mtime_ns:
+            return known[2]
+
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+        digest = h.hexdigest()
+
+        with self._lock:
+            self.audio_hashes[path] = [st.st_size, st.st_mtime_ns, digest]
+        return digest
+
+    def make_key(
+            self,
+            audio_file_path: str,
+            a2e_settings: dict,
+            emotion: list | None,
+            fps: int,
+            format: str,
+            emotion_auto_detect: bool
+    ) -> str:
+        settings = {
+            "audio": self.hash_audio(audio_file_path),
+            "a2e_settings": a2e_settings,
+            "emotion": emotion,
+            "fps": fps,
+            "format": format,
+            "emotion_auto_detect": bool(emotion_auto_detect),
+        }
+        return hashlib.sha256(json.dumps(settings, sort_keys=True).encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def resolve_output(output_path: str, format: str) -> str | None:
+        """ The file audio2face wrote for output_path. The exporter appends the format if no extension is given. """
+        for path in (output_path, f"{output_path}.{format}"):
+            if os.path.isfile(path):
+                return path
+        return None
+
+    def _is_valid(self, entry: dict) -> bool:
+        try:
+            st = os.stat(entry["output"])
+        except OSError:
+            return False
+        return st.st_size > 0 and st.st_size == entry["size"] and st.st_mtime_ns == entry["mtime_ns"]
+
+    def lookup(self, key: str, output_path: str, format: str) -> str | None:
+        """
+        Returns the output path if a valid export exists for the key, otherwise None.
+        If the cached animation lives at another path, it's copied to output_path.
+        """
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is not None and not self._is_valid(entry):
+                del self.entries[key]
+                self._unsaved += 1
+                self.invalidated += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+
+        cached = entry["output"]
+        output_path = os.path.abspath(output_path)
+        if self.resolve_output(output_path, format) == cached:
+            return output_path
+
+        target = output_path if os.path.splitext(output_path)[1] else f"{output_path}.{format}"
+        os.makedirs(os.path.dirname(os.path.abspath(target)), exist_ok=True)
+        shutil.copy2(cached, target)
+        return output_path
+
+    def store(self, key: str, output_path: str, format: str):
+        """ Records a finished export. Entries of older settings that wrote to the same file are dropped. """
+        output = self.resolve_output(os.path.abspath(output_path), format)
+        if output is None:
+            return
+        st = os.stat(output)
+        with self._lock:
+            stale = [k for k, e in self.entries.items() if e["output"] == output]
+            for k in stale:
+                del self.entries[k]
+            self.entries[key] = {"output": output, "size": st.st_size, "mtime_ns": st.st_mtime_ns, "created": time.time()}
+            self._unsaved += 1
+            save = self._unsaved >= self.save_every
+        if save:
+            self.flush()
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidated": self.invalidated,
+                "hit_rate": self.hits / total if total else 0.0,
+                "entries": len(self.entries)
+            }
+
+    def clear(self):
+        with self._lock:
+            self.entries = {}
+            self.audio_hashes = {}
+        self.flush()
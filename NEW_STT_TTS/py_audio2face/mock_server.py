@@ -0,0 +1,541 @@
+"""
+Local stand-in for the audio2face headless server, for tests and load tests without Omniverse.
+- REST: the routes used by Audio2Face / AsyncAudio2Face (status, GetInstances, USD/Load, Player/*, A2E/*,
+  Exporter/ExportBlendshapes) on a keep-alive http server
+- gRPC: the Audio2Face service of audio2face_pb2_grpc (PushAudio, PushAudioStream), if grpcio is installed
+- configurable latencies per route, failure injection (error response, http 500, dropped connection)
+- playback clock: streamed audio is "played" in real time, so blocking streams take as long as on a real server
+- restart(): drops the scene and all settings and resets open connections, like a restarted server
+
+Run it standalone as benchmark target:
+    python -m py_audio2face.mock_server --http-port 8011 --grpc-port 50051 --latency 0.005
+"""
+
+from __future__ import annotations
+
+import argparse
+from concurrent import futures
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import os
+import random
+import socket
+import threading
+import time
+import wave
+
+try:
+    import grpc
+    from py_audio2face.modules.clients.grpc_stub import audio2face_pb2, audio2face_pb2_grpc
+    grpc_installed = True
+except Exception as e:
+    grpc_installed = False
+
+from py_audio2face.settings import (
+    DEFAULT_A2E_INSTANCE, DEFAULT_PLAYER_INSTANCE, DEFAULT_SOLVER_INSTANCE, DEFAULT_AUDIO_STREAM_PLAYER_INSTANCE
+)
+
+EMOTION_NAMES = [
+    "amazement", "anger", "cheekiness", "disgust", "fear", "grief", "joy", "outofbreath", "pain", "sadness"
+]
+FAILURE_MODES = ("error", "http500", "disconnect")
+
+
+class _MockState:
+    """ What a freshly started headless server knows: nothing """
+    def __init__(self):
+        self.usd_file = None
+        self.instances = {}  # "fullface_instances" / "regular_instances" -> [prim paths]
+        self.root_path = ""
+        self.track = None
+        self.track_seconds = 0.0
+        self.looping = False
+        self.play_started_at = None  # perf_counter when Play was called, None while paused
+        self.position = 0.0  # seconds, position at pause / SetTime
+        self.a2e_settings = {}
+        self.emotion = [0.0] * len(EMOTION_NAMES)
+        self.a2e_streaming = {}
+        self.a2e_auto_generate = {}
+
+    def all_instances(self) -> list:
+        return [p for paths in self.instances.values() for p in paths]
+
+
+class MockAudio2FaceServer:
+    def __init__(
+            self,
+            host: str = "localhost",
+            http_port: int = 0,
+            grpc_port: int | None = 0,
+            latency: float = 0.0,
+            route_latency: dict = None,
+            jitter: float = 0.0,
+            failure_rate: float = 0.0,
+            failure_mode: str = "error",
+            playback_speed: float = 1.0,
+            seed: int = None
+    ):
+        """
+        host (str): Interface to listen on.
+        http_port (int): Port of the REST api, 0 picks a free port (see api_url).
+        grpc_port (int): Port of the gRPC service, 0 picks a free port, None disables it.
+        latency (float): Seconds every REST call takes.
+        route_latency (dict): Seconds per route, e.g. {"A2F/USD/Load": 2.0}. Overrides latency.
+        jitter (float): Latencies vary uniformly by +- this fraction.
+        failure_rate (float): Probability that a REST call (except status) fails with failure_mode.
+        failure_mode (str): "error" ({"status": "ERROR"}), "http500" or "disconnect" (connection closed).
+        playback_speed (float): Speed of the playback clock, e.g. 10 plays streamed audio 10x faster than real time.
+        seed (int): Seed of the random generator used for jitter and failures.
+        """
+        if failure_mode not in FAILURE_MODES:
+            raise ValueError(f"failure_mode must be one of {FAILURE_MODES}")
+
+        self.host = host
+        self.http_port = http_port
+        self.grpc_port = grpc_port
+        self.latency = latency
+        self.route_latency = dict(route_latency or {})
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.failure_mode = failure_mode
+        self.playback_speed = playback_speed
+
+        self.state = _MockState()
+        self._lock = threading.Lock()
+        self._random = random.Random(seed)
+        self._fail_next = {}  # route -> [modes]
+        self._counters = {}  # route -> {"calls", "failures"}
+        self._stream_stats = {"streams": 0, "samples": 0, "audio_s": 0.0, "underruns": 0, "failed": 0}
+
+        self._http_server = None
+        self._grpc_server = None
+        self._connections = set()  # open keep-alive connections, reset on stop()
+
+    # ---------------- lifecycle ----------------
+    @property
+    def api_url(self) -> str:
+        return f"http://{self.host}:{self.http_port}"
+
+    def start(self):
+        handler = type("_Handler", (_MockRequestHandler,), {"mock": self})
+        self._http_server = ThreadingHTTPServer((self.host, self.http_port), handler)
+        self._http_server.daemon_threads = True
+        self.http_port = self._http_server.server_address[1]
+        threading.Thread(target=self._http_server.serve_forever, name="a2f-mock-http", daemon=True).start()
+
+        if self.grpc_port is not None:
+            if not grpc_installed:
+                raise ImportError(
+                    "py_audio2face[streaming] is not installed. "
+                    "Please install it via 'pip install py_audio2face[streaming]' or use grpc_port=None"
+                )
+            self._grpc_server = grpc.server(futures.ThreadPoolExecutor(max_workers=8))
+            audio2face_pb2_grpc.add_Audio2FaceServicer_to_server(_MockAudio2FaceServicer(self), self._grpc_server)
+            self.grpc_port = self._grpc_server.add_insecure_port(f"{self.host}:{self.grpc_port}")
+            self._grpc_server.start()
+        return self
+
+    def stop(self):
+        if self._http_server is not None:
+            self._http_server.shutdown()
+            self._http_server.server_close()
+            self._http_server = None
+        with self._lock:
+            connections, self._connections = self._connections, set()
+        for connection in connections:
+            _reset(connection)
+        if self._grpc_server is not None:
+            self._grpc_server.stop(grace=None)
+            self._grpc_server = None
+
+    def restart(self):
+        """ Like a restarted headless server: same ports, open connections are reset, no scene, no settings """
+        self.stop()
+        with self._lock:
+            self.state = _MockState()
+        self.start()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    # ---------------- failure injection ----------------
+    def fail_next(self, api_route: str, count: int = 1, mode: str = "error"):
+        """ The next count calls of api_route fail with mode (see FAILURE_MODES) """
+        if mode not in FAILURE_MODES:
+            raise ValueError(f"mode must be one of {FAILURE_MODES}")
+        with self._lock:
+            self._fail_next.setdefault(api_route, []).extend([mode] * count)
+
+    def _failure_for(self, api_route: str):
+        with self._lock:
+            queued = self._fail_next.get(api_route)
+            if queued:
+                return queued.pop(0)
+            if api_route != "status" and self.failure_rate and self._random.random() < self.failure_rate:
+                return self.failure_mode
+        return None
+
+    def _delay_for(self, api_route: str) -> float:
+        delay = self.route_latency.get(api_route, self.latency)
+        if delay and self.jitter:
+            with self._lock:
+                delay *= 1 + self._random.uniform(-self.jitter, self.jitter)
+        return max(0.0, delay)
+
+    def _count(self, api_route: str, failed: bool):
+        with self._lock:
+            c = self._counters.setdefault(api_route, {"calls": 0, "failures": 0})
+            c["calls"] += 1
+            c["failures"] += int(failed)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "routes": {route: dict(c) for route, c in self._counters.items()},
+                "streaming": dict(self._stream_stats),
+                "usd_file": self.state.usd_file,
+            }
+
+    # ---------------- playback clock ----------------
+    def player_time(self) -> float:
+        """ Position of the (non streaming) player in seconds """
+        s = self.state
+        if s.play_started_at is None:
+            return s.position
+        t = s.position + (time.perf_counter() - s.play_started_at) * self.playback_speed
+        if s.track_seconds <= 0:
+            return t
+        if s.looping:
+            return t % s.track_seconds
+        return min(t, s.track_seconds)
+
+    # ---------------- REST routes ----------------
+    def handle(self, method: str, api_route: str, payload: dict):
+        """ returns (http status, json body) """
+        s = self.state
+
+        def ok(result=None, message=""):
+            return 200, {"status": "OK", "result": result, "message": message}
+
+        def error(message):
+            return 200, {"status": "ERROR", "result": None, "message": message}
+
+        def needs_scene():
+            return None if s.usd_file else error("No audio2face instance found. Load a scene first.")
+
+        if api_route == "status":
+            return 200, "OK"
+
+        if api_route == "A2F/GetInstances":
+            return ok({k: list(v) for k, v in s.instances.items()})
+
+        if api_route == "A2F/USD/Load":
+            usd_file = payload.get("file_name", "")
+            with self._lock:
+                s.usd_file = usd_file
+                if "streaming" in os.path.basename(usd_file):
+                    s.instances = {"fullface_instances": [DEFAULT_A2E_INSTANCE],
+                                   "regular_instances": [DEFAULT_AUDIO_STREAM_PLAYER_INSTANCE]}
+                else:
+                    s.instances = {"fullface_instances": [DEFAULT_A2E_INSTANCE],
+                                   "regular_instances": [DEFAULT_PLAYER_INSTANCE, DEFAULT_SOLVER_INSTANCE]}
+            return ok(message=f"{usd_file} loaded")
+
+        if api_route.startswith("A2F/Player/"):
+            missing = needs_scene()
+            if missing:
+                return missing
+            return self._handle_player(api_route.rsplit("/", 1)[1], payload, ok, error)
+
+        if api_route.startswith("A2F/A2E/"):
+            if api_route == "A2F/A2E/GetEmotionNames":
+                return ok(list(EMOTION_NAMES))
+            missing = needs_scene()
+            if missing:
+                return missing
+            return self._handle_a2e(api_route.rsplit("/", 1)[1], payload, ok, error)
+
+        if api_route == "A2F/Exporter/ExportBlendshapes":
+            missing = needs_scene()
+            if missing:
+                return missing
+            return self._export(payload, ok, error)
+
+        return 404, {"detail": "Not Found"}
+
+    def _handle_player(self, action: str, payload: dict, ok, error):
+        s = self.state
+        with self._lock:
+            if action == "SetRootPath":
+                s.root_path = payload.get("dir_path", "")
+                return ok()
+            if action == "GetRootPath":
+                return ok(s.root_path)
+            if action == "SetTrack":
+                s.track = payload.get("file_name")
+                s.track_seconds = _wav_seconds(os.path.join(s.root_path, s.track or ""))
+                s.position, s.play_started_at = 0.0, None
+                return ok()
+            if action == "GetCurrentTrack":
+                return ok(s.track)
+            if action == "GetTracks":
+                tracks = sorted(os.listdir(s.root_path)) if os.path.isdir(s.root_path) else []
+                return ok([t for t in tracks if t.endswith((".wav", ".mp3"))])
+            if action == "SetLooping":
+                s.looping = bool(payload.get("loop_audio", False))
+                return ok()
+            if action == "Play":
+                if s.play_started_at is None:
+                    s.play_started_at = time.perf_counter()
+                return ok()
+            if action == "Pause":
+                s.position, s.play_started_at = self.player_time(), None
+                return ok()
+            if action == "GetTime":
+                return ok(self.player_time())
+            if action in ("SetTime", "SetFrame"):
+                t = payload.get("time", payload.get("frame", 0))
+                if action == "SetFrame" and not payload.get("as_timestamp", False):
+                    t = t / 60
+                s.position = float(t)
+                if s.play_started_at is not None:
+                    s.play_started_at = time.perf_counter()
+                return ok()
+            if action == "GetRange":
+                return ok({"default": [0, s.track_seconds], "work": [0, s.track_seconds]})
+        return error(f"unknown player route {action}")
+
+    def _handle_a2e(self, action: str, payload: dict, ok, error):
+        s = self.state
+        instance = payload.get("a2f_instance", DEFAULT_A2E_INSTANCE)
+        with self._lock:
+            if action == "SetSettings":
+                s.a2e_settings.update({k: v for k, v in payload.items() if k != "a2f_instance"})
+                return ok()
+            if action == "SetEmotion":
+                emotion = payload.get("emotion", [])
+                if len(emotion) != len(EMOTION_NAMES):
+                    return error(f"emotion needs {len(EMOTION_NAMES)} values")
+                s.emotion = list(emotion)
+                return ok()
+            if action == "GetEmotion":
+                if payload.get("as_vector", True):
+                    return ok(list(s.emotion))
+                return ok(dict(zip(EMOTION_NAMES, s.emotion)))
+            if action == "EnableStreaming":
+                s.a2e_streaming[instance] = bool(payload.get("enable", True))
+                return ok()
+            if action == "EnableAutoGenerateOnTrackChange":
+                s.a2e_auto_generate[instance] = bool(payload.get("enable", True))
+                return ok()
+            if action == "GenerateKeys":
+                return ok(message="keys generated")
+        return error(f"unknown a2e route {action}")
+
+    def _export(self, payload: dict, ok, error):
+        s = self.state
+        if not s.track:
+            return error("No track set")
+        export_dir = payload.get("export_directory", "")
+        file_name = payload.get("file_name", "")
+        fmt = payload.get("format", "usd")
+        if not os.path.splitext(file_name)[1]:
+            file_name = f"{file_name}.{fmt}"
+        path = os.path.join(export_dir, file_name)
+        try:
+            os.makedirs(export_dir, exist_ok=True)
+            with open(path, "w") as f:
+                json.dump({"track": s.track, "fps": payload.get("fps", 60), "seconds": s.track_seconds}, f)
+        except OSError as e:
+            return error(str(e))
+        return ok([path])
+
+    # ---------------- gRPC ----------------
+    def play_stream(self, requests_iterator, context) -> tuple:
+        """ Consumes a PushAudioStream call and plays it on the clock. returns (success, message) """
+        def failed(message):
+            with self._lock:
+                self._stream_stats["failed"] += 1
+            return False, message
+
+        start = next(requests_iterator, None)
+        if start is None or not start.HasField("start_marker"):
+            return failed("the first message must be a start_marker")
+        marker = start.start_marker
+        if marker.instance_name not in self.state.all_instances():
+            return failed(f"instance {marker.instance_name} not found. Load the streaming scene first.")
+        if marker.samplerate <= 0:
+            return failed("samplerate must be positive")
+
+        play_until = None  # perf_counter when everything received so far is played
+        samples = 0
+        underruns = 0
+        for request in requests_iterator:
+            n = len(request.audio_data) // 4  # float32
+            now = time.perf_counter()
+            if play_until is None:
+                play_until = now
+            elif now > play_until:
+                underruns += 1  # the player ran dry before this chunk arrived
+                play_until = now
+            play_until += n / marker.samplerate / self.playback_speed
+            samples += n
+
+        if marker.block_until_playback_is_finished and play_until is not None:
+            remaining = play_until - time.perf_counter()
+            if remaining > 0 and context.is_active():
+                time.sleep(remaining)
+
+        with self._lock:
+            st = self._stream_stats
+            st["streams"] += 1
+            st["samples"] += samples
+            st["audio_s"] += samples / marker.samplerate
+            st["underruns"] += underruns
+        return True, ""
+
+
+class _MockRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real server
+    mock: MockAudio2FaceServer = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def setup(self):
+        super().setup()
+        # headers and body are written separately, without this the client waits for the delayed ack
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        with self.mock._lock:
+            self.mock._connections.add(self.connection)
+
+    def finish(self):
+        try:
+            super().finish()
+        finally:
+            with self.mock._lock:
+                self.mock._connections.discard(self.connection)
+
+    def _respond(self, method: str):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        try:
+            payload = json.loads(body) if body else {}
+        except ValueError:
+            payload = {}
+
+        api_route = self.path.split("?", 1)[0].strip("/")
+        failure = self.mock._failure_for(api_route)
+        delay = self.mock._delay_for(api_route)
+        if delay:
+            time.sleep(delay)
+
+        if failure == "disconnect":
+            self.mock._count(api_route, True)
+            self.close_connection = True
+            _reset(self.connection)
+            return
+        if failure == "http500":
+            code, response = 500, {"detail": "injected failure"}
+        elif failure == "error":
+            code, response = 200, {"status": "ERROR", "result": None, "message": "injected failure"}
+        else:
+            code, response = self.mock.handle(method, api_route, payload)
+        self.mock._count(api_route, failure is not None or code != 200)
+
+        data = json.dumps(response).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        self._respond("GET")
+
+    def do_POST(self):
+        self._respond("POST")
+
+
+if grpc_installed:
+    class _MockAudio2FaceServicer(audio2face_pb2_grpc.Audio2FaceServicer):
+        def __init__(self, mock: MockAudio2FaceServer):
+            self.mock = mock
+
+        def PushAudio(self, request, context):
+            def single():
+                yield audio2face_pb2.PushAudioStreamRequest(
+                    start_marker=audio2face_pb2.PushAudioRequestStart(
+                        instance_name=request.instance_name,
+                        samplerate=request.samplerate,
+                        block_until_playback_is_finished=request.block_until_playback_is_finished
+                    )
+                )
+                yield audio2face_pb2.PushAudioStreamRequest(audio_data=request.audio_data)
+
+            success, message = self.mock.play_stream(single(), context)
+            return audio2face_pb2.PushAudioResponse(success=success, message=message)
+
+        def PushAudioStream(self, request_iterator, context):
+            success, message = self.mock.play_stream(request_iterator, context)
+            return audio2face_pb2.PushAudioStreamResponse(success=success, message=message)
+
+
+def _reset(connection: socket.socket):
+    try:
+        connection.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
+
+
+def _wav_seconds(path: str) -> float:
+    try:
+        with wave.open(path, "rb") as w:
+            return w.getnframes() / w.getframerate()
+    except (OSError, wave.Error, EOFError):
+        return 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local mock of the audio2face headless server (REST + gRPC)")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--http-port", type=int, default=8011)
+    parser.add_argument("--grpc-port", type=int, default=50051, help="-1 disables the gRPC service")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds per REST call")
+    parser.add_argument("--load-latency", type=float, default=None, help="seconds of A2F/USD/Load")
+    parser.add_argument("--export-latency", type=float, default=None, help="seconds of ExportBlendshapes")
+    parser.add_argument("--jitter", type=float, default=0.0, help="latency variation as fraction, e.g. 0.2")
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--failure-mode", choices=FAILURE_MODES, default="error")
+    parser.add_argument("--playback-speed", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    route_latency = {}
+    if args.load_latency is not None:
+        route_latency["A2F/USD/Load"] = args.load_latency
+    if args.export_latency is not None:
+        route_latency["A2F/Exporter/ExportBlendshapes"] = args.export_latency
+
+    server = MockAudio2FaceServer(
+        host=args.host, http_port=args.http_port, grpc_port=None if args.grpc_port < 0 else args.grpc_port,
+        latency=args.latency, route_latency=route_latency, jitter=args.jitter,
+        failure_rate=args.failure_rate, failure_mode=args.failure_mode,
+        playback_speed=args.playback_speed, seed=args.seed
+    ).start()
+    print(f"mock audio2face running: rest {server.api_url}, grpc port {server.grpc_port}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+        print(json.dumps(server.stats(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -63,11 +63,8 @@ class _A2F_Audio2Emotion:
         :param preferred_emotion: List of emotion_auto_detect strengths, which is the default emotion_auto_detect
         :param a2e_preferred_emotion_strength: Strength
         """
-        # quick hack to prevent the scene to be loaded twice when setting emotions
-        # also prevents to change values if streaming is used.
-        # ToDo: find a better solution
-        if self.loaded_scene is None:
-            self.init_a2f()
+        # keeps the loaded (e.g. streaming) scene, no request if a scene is loaded on the current server
+        self.ensure_scene()
 
         settings = {}
         def add_to_dict(key, value):
@@ -82,7 +79,8 @@ class _A2F_Audio2Emotion:
         add_to_dict("a2e_preferred_emotion_strength", a2e_preferred_emotion_strength)
 
         self.a2e_settings.update(settings)
-        return self.post("A2F/A2E/SetSettings", payload=settings)
+        # only the settings that differ from the server state are sent
+        return self.post_state("A2F/A2E/SetSettings", self.a2e_settings["a2f_instance"], settings)
 
     def a2e_set_settings_from_dict(self: a2f.Audio2Face, settings: dict):
         """
@@ -94,19 +92,25 @@ class _A2F_Audio2Emotion:
 
 
     # Implement of A2F/A2E/EnableAutoGenerateOnTrackChange
-    def set_enable_auto_generate_on_track_change(self: a2f.Audio2Face, enable: bool = True):
+    def set_enable_auto_generate_on_track_change(
+            self: a2f.Audio2Face, enable: bool = True, a2f_instance: str = DEFAULT_A2E_INSTANCE
+    ):
         """
         Enable or disable the automatic generation of A2E keys on track change.
         Available settings:
             "a2f_instance": "string",
             "enable": true
+        Not sent if the instance has this value already.
         """
+        return self.post_state("A2F/A2E/EnableAutoGenerateOnTrackChange", a2f_instance, {"enable": enable})
 
-        payload = {
-            "a2f_instance": DEFAULT_A2E_INSTANCE,
-            "enable": enable
-        }
-        return self.post("A2F/A2E/EnableAutoGenerateOnTrackChange", payload=payload)
+    # Implement of A2F/A2E/EnableStreaming
+    def set_enable_streaming(self: a2f.Audio2Face, enable: bool = True, a2f_instance: str = DEFAULT_A2E_INSTANCE):
+        """
+        Enable or disable the emotion generation while audio is streamed.
+        Not sent if the instance has this value already.
+        """
+        return self.post_state("A2F/A2E/EnableStreaming", a2f_instance, {"enable": enable})
 
     # Implement of A2F/A2E/SetEmotion
     def set_emotion(
@@ -128,11 +132,8 @@ class _A2F_Audio2Emotion:
         Values are between 0..1.
         If a value is None it will be set to 0. Use get_emotion_names() to get the available emotions
         """
-        # quick hack to prevent the scene to be loaded twice when setting emotions
-        # also prevents to change values if streaming is used.
-        # ToDo: find a better solution
-        if self.loaded_scene is None:
-            self.init_a2f()
+        # keeps the loaded (e.g. streaming) scene, no request if a scene is loaded on the current server
+        self.ensure_scene()
 
         emotion_strength = {}
         def add_to_dict(emotion, value):
@@ -149,14 +150,11 @@ class _A2F_Audio2Emotion:
         add_to_dict("Pain", pain)
         add_to_dict("Sadness", sadness)
 
+        self.emotion = list(emotion_strength.values())
         if update_settings:
             self.a2e_set_settings(preferred_emotion=list(emotion_strength.values()))
 
-        payload = {
-            "a2f_instance": DEFAULT_A2E_INSTANCE,
-            "emotion": list(emotion_strength.values())
-        }
-        response = self.post("A2F/A2E/SetEmotion", payload=payload)
+        response = self.post_state("A2F/A2E/SetEmotion", DEFAULT_A2E_INSTANCE, {"emotion": self.emotion})
         return response
 
     def generate_emotion_keys(self: a2f.Audio2Face):
@@ -11,7 +11,8 @@ class _A2FExport:
             output_path: str,
             fps: int = 60,
             format: str = "usd",
-            emotion_auto_detect: bool = False
+            emotion_auto_detect: bool = False,
+            raise_on_error: bool = False
     ):
         """
         Export the blend shapes to a file.
@@ -20,6 +21,7 @@ class _A2FExport:
         :param format: Output format of the animation file.
         :param emotion_auto_detect: Whether to generate emotion_auto_detect keys from the audio.
             If a dictionary is provided, it will be used as the emotion_auto_detect settings.
+        :param raise_on_error: Raise a RuntimeError if the export failed instead of only printing it.
         """
 
         if output_path is None:
@@ -32,14 +34,17 @@ class _A2FExport:
 
         if not os.path.isdir(os.path.dirname(output_path)):
             print(f"creating output dir: {output_path}")
-            os.makedirs(os.path.dirname(output_path))
+            os.makedirs(os.path.dirname(output_path), exist_ok=True)
 
         if emotion_auto_detect:
             self.generate_emotion_keys()
 
         response = self.export_blend_shape(output_path=output_path, fps=fps, format=format)
-        if 'status' not in response or response['status'] == 'ERROR':
-            print(f"BlendShape Export failed: {response['message']}")
+        if not isinstance(response, dict) or response.get('status', 'ERROR') == 'ERROR':
+            message = response.get('message') if isinstance(response, dict) else response
+            if raise_on_error:
+                raise RuntimeError(f"BlendShape Export of {output_path} failed: {message}")
+            print(f"BlendShape Export failed: {message}")
 
         return output_path
 
@@ -54,3 +59,55 @@ class _A2FExport:
         }
 
         return self.post("A2F/Exporter/ExportBlendshapes", payload=payload)
+
+    def get_cached_export(
+            self: a2f.Audio2Face,
+            audio_file_path: str,
+            output_path: str,
+            fps: int = 60,
+            format: str = "usd",
+            emotion_auto_detect: bool = False
+    ):
+        """
+        Looks up the export of the audio file with the current emotion settings in the export cache.
+        :return: (cache key, output path). The output path is None on a cache miss, the key None without cache.
+        """
+        if self.export_cache is None:
+            return None, None
+
+        key = self.export_cache.make_key(
+            audio_file_path, self.a2e_settings, self.emotion, fps, format, emotion_auto_detect
+        )
+        return key, self.export_cache.lookup(key, output_path, format)
+
+    def export_and_cache(
+            self: a2f.Audio2Face,
+            cache_key: str | None,
+            output_path: str,
+            fps: int = 60,
+            format: str = "usd",
+            emotion_auto_detect: bool = False,
+            raise_on_error: bool = False
+    ):
+        """
+        export() and record the result in the export cache. Failed exports are never cached.
+        """
+        if cache_key is None:
+            return self.export(
+                output_path=output_path, fps=fps, format=format,
+                emotion_auto_detect=emotion_auto_detect, raise_on_error=raise_on_error
+            )
+
+        try:
+            of = self.export(
+                output_path=output_path, fps=fps, format=format,
+                emotion_auto_detect=emotion_auto_detect, raise_on_error=True
+            )
+        except RuntimeError as e:
+            if raise_on_error:
+                raise
+            print(e)
+            return os.path.abspath(output_path)
+
+        self.export_cache.store(cache_key, of, format)
+        return of
@@ -0,0 +1,101 @@
+"""
+Framing stage between an audio generator and the audio2face gRPC stream.
+Converts int16 / float64 / float32 / raw bytes chunks to float32 straight into a reusable message buffer
+and emits fixed size messages (target_ms), so small chunks don't become one gRPC message each.
+"""
+
+from __future__ import annotations
+
+from typing import Iterable, Iterator, Union
+
+import numpy as np
+
+from py_audio2face.audio_conversion import INT16_SCALE, PolyphaseResampler
+
+
+class PcmFramer:
+    def __init__(
+            self,
+            samplerate: int,
+            target_ms: float = 100,
+            bytes_dtype: Union[str, np.dtype] = np.float32,
+            target_samplerate: int | None = None
+    ):
+        """
+        samplerate (int): Sample rate of the incoming chunks.
+        target_ms (float): Length of one outgoing message in milliseconds.
+        bytes_dtype: dtype of chunks given as bytes (e.g. "int16" for raw Azure PCM).
+        target_samplerate (int): If set and different from samplerate, the audio is resampled to it.
+        """
+        self.samplerate = samplerate
+        self.out_samplerate = target_samplerate or samplerate
+        self.bytes_dtype = np.dtype(bytes_dtype)
+        self.frame_samples = max(1, int(round(self.out_samplerate * target_ms / 1000)))
+
+        self._buffer = np.empty(self.frame_samples, dtype=np.float32)
+        self._fill = 0
+        self._scratch = np.empty(0, dtype=np.float32)  # only needed when resampling
+        self._resampler = (
+            PolyphaseResampler(samplerate, self.out_samplerate) if self.out_samplerate != samplerate else None
+        )
+        self.samples_in = 0
+        self.samples_out = 0
+
+    @staticmethod
+    def _as_array(chunk, bytes_dtype: np.dtype) -> np.ndarray:
+        if isinstance(chunk, (bytes, bytearray, memoryview)):
+            return np.frombuffer(chunk, dtype=bytes_dtype)  # view, no copy
+        return np.asarray(chunk).reshape(-1)
+
+    @staticmethod
+    def _convert_into(src: np.ndarray, dst: np.ndarray):
+        """ Writes src converted to float32 into dst without temporary arrays """
+        if src.dtype == np.int16:
+            np.multiply(src, INT16_SCALE, out=dst, dtype=np.float32, casting="unsafe")
+        else:
+            np.copyto(dst, src, casting="unsafe")
+
+    def _to_float32(self, x: np.ndarray) -> np.ndarray:
+        if x.dtype == np.float32:
+            return x
+        if len(self._scratch) < len(x):
+            self._scratch = np.empty(len(x), dtype=np.float32)
+        out = self._scratch[:len(x)]
+        self._convert_into(x, out)
+        return out
+
+    def _fill_frames(self, x: np.ndarray) -> Iterator[bytes]:
+        pos, n = 0, len(x)
+        while pos < n:
+            take = min(self.frame_samples - self._fill, n - pos)
+            self._convert_into(x[pos:pos + take], self._buffer[self._fill:self._fill + take])
+            self._fill += take
+            pos += take
+            if self._fill == self.frame_samples:
+                self.samples_out += self._fill
+                self._fill = 0
+                yield self._buffer.tobytes()
+
+    def push(self, chunk: Union[np.ndarray, bytes]) -> Iterator[bytes]:
+        """ Adds a chunk and yields every message that got complete """
+        x = self._as_array(chunk, self.bytes_dtype)
+        self.samples_in += len(x)
+        if self._resampler is not None:
+            x = self._resampler.process(self._to_float32(x))
+        yield from self._fill_frames(x)
+
+    def flush(self) -> Iterator[bytes]:
+        """ Yields the remaining, shorter message """
+        if self._resampler is not None:
+            yield from self._fill_frames(self._resampler.flush())
+        if self._fill:
+            self.samples_out += self._fill
+            data = self._buffer[:self._fill].tobytes()
+            self._fill = 0
+            yield data
+
+    def frames(self, audio_stream: Iterable[Union[np.ndarray, bytes]]) -> Iterator[bytes]:
+        """ Frames a whole audio generator """
+        for chunk in audio_stream:
+            yield from self.push(chunk)
+        yield from self.flush()
@@ -1,17 +1,49 @@
 from __future__ import annotations  # avoid circular import with import py_audio2face
 import py_audio2face.audio2face as a2f
 from py_audio2face.settings import DEFAULT_A2E_INSTANCE
+from py_audio2face.modules._scene import get_instance_paths
+from py_audio2face.modules._state import is_ok_response
 
 
 class _A2FGeneral:
+    @property
+    def loaded_scene(self: a2f.Audio2Face):
+        """ The scene loaded on the currently running server, None if unknown """
+        return self.scene_registry.usd_file if self.scene_registry.is_loaded() else None
+
+    @loaded_scene.setter
+    def loaded_scene(self: a2f.Audio2Face, usd_file_path: str):
+        if usd_file_path is None:
+            self.scene_registry.invalidate_scene()
+        else:
+            self.scene_registry.server_seen_up()
+            self.scene_registry.set_loaded(usd_file_path)
+
+    def ensure_scene(self: a2f.Audio2Face):
+        """
+        Makes sure a scene is loaded on the current server. No request if it was checked recently.
+        Re-checks (and if needed reloads) the scene in use, e.g. the streaming scene, and only falls back to the
+        default scene if none was loaded yet.
+        """
+        if self.scene_registry.is_loaded():
+            return
+        usd_file = self.scene_registry.usd_file
+        if usd_file is None:
+            self.init_a2f()
+            return
+        self.start_headless_server()
+        self.load_scene(usd_file)
+
     def get_scene(self: a2f.Audio2Face):
         return self.make_request("A2F/GetInstances")
 
     def load_scene(self: a2f.Audio2Face, usd_file_path: str = ""):
         # check if the scene is already loaded
         scene = self.get_scene()
+        instances = get_instance_paths(scene)
         print("Check scene if loaded")
-        if usd_file_path in scene:
+        if instances and (self.scene_registry.usd_file == usd_file_path or usd_file_path in str(scene)):
+            self.scene_registry.set_loaded(usd_file_path, instances)
             return
 
         # load scene from file
@@ -21,7 +53,11 @@ class _A2FGeneral:
         }
 
         resp = self.post("A2F/USD/Load", payload)
-        self.loaded_scene = usd_file_path
+        self.a2f_state.invalidate()  # a new scene comes with its own settings
+        if is_ok_response(resp):
+            self.scene_registry.set_loaded(usd_file_path, get_instance_paths(self.get_scene()))
+        else:
+            self.scene_registry.invalidate_scene()  # the previous scene may be gone as well
         return resp
 
     def set_frame(self: a2f.Audio2Face, frame: int, as_timestamp: bool = False, a2f_instance: str = None):
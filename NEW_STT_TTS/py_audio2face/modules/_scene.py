@@ -0,0 +1,103 @@
+"""
+Registry of the scene loaded on the headless server.
+The status endpoint only answers "OK", so the server identity is an epoch counted by the client: it is increased
+whenever the server was seen going away (connection refused / reset, failed status check, we started a new process).
+A scene is only known to be loaded for the epoch it was loaded in. As long as the epoch doesn't change,
+init_a2f and the setters don't need a round-trip to check the scene.
+A restart between two calls can go unnoticed (the http pool silently replaces a dropped keep-alive connection),
+so the scene is checked again after check_interval seconds.
+"""
+
+from threading import Lock
+import time
+
+from py_audio2face.settings import DEFAULT_SCENE_CHECK_INTERVAL
+
+
+class _A2F_SCENE_REGISTRY:
+    def __init__(self, check_interval: float = DEFAULT_SCENE_CHECK_INTERVAL):
+        """
+        check_interval (float): Seconds a checked scene is trusted without asking the server again.
+        """
+        self.check_interval = check_interval
+        self._lock = Lock()
+        self.server_epoch = 0
+        self.server_up_since = None  # perf_counter of the first successful status check of this epoch
+        self.server_pid = None  # pid of the headless process if we started it
+        self.usd_file = None
+        self.instances = []  # instance prim paths reported by A2F/GetInstances for usd_file
+        self._scene_epoch = None
+        self._checked_at = 0.0
+
+    # ---------------- server ----------------
+    def server_seen_up(self):
+        with self._lock:
+            if self.server_up_since is None:
+                self.server_up_since = time.perf_counter()
+
+    def server_lost(self):
+        """ The server went away: a server coming back is a new epoch without a scene """
+        with self._lock:
+            if self.server_up_since is not None:
+                self.server_epoch += 1
+            self.server_up_since = None
+            self._scene_epoch = None
+
+    def server_started(self, pid: int = None):
+        self.server_lost()
+        with self._lock:
+            self.server_pid = pid
+
+    @property
+    def server_up(self) -> bool:
+        return self.server_up_since is not None
+
+    def uptime(self) -> float:
+        """ Seconds since the server of the current epoch was first seen up (0 if unknown) """
+        up_since = self.server_up_since
+        return time.perf_counter() - up_since if up_since is not None else 0.0
+
+    # ---------------- scene ----------------
+    def set_loaded(self, usd_file: str, instances: list = None):
+        with self._lock:
+            self.usd_file = usd_file
+            self.instances = list(instances or [])
+            self._scene_epoch = self.server_epoch
+            self._checked_at = time.perf_counter()
+
+    def is_loaded(self, usd_file: str = None) -> bool:
+        """ True if usd_file (or any scene, if None) was loaded on the current server and checked recently """
+        with self._lock:
+            if self.server_up_since is None or self._scene_epoch != self.server_epoch:
+                return False
+            if time.perf_counter() - self._checked_at > self.check_interval:
+                return False
+            return usd_file is None or self.usd_file == usd_file
+
+    def invalidate_scene(self):
+        """ The scene may be gone (e.g. a call on one of its instances failed), check it before the next use """
+        with self._lock:
+            self._scene_epoch = None
+
+    def summary(self) -> dict:
+        return {
+            "server_epoch": self.server_epoch,
+            "server_up": self.server_up,
+            "server_uptime_s": self.uptime(),
+            "server_pid": self.server_pid,
+            "usd_file": self.usd_file,
+            "scene_loaded": self.is_loaded(),
+            "instances": list(self.instances),
+        }
+
+
+def get_instance_paths(get_instances_response) -> list:
+    """ Flattens the result of A2F/GetInstances ({"result": {"fullface_instances": [...], ...}}) to prim paths """
+    if not isinstance(get_instances_response, dict):
+        return []
+    result = get_instances_response.get("result")
+    if isinstance(result, dict):
+        return [p for paths in result.values() if isinstance(paths, list) for p in paths]
+    if isinstance(result, list):
+        return list(result)
+    return []
@@ -0,0 +1,65 @@
+"""
+Client side mirror of the settings of the audio2face instances (A2E settings, emotion, streaming flags).
+Setters diff the requested values against the last values the server acknowledged and only send what changed.
+The mirror is dropped when the server may have lost its state: connection errors, a (re)started server,
+a newly loaded scene, or entries older than max_age_s.
+"""
+
+from threading import Lock
+import time
+
+from py_audio2face.settings import DEFAULT_A2F_STATE_MAX_AGE
+
+# returned by setters that didn't need to send anything
+UNCHANGED_RESPONSE = {"status": "OK", "result": None, "message": "unchanged, not sent"}
+
+
+def is_ok_response(response) -> bool:
+    return isinstance(response, dict) and response.get("status", "ERROR") != "ERROR"
+
+
+class _A2F_STATE_MIRROR:
+    def __init__(self, max_age_s: float = DEFAULT_A2F_STATE_MAX_AGE):
+        """
+        max_age_s (float): Known values older than this are sent again, to resync after restarts we didn't notice.
+        """
+        self.max_age_s = max_age_s
+        self._lock = Lock()
+        self._known = {}  # (api_route, a2f_instance) -> {field: value}
+        self._updated_at = {}  # (api_route, a2f_instance) -> perf_counter of the last acknowledged update
+        self.counters = {"sent": 0, "skipped": 0, "resyncs": 0}
+
+    def changes(self, api_route: str, a2f_instance: str, values: dict) -> dict:
+        """ returns the subset of values that differ from the known server state """
+        key = (api_route, a2f_instance)
+        with self._lock:
+            known = self._known.get(key)
+            if known is None or time.perf_counter() - self._updated_at[key] > self.max_age_s:
+                changed = dict(values)
+            else:
+                changed = {k: v for k, v in values.items() if k not in known or known[k] != v}
+            self.counters["sent" if changed else "skipped"] += 1
+            return changed
+
+    def commit(self, api_route: str, a2f_instance: str, values: dict):
+        """ stores values the server acknowledged """
+        key = (api_route, a2f_instance)
+        with self._lock:
+            self._known.setdefault(key, {}).update(values)
+            self._updated_at[key] = time.perf_counter()
+
+    def forget(self, api_route: str, a2f_instance: str):
+        with self._lock:
+            self._known.pop((api_route, a2f_instance), None)
+
+    def invalidate(self):
+        """ Forgets everything, the next setter calls send their full values """
+        with self._lock:
+            if self._known:
+                self.counters["resyncs"] += 1
+            self._known = {}
+            self._updated_at = {}
+
+    def summary(self) -> dict:
+        with self._lock:
+            return {**self.counters, "known": {f"{r} {i}": dict(v) for (r, i), v in self._known.items()}}
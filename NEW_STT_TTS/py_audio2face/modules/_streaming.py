@@ -6,68 +6,444 @@
 from __future__ import annotations  # avoid circular import with import py_audio2face
 import py_audio2face.audio2face as a2f
 
-from py_audio2face.settings import DEFAULT_AUDIO_STREAM_PLAYER_INSTANCE, DEFAULT_AUDIO_STREAM_GRPC_PORT
-from typing import Generator, Union
+from py_audio2face import tracing
+from py_audio2face.settings import (
+    DEFAULT_AUDIO_STREAM_PLAYER_INSTANCE, DEFAULT_AUDIO_STREAM_GRPC_PORT, DEFAULT_AUDIO_STREAM_MESSAGE_MS
+)
+from dataclasses import dataclass
+from typing import Callable, Generator, Union
+import threading
+import time
 
 try:
     import grpc
     import numpy as np
     from py_audio2face.modules.clients.grpc_stub import audio2face_pb2, audio2face_pb2_grpc
+    from py_audio2face.modules._framing import PcmFramer
     streaming_installed = True
 except Exception as e:
     streaming_installed = False
 
 
+GRPC_KEEPALIVE_OPTIONS = [
+    ("grpc.keepalive_time_ms", 10000),           # ping an idle connection every 10 s
+    ("grpc.keepalive_timeout_ms", 5000),         # and consider it dead if there's no answer within 5 s
+    ("grpc.keepalive_permit_without_calls", 1),  # also between utterances
+    ("grpc.http2.max_pings_without_data", 0),
+]
+
+
+@dataclass
+class StreamingProgress:
+    """
+    Progress event of a background stream.
+    state: "sending" while audio is pushed, "finished", "cancelled" or "failed" at the end.
+    playback_position is estimated from the wall time since the first audio message and the samplerate,
+    it never exceeds samples_sent.
+    """
+    state: str
+    samples_sent: int
+    playback_position: int
+    samplerate: int
+    error: Exception | None = None
+
+    @property
+    def seconds_sent(self) -> float:
+        return self.samples_sent / self.samplerate
+
+    @property
+    def playback_seconds(self) -> float:
+        return self.playback_position / self.samplerate
+
+
+class StreamingHandle:
+    """
+    Handle of an utterance streamed in the background (see StreamingSession.push_in_background).
+    """
+    def __init__(self, samplerate: int, on_progress: Callable[[StreamingProgress], None] | None = None):
+        self.samplerate = samplerate
+        self.on_progress = on_progress
+        self.samples_sent = 0
+        self.state = "pending"
+        self.error = None
+        self.success = None
+
+        self._first_audio_time = None
+        self._cancelled = threading.Event()
+        self._done = threading.Event()
+        self._done_callbacks = []
+        self._callbacks_lock = threading.Lock()
+        self._rpc = None
+
+    @property
+    def playback_position(self) -> int:
+        """ Estimated number of samples the player has played so far """
+        if self._first_audio_time is None:
+            return 0
+        if self.state == "finished":
+            return self.samples_sent
+        played = int((time.perf_counter() - self._first_audio_time) * self.samplerate)
+        return min(played, self.samples_sent)
+
+    def _emit(self, state: str, error: Exception | None = None):
+        self.state = state
+        if self.on_progress is None:
+            return
+        try:
+            self.on_progress(StreamingProgress(state, self.samples_sent, self.playback_position, self.samplerate, error))
+        except Exception as e:
+            print(f"streaming progress callback failed: {e}")
+
+    def _sent(self, n_samples: int):
+        if self._first_audio_time is None:
+            self._first_audio_time = time.perf_counter()
+        self.samples_sent += n_samples
+        self._emit("sending")
+
+    def _finish(self, state: str, success: bool, error: Exception | None = None):
+        self.success = success
+        self.error = error
+        self._emit(state, error)
+        with self._callbacks_lock:
+            callbacks, self._done_callbacks = self._done_callbacks, None
+        for fn in callbacks:
+            self._run_done_callback(fn)
+        self._done.set()
+
+    def _run_done_callback(self, fn):
+        try:
+            fn(self)
+        except Exception as e:
+            print(f"streaming done callback failed: {e}")
+
+    def add_done_callback(self, fn: Callable[[StreamingHandle], None]):
+        """
+        fn(handle) is called once the stream ended, before result() returns. Runs right away if already ended.
+        """
+        with self._callbacks_lock:
+            if self._done_callbacks is not None:
+                self._done_callbacks.append(fn)
+                return
+        self._run_done_callback(fn)
+
+    def cancel(self):
+        """ Stops sending audio and cancels the gRPC call. Returns immediately. """
+        self._cancelled.set()
+        if self._rpc is not None:
+            self._rpc.cancel()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    def result(self, timeout: float | None = None) -> bool:
+        """
+        Waits for the stream to end. Returns the success flag of the player.
+        Raises TimeoutError if the stream didn't end within timeout, or the error of a failed stream.
+        """
+        if not self._done.wait(timeout):
+            raise TimeoutError("stream still running")
+        if self.error is not None:
+            raise self.error
+        return bool(self.success)
+
+
+class StreamingSession:
+    """
+    A long lived gRPC channel to the audio2face streaming player.
+    Many utterances can be pushed over the same session; each push sends its own start marker.
+    The channel is recreated on the next push if it went into TRANSIENT_FAILURE or SHUTDOWN.
+    """
+    def __init__(
+            self,
+            grpc_host: str = "localhost",
+            grpc_port: int = DEFAULT_AUDIO_STREAM_GRPC_PORT,
+            instance_name: str = DEFAULT_AUDIO_STREAM_PLAYER_INSTANCE
+    ):
+        if not streaming_installed:
+            raise ImportError(
+                "py_audio2face[streaming] is not installed. "
+                "Please install it via 'pip install py_audio2face[streaming]'"
+            )
+
+        self.url = f"{grpc_host}:{grpc_port}"
+        self.instance_name = instance_name
+        self.utterances = 0
+
+        self._lock = threading.Lock()  # the streaming player plays one utterance at a time
+        self._state = None
+        self.channel = None
+        self.stub = None
+        self._connect()
+
+    def _connect(self):
+        self.channel = grpc.insecure_channel(self.url, options=GRPC_KEEPALIVE_OPTIONS)
+        self.channel.subscribe(self._on_state_change, try_to_connect=True)
+        self.stub = audio2face_pb2_grpc.Audio2FaceStub(self.channel)
+
+    def _on_state_change(self, state):
+        self._state = state
+
+    def _ensure_healthy(self):
+        if self._state in (grpc.ChannelConnectivity.TRANSIENT_FAILURE, grpc.ChannelConnectivity.SHUTDOWN):
+            print(f"gRPC channel to {self.url} is {self._state}. Reconnecting.")
+            self.close()
+            self._connect()
+
+    def wait_ready(self, timeout: float = 10) -> bool:
+        """ Blocks until the channel is connected. Returns False on timeout. """
+        try:
+            grpc.channel_ready_future(self.channel).result(timeout=timeout)
+            return True
+        except grpc.FutureTimeoutError:
+            return False
+
+    def request_generator(
+            self,
+            framer: PcmFramer,
+            audio_stream,
+            block_until_playback_is_finished: bool,
+            handle: StreamingHandle | None = None
+    ):
+        # Send start marker
+        start_marker = audio2face_pb2.PushAudioRequestStart(
+            samplerate=framer.out_samplerate,
+            instance_name=self.instance_name,
+            block_until_playback_is_finished=block_until_playback_is_finished
+        )
+        yield audio2face_pb2.PushAudioStreamRequest(start_marker=start_marker)
+
+        # Stream audio data as float32 messages of message_ms
+        for data in framer.frames(audio_stream):
+            if handle is not None:
+                if handle.cancelled:
+                    return
+                handle._sent(len(data) // 4)
+            yield audio2face_pb2.PushAudioStreamRequest(audio_data=data)
+
+    def push(
+            self,
+            audio_stream: Generator[Union[np.ndarray, bytes], None, None],
+            samplerate: int,
+            block_until_playback_is_finished: bool = True,
+            message_ms: float = DEFAULT_AUDIO_STREAM_MESSAGE_MS,
+            bytes_dtype: str = "float32",
+            target_samplerate: int | None = None
+    ) -> bool:
+        """
+        Streams one utterance. See Audio2Face.stream_audio for the parameters.
+        :return: True if streaming was successful, False otherwise
+        """
+        framer = PcmFramer(
+            samplerate, target_ms=message_ms, bytes_dtype=bytes_dtype, target_samplerate=target_samplerate
+        )
+        with self._lock:
+            self._ensure_healthy()
+            response = self.stub.PushAudioStream(
+                self.request_generator(framer, audio_stream, block_until_playback_is_finished)
+            )
+            self.utterances += 1
+            return response.success
+
+    def push_in_background(
+            self,
+            audio_stream: Generator[Union[np.ndarray, bytes], None, None],
+            samplerate: int,
+            block_until_playback_is_finished: bool = True,
+            message_ms: float = DEFAULT_AUDIO_STREAM_MESSAGE_MS,
+            bytes_dtype: str = "float32",
+            target_samplerate: int | None = None,
+            on_progress: Callable[[StreamingProgress], None] | None = None,
+            progress_interval: float = 0.1
+    ) -> StreamingHandle:
+        """
+        Streams one utterance without blocking the caller.
+        on_progress is called from a worker thread with a StreamingProgress for every sent message,
+        every progress_interval seconds while the player is still busy and once at the end.
+        :return: a StreamingHandle to cancel the stream or wait for its result
+        """
+        framer = PcmFramer(
+            samplerate, target_ms=message_ms, bytes_dtype=bytes_dtype, target_samplerate=target_samplerate
+        )
+        handle = StreamingHandle(framer.out_samplerate, on_progress)
+
+        def run():
+            try:
+                with self._lock:
+                    if handle.cancelled:
+                        handle._finish("cancelled", False)
+                        return
+                    self._ensure_healthy()
+                    handle._rpc = self.stub.PushAudioStream.future(
+                        self.request_generator(framer, audio_stream, block_until_playback_is_finished, handle)
+                    )
+                    if handle.cancelled:  # cancelled while the call was created
+                        handle._rpc.cancel()
+
+                    # report the estimated playback position while the player is busy
+                    while True:
+                        try:
+                            response = handle._rpc.result(timeout=progress_interval)
+                            break
+                        except grpc.FutureTimeoutError:
+                            handle._emit("sending")
+                    self.utterances += 1
+                handle._finish("finished", response.success)
+            except grpc.FutureCancelledError:
+                handle._finish("cancelled", False)
+            except Exception as e:
+                if handle.cancelled:
+                    handle._finish("cancelled", False)
+                else:
+                    handle._finish("failed", False, e)
+
+        threading.Thread(target=run, daemon=True).start()
+        return handle
+
+    def close(self):
+        if self.channel is not None:
+            self.channel.unsubscribe(self._on_state_change)
+            self.channel.close()
+            self.channel = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def _first_audio_marked(audio_stream, span):
+    """ adds the event "first_audio" to the span when the sender thread takes the first chunk """
+    first = True
+    for chunk in audio_stream:
+        if first:
+            span.add_event("first_audio")
+            first = False
+        yield chunk
+
+
 class _A2F_streaming:
 
+    def get_streaming_session(
+            self: a2f.Audio2Face,
+            instance_name: str = DEFAULT_AUDIO_STREAM_PLAYER_INSTANCE,
+            grpc_port: int = DEFAULT_AUDIO_STREAM_GRPC_PORT,
+            grpc_host: str = "localhost"
+    ) -> StreamingSession:
+        """
+        Returns the cached StreamingSession for the player instance. The streaming scene is loaded when the
+        session is created and again only if the server was restarted (see scene_registry).
+        """
+        key = (grpc_host, grpc_port, instance_name)
+        session = self.streaming_sessions.get(key)
+        if session is None and not streaming_installed:
+            raise ImportError(
+                "py_audio2face[streaming] is not installed. "
+                "Please install it via 'pip install py_audio2face[streaming]'"
+            )
+
+        self.init_a2f(streaming=True)  # no request while the scene is loaded on the current server
+        if session is None:
+            session = StreamingSession(grpc_host=grpc_host, grpc_port=grpc_port, instance_name=instance_name)
+            self.streaming_sessions[key] = session
+        return session
+
+    def stream_audio_in_background(
+            self: a2f.Audio2Face,
+            audio_stream: Generator[Union[np.ndarray, bytes], None, None],
+            samplerate: int,
+            block_until_playback_is_finished: bool = True,
+            instance_name: str = DEFAULT_AUDIO_STREAM_PLAYER_INSTANCE,
+            grpc_port: int = DEFAULT_AUDIO_STREAM_GRPC_PORT,
+            message_ms: float = DEFAULT_AUDIO_STREAM_MESSAGE_MS,
+            bytes_dtype: str = "float32",
+            target_samplerate: int | None = None,
+            on_progress: Callable[[StreamingProgress], None] | None = None
+    ) -> StreamingHandle:
+        """
+        Non blocking version of stream_audio. Returns a StreamingHandle immediately.
+        handle.cancel() stops the stream midway (e.g. on barge-in), handle.result() waits for the end.
+        on_progress receives StreamingProgress events (samples sent, estimated playback position, end state).
+        """
+        session = self.get_streaming_session(instance_name=instance_name, grpc_port=grpc_port)
+        # the span is started here to join the caller's turn and ended by the worker thread
+        span = tracing.start_span("a2f.stream", instance=instance_name, samplerate=samplerate, background=True)
+        if span is not tracing.NOOP_SPAN:
+            audio_stream = _first_audio_marked(audio_stream, span)
+        handle = session.push_in_background(
+            audio_stream, samplerate,
+            block_until_playback_is_finished=block_until_playback_is_finished,
+            message_ms=message_ms, bytes_dtype=bytes_dtype, target_samplerate=target_samplerate,
+            on_progress=on_progress
+        )
+
+        def stream_ended(handle: StreamingHandle):
+            # same bookkeeping as stream_audio
+            if isinstance(handle.error, grpc.RpcError):
+                self.scene_registry.server_lost()
+            elif handle.state != "cancelled" and not handle.success:
+                self.scene_registry.invalidate_scene()
+            if handle.error is not None:
+                span.record_error(handle.error)
+            span.set(success=bool(handle.success), state=handle.state, samples_sent=handle.samples_sent)
+            span.end()
+
+        handle.add_done_callback(stream_ended)
+        return handle
+
+    def close_streaming_sessions(self: a2f.Audio2Face):
+        for session in self.streaming_sessions.values():
+            session.close()
+        self.streaming_sessions = {}
+
     def stream_audio(
-            self: a2f,
+            self: a2f.Audio2Face,
             audio_stream: Generator[Union[np.ndarray, bytes], None, None],
             samplerate: int,
             block_until_playback_is_finished: bool = True,
             instance_name: str = DEFAULT_AUDIO_STREAM_PLAYER_INSTANCE,
-            grpc_port: int = DEFAULT_AUDIO_STREAM_GRPC_PORT
-    ) -> (list, bool):
+            grpc_port: int = DEFAULT_AUDIO_STREAM_GRPC_PORT,
+            message_ms: float = DEFAULT_AUDIO_STREAM_MESSAGE_MS,
+            bytes_dtype: str = "float32",
+            target_samplerate: int | None = None
+    ) -> bool:
         """
         Stream audio data to Audio2Face Streaming Audio Player.
+        The gRPC channel is kept open between calls, see get_streaming_session.
 
         :param audio_stream: Generator yielding audio chunks (numpy arrays or bytes)
         :param samplerate: Sampling rate of the audio data
         :param block_until_playback_is_finished: If True, blocks until playback is finished
         :param instance_name: Prim path of the Audio2Face Streaming Audio Player
         :param grpc_port: Port of the gRPC server
+        :param message_ms: Chunks are coalesced into gRPC messages of this length in milliseconds
+        :param bytes_dtype: dtype of chunks given as bytes, e.g. "int16" for raw 16 bit PCM
+        :param target_samplerate: If set, the audio is resampled to this rate before sending
         :return: True if streaming was successful, False otherwise
         """
-        if not streaming_installed:
-            raise ImportError(
-                "py_audio2face[streaming] is not installed. "
-                "Please install it via 'pip install py_audio2face[streaming]'"
-            )
-
-        self.init_a2f(streaming=True)
-        url = f"localhost:{grpc_port}"
-
-        with grpc.insecure_channel(url) as channel:
-            stub = audio2face_pb2_grpc.Audio2FaceStub(channel)
-
-            def request_generator():
-                # Send start marker
-                start_marker = audio2face_pb2.PushAudioRequestStart(
-                    samplerate=samplerate,
-                    instance_name=instance_name,
-                    block_until_playback_is_finished=block_until_playback_is_finished
+        session = self.get_streaming_session(instance_name=instance_name, grpc_port=grpc_port)
+        with tracing.span("a2f.stream", instance=instance_name, samplerate=samplerate) as span:
+            if span is not tracing.NOOP_SPAN:
+                audio_stream = _first_audio_marked(audio_stream, span)
+            try:
+                success = session.push(
+                    audio_stream, samplerate,
+                    block_until_playback_is_finished=block_until_playback_is_finished,
+                    message_ms=message_ms, bytes_dtype=bytes_dtype, target_samplerate=target_samplerate
                 )
-                yield audio2face_pb2.PushAudioStreamRequest(start_marker=start_marker)
+            except grpc.RpcError:
+                self.scene_registry.server_lost()
+                raise
+            span.set(success=success)
 
-                # Stream audio data
-                for i, chunk in enumerate(audio_stream):
-                    if isinstance(chunk, np.ndarray):
-                        chunk = chunk.astype(np.float32).tobytes()
-                    res = audio2face_pb2.PushAudioStreamRequest(audio_data=chunk)
-                    yield res
-
-            response = stub.PushAudioStream(request_generator())
-            return response.success
+        if not success:
+            # e.g. the player instance is gone, the scene is checked again before the next stream
+            self.scene_registry.invalidate_scene()
+        return success
 
     #def stream_audio(
     #        self: a2f,
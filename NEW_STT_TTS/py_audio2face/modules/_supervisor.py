@@ -0,0 +1,232 @@
+"""
+Supervisor of the audio2face headless server process.
+- portable launch: audio2face_headless.bat on Windows, audio2face_headless.sh elsewhere
+- stdout/stderr are captured line by line, kept in a ring buffer and optionally written to a log file
+- startup phases are recognized from the log lines (see DEFAULT_HEADLESS_LOG_PHASES) and timed
+- readiness: a ready log line triggers the status check, polling is only the fallback for unknown log formats
+- a crashed server is restarted automatically
+"""
+
+from collections import deque
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+
+import requests
+
+from py_audio2face.settings import (
+    DEFAULT_HEADLESS_LOG_PHASES, DEFAULT_HEADLESS_READY_PHASES, DEFAULT_HEADLESS_STATUS_POLL_INTERVAL,
+    DEFAULT_HEADLESS_MAX_RESTARTS
+)
+
+
+def get_headless_launcher(a2f_install_path: str) -> str:
+    """ returns the path of the headless start script of the installation """
+    script = "audio2face_headless.bat" if sys.platform == "win32" else "audio2face_headless.sh"
+    launcher = os.path.join(a2f_install_path, script)
+    if not os.path.isfile(launcher):
+        raise ValueError(f"{script} not found in {a2f_install_path}. Is audio2face installed?")
+    return launcher
+
+
+class HeadlessSupervisor:
+    def __init__(
+            self,
+            launcher: str,
+            api_url: str = "http://localhost:8011",
+            auto_restart: bool = True,
+            on_started=None,
+            log_path: str = None,
+            echo: bool = False,
+            log_lines: int = 500,
+            poll_interval: float = DEFAULT_HEADLESS_STATUS_POLL_INTERVAL,
+            max_restarts: int = DEFAULT_HEADLESS_MAX_RESTARTS,
+            restart_backoff: float = 1.0
+    ):
+        """
+        launcher (str): Start script of the headless server, see get_headless_launcher.
+        api_url (str): REST endpoint of the server, used for the status check.
+        auto_restart (bool): Restart the server if it exits without stop() being called.
+        on_started (callable): Called with the pid after every (re)start, e.g. to drop cached server state.
+        log_path (str): If set, the server output is appended to this file.
+        echo (bool): Print the server output.
+        log_lines (int): Number of output lines kept in memory (self.log).
+        poll_interval (float): Seconds between status checks while no ready line was seen.
+        max_restarts (int): Restarts in a row without reaching readiness before giving up.
+        restart_backoff (float): Seconds to wait before a restart, doubled for every restart in a row (max. 30).
+        """
+        self.launcher = launcher
+        self.api_url = api_url
+        self.auto_restart = auto_restart
+        self.on_started = on_started
+        self.log_path = log_path
+        self.echo = echo
+        self.poll_interval = poll_interval
+        self.max_restarts = max_restarts
+        self.restart_backoff = restart_backoff
+
+        self.process = None
+        self.log = deque(maxlen=log_lines)
+        self.phase_timings = {}  # phase -> seconds since the launch of the current process
+        self.starts = []  # [{"pid", "phase_timings", "exit_code"}] of all launches
+        self.restarts = 0
+
+        self._phases = {
+            name: re.compile(pattern, re.IGNORECASE) for name, pattern in DEFAULT_HEADLESS_LOG_PHASES.items()
+        }
+        self._lock = threading.Lock()
+        self._launched_at = None
+        self._log_ready = threading.Event()
+        self.ready = threading.Event()
+        self._stopping = False
+        self._failed_restarts = 0
+
+    # ---------------- process ----------------
+    def start(self) -> subprocess.Popen:
+        """ Launches the server and starts watching it. Returns immediately, see wait_ready. """
+        self._stopping = False
+        self._spawn()
+        threading.Thread(target=self._monitor, name="a2f-supervisor", daemon=True).start()
+        return self.process
+
+    def _spawn(self):
+        creationflags = getattr(subprocess, "CREATE_NEW_PROCESS_GROUP", 0)  # windows only
+        with self._lock:
+            self.ready.clear()
+            self._log_ready.clear()
+            self.phase_timings = {}
+            self._launched_at = time.perf_counter()
+            self.process = subprocess.Popen(
+                [self.launcher],
+                cwd=os.path.dirname(self.launcher) or None,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                universal_newlines=True,
+                errors="replace",
+                bufsize=1,
+                creationflags=creationflags
+            )
+            self._mark("spawned")
+            self.starts.append({"pid": self.process.pid, "phase_timings": self.phase_timings, "exit_code": None})
+
+        threading.Thread(
+            target=self._read_output, args=(self.process,), name="a2f-server-output", daemon=True
+        ).start()
+        if self.on_started is not None:
+            self.on_started(self.process.pid)
+
+    def _monitor(self):
+        while True:
+            process = self.process
+            exit_code = process.wait()
+            with self._lock:
+                self.starts[-1]["exit_code"] = exit_code
+            if self._stopping or not self.auto_restart:
+                return
+
+            if self.ready.is_set():
+                self._failed_restarts = 0
+            self._failed_restarts += 1
+            if self._failed_restarts > self.max_restarts:
+                print(f"audio2face exited {self.max_restarts} times in a row before it was ready. Giving up.")
+                return
+
+            print(f"audio2face exited with code {exit_code}. Restarting. Last output:")
+            for line in list(self.log)[-10:]:
+                print("   ", line)
+            time.sleep(min(self.restart_backoff * 2 ** (self._failed_restarts - 1), 30))
+            if self._stopping:
+                return
+            self.restarts += 1
+            self._spawn()
+            self.wait_ready()
+
+    def stop(self, timeout: float = 10):
+        """ Stops the server without restarting it """
+        self._stopping = True
+        process = self.process
+        if process is None or process.poll() is not None:
+            return
+        process.terminate()
+        try:
+            process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+    @property
+    def running(self) -> bool:
+        return self.process is not None and self.process.poll() is None
+
+    # ---------------- output ----------------
+    def _mark(self, phase: str):
+        if phase not in self.phase_timings:
+            self.phase_timings[phase] = time.perf_counter() - self._launched_at
+
+    def _read_output(self, process: subprocess.Popen):
+        log_file = open(self.log_path, "a", encoding="utf-8") if self.log_path else None
+        try:
+            for line in process.stdout:
+                line = line.rstrip()
+                self.log.append(line)
+                if log_file is not None:
+                    log_file.write(line + "\n")
+                    log_file.flush()
+                if self.echo:
+                    print("[audio2face]", line)
+                if process is self.process:
+                    self._parse(line)
+        finally:
+            if log_file is not None:
+                log_file.close()
+
+    def _parse(self, line: str):
+        with self._lock:
+            self._mark("first_output")
+            for phase, pattern in self._phases.items():
+                if phase not in self.phase_timings and pattern.search(line):
+                    self._mark(phase)
+                    if phase in DEFAULT_HEADLESS_READY_PHASES:
+                        self._log_ready.set()
+
+    # ---------------- readiness ----------------
+    def check_status(self) -> bool:
+        try:
+            return requests.get(f"{self.api_url}/status", timeout=2).json() == "OK"
+        except Exception:
+            return False
+
+    def wait_ready(self, timeout: float = 60) -> bool:
+        """
+        Blocks until the server answers the status check. The check runs as soon as a ready line was logged
+        and every poll_interval seconds otherwise. Returns False on timeout or if the process exited.
+        """
+        deadline = time.perf_counter() + timeout
+        while not self.ready.is_set():
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0 or (self.process is not None and self.process.poll() is not None):
+                return False
+
+            if self._log_ready.is_set():
+                time.sleep(min(0.1, remaining))  # ready line seen, the http service is about to come up
+            else:
+                self._log_ready.wait(min(self.poll_interval, remaining))
+
+            if self.check_status():
+                with self._lock:
+                    self._mark("status_ok")
+                self.ready.set()
+        return True
+
+    def summary(self) -> dict:
+        with self._lock:
+            return {
+                "pid": self.process.pid if self.process is not None else None,
+                "running": self.running,
+                "ready": self.ready.is_set(),
+                "restarts": self.restarts,
+                "phase_timings": dict(self.phase_timings),
+                "starts": [dict(s, phase_timings=dict(s["phase_timings"])) for s in self.starts],
+            }
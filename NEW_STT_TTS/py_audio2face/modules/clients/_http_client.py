@@ -1,18 +1,133 @@
 from __future__ import annotations  # avoid circular import with import py_audio2face
 import py_audio2face.audio2face as a2f
 
-from subprocess import Popen, CREATE_NEW_CONSOLE
+from threading import Lock
 import time
 import requests
-import os
 from requests import JSONDecodeError
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ConnectTimeoutError
+
+from py_audio2face import tracing
+from py_audio2face.modules._state import UNCHANGED_RESPONSE, is_ok_response
+from py_audio2face.modules._supervisor import HeadlessSupervisor, get_headless_launcher
+from py_audio2face.settings import DEFAULT_HTTP_POOL_SIZE, DEFAULT_HTTP_TIMEOUT, DEFAULT_HEADLESS_STARTUP_TIMEOUT
+
+
+def is_connect_error(e: requests.exceptions.ConnectionError) -> bool:
+    """ True if the request never reached the server (connection refused / connect timeout) """
+    if isinstance(e, requests.exceptions.ConnectTimeout):
+        return True
+    reason = e.args[0] if e.args else None
+    reason = getattr(reason, "reason", reason)  # urllib3's MaxRetryError wraps the cause
+    return isinstance(reason, ConnectTimeoutError)  # NewConnectionError (refused) is a ConnectTimeoutError
+
+
+class _A2F_HTTP_STATS:
+    """
+    Per route latency counters of the http client.
+    total_s is the wall time of the call including retries, server_s the time until the response headers arrived
+    (requests' response.elapsed). The difference is the client side overhead (connection setup, json decoding, ...).
+    """
+    def __init__(self):
+        self._lock = Lock()
+        self.routes = {}
+
+    def record(self, api_route: str, total_s: float, server_s: float = 0.0, retries: int = 0, error: bool = False):
+        with self._lock:
+            r = self.routes.setdefault(
+                api_route, {"calls": 0, "errors": 0, "retries": 0, "total_s": 0.0, "server_s": 0.0, "max_s": 0.0}
+            )
+            r["calls"] += 1
+            r["errors"] += int(error)
+            r["retries"] += retries
+            r["total_s"] += total_s
+            r["server_s"] += server_s
+            r["max_s"] = max(r["max_s"], total_s)
+
+    def total_time(self) -> float:
+        """ Summed wall time of all http calls in seconds """
+        with self._lock:
+            return sum(r["total_s"] for r in self.routes.values())
+
+    def summary(self) -> dict:
+        """ returns {route: {calls, errors, retries, total_s, server_s, mean_ms, max_ms}} """
+        with self._lock:
+            return {
+                route: {
+                    **r,
+                    "mean_ms": 1000 * r["total_s"] / r["calls"] if r["calls"] else 0.0,
+                    "max_ms": 1000 * r["max_s"]
+                }
+                for route, r in self.routes.items()
+            }
+
+    def reset(self):
+        with self._lock:
+            self.routes = {}
 
 
 class _A2F_HTTP_CLIENT:
-    def make_request(self: a2f.Audio2Face, api_route):
+    def create_http_session(self: a2f.Audio2Face, pool_size: int = DEFAULT_HTTP_POOL_SIZE) -> requests.Session:
+        """
+        Creates the keep-alive session used for all calls to the headless server.
+        pool_size (int): max. number of kept-alive connections to the server.
+        """
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def get_timeout(self: a2f.Audio2Face, api_route: str) -> float:
+        return self.http_timeouts.get(api_route, DEFAULT_HTTP_TIMEOUT)
+
+    def is_idempotent(self: a2f.Audio2Face, method: str, api_route: str) -> bool:
+        """ True if sending the request twice does no harm (see DEFAULT_HTTP_NON_IDEMPOTENT_ROUTES) """
+        return method == "GET" or api_route not in self.http_non_idempotent_routes
+
+    def _send(self: a2f.Audio2Face, method: str, api_route: str, payload=None, retries: int = None):
+        """
+        Sends a request with the pooled session. Connection errors are retried with exponential backoff:
+        a refused connection always, a reset after the request was sent only for idempotent routes (the server may
+        have run it already, the caller decides). Every call is recorded in self.http_stats and traced as
+        span "a2f.rest". Raises the last exception if the request failed.
+        """
+        url = f"{self.api_url}/{api_route}"
+        retries = self.http_max_retries if retries is None else retries
+        start = time.perf_counter()
+        attempt = 0
+        with tracing.span("a2f.rest", route=api_route, method=method) as span:
+            try:
+                while True:
+                    try:
+                        response = self.http_session.request(
+                            method, url, json=payload, timeout=self.get_timeout(api_route)
+                        )
+                        break
+                    except requests.exceptions.ConnectionError as e:
+                        # refused or reset: the server may have been restarted and lost its scene and settings
+                        self.a2f_state.invalidate()
+                        self.scene_registry.server_lost()
+                        if attempt >= retries or not (is_connect_error(e) or self.is_idempotent(method, api_route)):
+                            raise
+                        time.sleep(self.http_retry_backoff * 2 ** attempt)
+                        attempt += 1
+            except Exception:
+                self.http_stats.record(api_route, time.perf_counter() - start, retries=attempt, error=True)
+                span.set(retries=attempt)
+                raise
+
+            self.http_stats.record(
+                api_route, time.perf_counter() - start, response.elapsed.total_seconds(), retries=attempt
+            )
+            span.set(status_code=response.status_code, retries=attempt)
+        return response
+
+    def make_request(self: a2f.Audio2Face, api_route, retries: int = None):
         url = f"{self.api_url}/{api_route}"
         try:
-            response = requests.get(url)
+            response = self._send("GET", api_route, retries=retries)
             res = response.json()
         except Exception as e:
             res = str(e)
@@ -25,7 +140,7 @@ class _A2F_HTTP_CLIENT:
         url = f"{self.api_url}/{api_route}"
         res = None
         try:
-            response = requests.post(url, json=payload, headers="")
+            response = self._send("POST", api_route, payload=payload)
             res = response.json()
         except JSONDecodeError as e:
             print(f"Response of API {url} is not JSON format. Intended?")
@@ -35,39 +150,79 @@ class _A2F_HTTP_CLIENT:
 
         return res
 
+    def post_state(self: a2f.Audio2Face, api_route: str, a2f_instance: str, values: dict):
+        """
+        Posts {"a2f_instance": a2f_instance, **values} but only the values that differ from the state the
+        server acknowledged before (see self.a2f_state). Returns UNCHANGED_RESPONSE if nothing had to be sent.
+        """
+        changed = self.a2f_state.changes(api_route, a2f_instance, values)
+        if not changed:
+            return dict(UNCHANGED_RESPONSE)
 
-    def start_headless_server(self: a2f.Audio2Face):
+        res = self.post(api_route, payload={"a2f_instance": a2f_instance, **changed})
+        if is_ok_response(res):
+            self.a2f_state.commit(api_route, a2f_instance, changed)
+        else:
+            self.a2f_state.forget(api_route, a2f_instance)
+            self.scene_registry.invalidate_scene()  # the instance may be gone, check the scene before the next use
+        return res
+
+    def start_headless_server(
+            self: a2f.Audio2Face,
+            timeout: float = DEFAULT_HEADLESS_STARTUP_TIMEOUT,
+            auto_restart: bool = True,
+            log_path: str = None,
+            echo: bool = False
+    ):
+        """
+        Starts the headless server if it's not running and waits until it answers the status check.
+        The process is watched by a HeadlessSupervisor (self.headless_supervisor): its output is captured
+        (see headless_supervisor.log), startup phases are timed and a crashed server is restarted.
+        timeout (float): Seconds to wait for the server.
+        auto_restart (bool): Restart the server if it crashes.
+        log_path (str): Optional file the server output is appended to.
+        echo (bool): Print the server output.
+        """
         # check if already running
-        status = self.make_request("status")
+        status = self.make_request("status", retries=0)
         if status == "OK":
             print("audio2face running")
+            self.scene_registry.server_seen_up()
             return status
 
         print("starting audio2face headless")
-        batch_file = f"{self.a2f_install_path}/audio2face_headless.bat"
-        if not os.path.isfile(batch_file):
-            raise ValueError(f"audio2face_headless.bat not found in {self.a2f_install_path}. Is audio2face installed?")
+        if self.a2f_install_path is None:
+            raise FileNotFoundError(
+                "Audio2Face installation path is not provided and not found in the registry. "
+                "Install Audio2Face and provide the installation path manually."
+            )
+        launcher = get_headless_launcher(self.a2f_install_path)
 
-        self.process_audio2face = Popen(batch_file, universal_newlines=True, creationflags=CREATE_NEW_CONSOLE)
+        def on_started(pid):
+            # a new process has neither our scene nor our settings
+            self.a2f_state.invalidate()
+            self.scene_registry.server_started(pid)
+
+        self.headless_supervisor = HeadlessSupervisor(
+            launcher, api_url=self.api_url, auto_restart=auto_restart, on_started=on_started,
+            log_path=log_path, echo=echo
+        )
+        self.process_audio2face = self.headless_supervisor.start()
 
         print("wait until audio2face is ready")
-        start_open = time.time()
-        # not managed to print the console output in pipe don't know why it doesnt work.
-        # TODO: make it with subprocess call..
-        while True:
-            status = self.make_request("status")
-            if str(status).lower() == "ok":
-                break
-            elif int(time.time() - start_open) >= 60:
-                status = "timeout"
-                break
-            else:
-                time.sleep(0.5)
-
-        print(f"status {status}")
+        if self.headless_supervisor.wait_ready(timeout):
+            status = "OK"
+            self.scene_registry.server_seen_up()
+        else:
+            status = "timeout" if self.headless_supervisor.running else "exited"
+
+        print(f"status {status}, startup phases (s): {self.headless_supervisor.phase_timings}")
         return status
 
     def shutdown_a2f(self: a2f.Audio2Face):
+        if self.headless_supervisor is not None:
+            self.headless_supervisor.stop()
+            return
         try:
             self.process_audio2face.kill()
         except:
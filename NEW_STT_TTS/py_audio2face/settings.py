@@ -5,9 +5,8 @@ ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
 DEFAULT_OUTPUT_DIR = os.path.join(ROOT_DIR, "../output")
 ASSETS_DIR = os.path.join(ROOT_DIR, "assets")
 
-APP_DATA_DIR = os.getenv('LOCALAPPDATA')
-#C:\Users\MOO\AppData\Local\ov\pkg\audio2face-2023.2.0
-print("LOCALAPPDATA:"+APP_DATA_DIR)
+# C:\Users\MOO\AppData\Local\ov\pkg\audio2face-2023.2.0 on windows, ~/.local/share/ov/pkg/audio2face-2023.2.0 on linux
+APP_DATA_DIR = os.getenv('LOCALAPPDATA') or os.path.join(os.path.expanduser("~"), ".local", "share")
 
 DEFAULT_PLAYER_INSTANCE = "/World/audio2face/Player"
 DEFAULT_SOLVER_INSTANCE = "/World/audio2face/BlendshapeSolve"
@@ -15,3 +14,43 @@ DEFAULT_A2E_INSTANCE = "/World/audio2face/CoreFullface"
 
 DEFAULT_AUDIO_STREAM_PLAYER_INSTANCE = "/World/audio2face/PlayerStreaming"
 DEFAULT_AUDIO_STREAM_GRPC_PORT = 50051
+DEFAULT_AUDIO_STREAM_MESSAGE_MS = 100  # length of one audio message sent to the streaming player
+
+# http client for the headless REST api
+DEFAULT_HTTP_POOL_SIZE = 4
+DEFAULT_HTTP_TIMEOUT = 30  # seconds, used for every route not listed in DEFAULT_HTTP_ROUTE_TIMEOUTS
+DEFAULT_HTTP_ROUTE_TIMEOUTS = {
+    "status": 2,
+    "A2F/USD/Load": 120,
+    "A2F/A2E/GenerateKeys": 300,
+    "A2F/Exporter/ExportBlendshapes": 300,
+}
+DEFAULT_HTTP_MAX_RETRIES = 3
+DEFAULT_HTTP_RETRY_BACKOFF = 0.2  # seconds, doubled with every retry
+# routes whose side effects must not run twice. A connection reset after the request was sent may mean the server
+# already ran it, so these are only retried if the connection could not be established at all
+DEFAULT_HTTP_NON_IDEMPOTENT_ROUTES = ("A2F/A2E/GenerateKeys", "A2F/Exporter/ExportBlendshapes")
+
+# supervisor of the headless server process, see modules/_supervisor.py
+# startup phases recognized in the server output: phase -> regex
+DEFAULT_HEADLESS_LOG_PHASES = {
+    "extensions_loading": r"\[ext: |Loading extension",
+    "app_ready": r"app ready",
+    "http_ready": r"Uvicorn running on|Running on http",
+}
+DEFAULT_HEADLESS_READY_PHASES = ("app_ready", "http_ready")  # a status check follows right after these lines
+DEFAULT_HEADLESS_STATUS_POLL_INTERVAL = 0.5  # seconds between status checks while no ready line was seen
+DEFAULT_HEADLESS_STARTUP_TIMEOUT = 60  # seconds
+DEFAULT_HEADLESS_MAX_RESTARTS = 5  # crashes in a row before the supervisor gives up
+
+# tracing, see tracing.py
+DEFAULT_TRACE_SERVICE_NAME = "stt-tts-a2f"
+DEFAULT_TRACE_QUEUE_SIZE = 10000  # finished spans waiting for export, more are dropped
+DEFAULT_TRACE_BATCH_SIZE = 256
+DEFAULT_TRACE_FLUSH_INTERVAL = 1.0  # seconds
+
+# scene registry, see modules/_scene.py
+DEFAULT_SCENE_CHECK_INTERVAL = 30  # seconds a loaded scene is trusted before it's checked again (2 cheap requests)
+
+# client side mirror of the instance settings, see modules/_state.py
+DEFAULT_A2F_STATE_MAX_AGE = 300  # seconds until known settings are sent again
@@ -0,0 +1,427 @@
+"""
+Lightweight tracing of a conversational turn across STT, chatbot, TTS and Audio2Face.
+- a turn has a correlation id, set with trace_turn() and kept in a contextvar. It is the trace id if it is a valid
+  OTLP trace id (32 hex digits), otherwise the trace id is derived from it and it is kept as span attribute
+  correlation_id (a collector rejects the whole batch for one invalid trace id)
+- span() times a stage as child of the current span. Functions wrapped with bind() continue the turn in other
+  threads, e.g. the speech scheduler worker and the sentence pipeline producer
+- finished spans are exported in the background to a JSONL file and/or an OTLP/HTTP collector (JSON encoding)
+- disabled (the default): span() returns a shared no-op span, the cost is one attribute check
+
+    from py_audio2face import tracing
+    tracing.configure(jsonl_path="trace.jsonl")
+    with tracing.trace_turn():
+        with tracing.span("tts.synthesis", emotion="happy") as s:
+            ...
+            s.set(first_chunk_ms=83)
+"""
+
+from __future__ import annotations
+
+import contextlib
+import contextvars
+import hashlib
+import json
+import os
+import queue
+import re
+import secrets
+import threading
+import time
+
+import requests
+
+from py_audio2face.settings import (
+    DEFAULT_TRACE_QUEUE_SIZE, DEFAULT_TRACE_BATCH_SIZE, DEFAULT_TRACE_FLUSH_INTERVAL, DEFAULT_TRACE_SERVICE_NAME
+)
+
+CORRELATION_HEADER = "X-Correlation-ID"
+
+_TRACE_ID_RE = re.compile(r"[0-9a-f]{32}")
+
+_turn_id = contextvars.ContextVar("a2f_trace_turn_id", default=None)  # the trace id
+_correlation_id = contextvars.ContextVar("a2f_trace_correlation_id", default=None)  # as given by the caller
+_current_span = contextvars.ContextVar("a2f_trace_span", default=None)
+
+
+def new_id(n_bytes: int = 16) -> str:
+    return secrets.token_hex(n_bytes)
+
+
+def trace_id_for(correlation_id: str) -> str:
+    """ The OTLP trace id of a correlation id: itself if it's 32 lowercase hex digits, else derived from its hash """
+    if _TRACE_ID_RE.fullmatch(correlation_id) and correlation_id != "0" * 32:
+        return correlation_id
+    return hashlib.sha256(correlation_id.encode("utf-8")).hexdigest()[:32]
+
+
+class Span:
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "start_ns", "end_ns", "attributes", "events",
+                 "status", "error", "thread", "_tracer", "_tokens")
+
+    def __init__(self, tracer: Tracer, name: str, trace_id: str, parent_id: str | None, attributes: dict):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = new_id(8)
+        self.parent_id = parent_id
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes = attributes
+        self.events = []
+        self.status = "ok"
+        self.error = None
+        self.thread = threading.current_thread().name
+        self._tracer = tracer
+        self._tokens = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+        return self
+
+    def add_event(self, name: str, **attributes):
+        """ marks a point in time inside the span, e.g. the first audio chunk """
+        self.events.append({"name": name, "time_ns": time.time_ns(), "attributes": attributes})
+
+    def record_error(self, error):
+        self.status = "error"
+        self.error = f"{type(error).__name__}: {error}" if isinstance(error, BaseException) else str(error)
+
+    def end(self):
+        if self.end_ns is None:
+            self.end_ns = time.time_ns()
+            self._tracer._export(self)
+
+    @property
+    def duration_ms(self) -> float:
+        end = self.end_ns if self.end_ns is not None else time.time_ns()
+        return (end - self.start_ns) / 1e6
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_ms": self.duration_ms,
+            "status": self.status,
+            "error": self.error,
+            "thread": self.thread,
+            "attributes": self.attributes,
+            "events": self.events,
+        }
+
+    # used as context manager by Tracer.span: the span is the current span while the block runs
+    def __enter__(self):
+        self._tokens = (_current_span.set(self), _turn_id.set(self.trace_id))
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        span_token, turn_token = self._tokens
+        _current_span.reset(span_token)
+        _turn_id.reset(turn_token)
+        if exc is not None:
+            self.record_error(exc)
+        self.end()
+        return False
+
+
+class _NoopSpan:
+    """ returned while tracing is disabled """
+    trace_id = None
+    span_id = None
+
+    def set(self, **attributes):
+        return self
+
+    def add_event(self, name: str, **attributes):
+        pass
+
+    def record_error(self, error):
+        pass
+
+    def end(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+# ---------------- exporters ----------------
+class _BatchExporter:
+    """
+    Exports finished spans in batches from a background thread, so span.end() never blocks on io.
+    Spans are dropped (and counted) if the queue is full.
+    """
+    def __init__(
+            self,
+            queue_size: int = DEFAULT_TRACE_QUEUE_SIZE,
+            batch_size: int = DEFAULT_TRACE_BATCH_SIZE,
+            flush_interval: float = DEFAULT_TRACE_FLUSH_INTERVAL
+    ):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.exported = 0
+        self.dropped = 0
+        self.failed = 0
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name=f"trace-{type(self).__name__}", daemon=True)
+        self._thread.start()
+
+    def export(self, span: Span):
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        while True:
+            batch = []
+            flushed = None
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if isinstance(item, threading.Event):  # flush marker, set once everything before it is written
+                    flushed = item
+                    break
+                batch.append(item)
+
+            if batch:
+                try:
+                    self._write(batch)
+                    self.exported += len(batch)
+                except Exception as e:
+                    if not self.failed:
+                        print(f"trace export with {type(self).__name__} failed: {e}")
+                    self.failed += len(batch)
+            if flushed is not None:
+                flushed.set()
+            if self._closed and self._queue.empty():
+                return
+
+    def _write(self, batch: list):
+        raise NotImplementedError
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """ Blocks until all spans queued so far are written """
+        done = threading.Event()
+        try:
+            self._queue.put(done, timeout=timeout)
+        except queue.Full:
+            return False
+        return done.wait(timeout)
+
+    def close(self, timeout: float = 5.0):
+        self._closed = True
+        self.flush(timeout)
+        self._thread.join(timeout)
+
+    def stats(self) -> dict:
+        return {"exported": self.exported, "dropped": self.dropped, "failed": self.failed,
+                "queued": self._queue.qsize()}
+
+
+class JsonlExporter(_BatchExporter):
+    """ One span per line, see Span.to_dict """
+    def __init__(self, path: str, **kwargs):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        super().__init__(**kwargs)
+
+    def _write(self, batch: list):
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write("".join(json.dumps(s.to_dict(), ensure_ascii=False, default=str) + "\n" for s in batch))
+
+
+def _otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_attributes(attributes: dict) -> list:
+    return [{"key": k, "value": _otlp_value(v)} for k, v in attributes.items() if v is not None]
+
+
+class OtlpHttpExporter(_BatchExporter):
+    """
+    Posts spans to an OpenTelemetry collector with OTLP/HTTP in JSON encoding,
+    e.g. endpoint="http://localhost:4318/v1/traces" of the otel collector, Jaeger or Tempo.
+    """
+    def __init__(self, endpoint: str, service_name: str = DEFAULT_TRACE_SERVICE_NAME, headers: dict = None,
+                 timeout: float = 5.0, **kwargs):
+        self.endpoint = endpoint
+        self.service_name = service_name
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers.update({"Content-Type": "application/json", **(headers or {})})
+        super().__init__(**kwargs)
+
+    def encode(self, batch: list) -> dict:
+        spans = []
+        for s in batch:
+            span = {
+                "traceId": s.trace_id,
+                "spanId": s.span_id,
+                "name": s.name,
+                "kind": 1,  # internal
+                "startTimeUnixNano": str(s.start_ns),
+                "endTimeUnixNano": str(s.end_ns),
+                "attributes": _otlp_attributes({**s.attributes, "thread.name": s.thread}),
+                "events": [
+                    {"name": e["name"], "timeUnixNano": str(e["time_ns"]), "attributes": _otlp_attributes(e["attributes"])}
+                    for e in s.events
+                ],
+                "status": {"code": 2, "message": s.error or ""} if s.status == "error" else {"code": 1},
+            }
+            if s.parent_id:
+                span["parentSpanId"] = s.parent_id
+            spans.append(span)
+        return {
+            "resourceSpans": [{
+                "resource": {"attributes": _otlp_attributes({"service.name": self.service_name})},
+                "scopeSpans": [{"scope": {"name": "py_audio2face.tracing"}, "spans": spans}],
+            }]
+        }
+
+    def _write(self, batch: list):
+        response = self.session.post(self.endpoint, data=json.dumps(self.encode(batch)), timeout=self.timeout)
+        response.raise_for_status()
+
+
+# ---------------- tracer ----------------
+class Tracer:
+    def __init__(self):
+        self.enabled = False
+        self.exporters = []
+
+    def configure(
+            self,
+            jsonl_path: str = None,
+            otlp_endpoint: str = None,
+            service_name: str = DEFAULT_TRACE_SERVICE_NAME,
+            exporters: list = None
+    ) -> Tracer:
+        """
+        Enables tracing if any exporter is given, disables it otherwise.
+        jsonl_path (str): Spans are appended to this file, one json object per line.
+        otlp_endpoint (str): OTLP/HTTP traces endpoint, e.g. http://localhost:4318/v1/traces.
+        exporters (list): Additional exporters with an export(span) method.
+        """
+        self.shutdown()
+        new = list(exporters or [])
+        if jsonl_path:
+            new.append(JsonlExporter(jsonl_path))
+        if otlp_endpoint:
+            new.append(OtlpHttpExporter(otlp_endpoint, service_name=service_name))
+        self.exporters = new
+        self.enabled = bool(new)
+        return self
+
+    def configure_from_env(self) -> Tracer:
+        """ TRACE_JSONL=<path> and/or TRACE_OTLP_ENDPOINT=<url> (+ TRACE_SERVICE_NAME) """
+        return self.configure(
+            jsonl_path=os.getenv("TRACE_JSONL"),
+            otlp_endpoint=os.getenv("TRACE_OTLP_ENDPOINT"),
+            service_name=os.getenv("TRACE_SERVICE_NAME", DEFAULT_TRACE_SERVICE_NAME)
+        )
+
+    def _export(self, span: Span):
+        for exporter in self.exporters:
+            exporter.export(span)
+
+    def start_span(self, name: str, **attributes):
+        """
+        Starts a span that is not the current span, end it with span.end().
+        Use it where a with block doesn't fit, e.g. around a generator that is consumed elsewhere.
+        """
+        if not self.enabled:
+            return NOOP_SPAN
+        parent = _current_span.get()
+        trace_id = _turn_id.get() or (parent.trace_id if parent is not None else None) or new_id()
+        correlation_id = _correlation_id.get()
+        if correlation_id is not None and correlation_id != trace_id:
+            attributes["correlation_id"] = correlation_id
+        return Span(self, name, trace_id, parent.span_id if parent is not None else None, attributes)
+
+    def span(self, name: str, **attributes):
+        """ with tracer.span("stage") as s: the span is the parent of all spans started inside the block """
+        return self.start_span(name, **attributes)
+
+    @contextlib.contextmanager
+    def turn(self, turn_id: str = None):
+        """
+        Sets the correlation id of a conversational turn (a new one if None) and yields it unchanged.
+        Spans of the turn use trace_id_for(turn_id) as trace id.
+        """
+        turn_id = turn_id or new_id()
+        token = _turn_id.set(trace_id_for(turn_id))
+        correlation_token = _correlation_id.set(turn_id)
+        span_token = _current_span.set(None)
+        try:
+            yield turn_id
+        finally:
+            _current_span.reset(span_token)
+            _correlation_id.reset(correlation_token)
+            _turn_id.reset(token)
+
+    def flush(self, timeout: float = 5.0):
+        for exporter in self.exporters:
+            if hasattr(exporter, "flush"):
+                exporter.flush(timeout)
+
+    def shutdown(self):
+        for exporter in self.exporters:
+            if hasattr(exporter, "close"):
+                exporter.close()
+        self.exporters = []
+        self.enabled = False
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "exporters": {type(e).__name__: e.stats() for e in self.exporters if hasattr(e, "stats")},
+        }
+
+
+tracer = Tracer()
+
+
+def current_turn_id() -> str | None:
+    """ The correlation id of the current turn as given to trace_turn() """
+    return _correlation_id.get() or _turn_id.get()
+
+
+def bind(fn):
+    """ returns fn running in a copy of the current context, to continue the turn in another thread """
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.run(fn, *args, **kwargs)
+
+
+# shortcuts on the module tracer
+configure = tracer.configure
+configure_from_env = tracer.configure_from_env
+span = tracer.span
+start_span = tracer.start_span
+trace_turn = tracer.turn
+flush = tracer.flush
+shutdown = tracer.shutdown
@@ -24,6 +24,12 @@ def get_files_in_dir(path: str, extensions: list = None) -> list:
     return files
 
 
+def get_animation_output_path(audio_file: str, output_folder: str) -> str:
+    """ The output path of an audio file in a folder export: output_folder/<audio file name>_a2f_animation """
+    outfile_name, ext = os.path.basename(audio_file).rsplit(".", 1)
+    return f"{output_folder}/{outfile_name}_a2f_animation"
+
+
 def get_audio2face_install_path():
     """
     Get the newest installed audio2face installation path from the default location (in AppData)
@@ -0,0 +1,121 @@
+# sentence_pipeline.py
+# แบ่งคำตอบยาวเป็นช่วงประโยค/วลี แล้วสังเคราะห์แบบ pipeline: ช่วงที่ N+1 ถูกสังเคราะห์ระหว่างที่ช่วงที่ N กำลังเล่น
+# → เวลาถึงเสียงแรกใกล้เคียงกันไม่ว่าคำตอบจะยาวแค่ไหน
+# - ภาษาอังกฤษ: ตัดหลัง . ! ? …
+# - ภาษาไทย (ไม่มีเครื่องหมายจบประโยค): ตัดที่ช่องว่างระหว่างอักษรไทย ซึ่งใช้คั่นประโยค/วลี
+# - ช่วงที่ยาวเกิน: ตัดที่ , ; : หรือช่องว่าง, ถ้ายังยาวเกินใช้ pythainlp ตัดคำ (ถ้าติดตั้งไว้) หรือตัดตามความยาว
+import contextvars
+import queue
+import re
+import threading
+
+try:
+    from pythainlp.tokenize import word_tokenize
+    pythainlp_installed = True
+except ImportError:
+    pythainlp_installed = False
+
+FIRST_CHUNK_MAX_CHARS = 60   # ช่วงแรกสั้น → ได้เสียงแรกเร็ว
+CHUNK_MAX_CHARS = 160
+
+_THAI = r"\u0E00-\u0E7F"
+_SENTENCE_BREAK = re.compile(rf"(?<=[.!?…])\s+|(?<=[{_THAI}])\s+(?=[{_THAI}])")
+_CLAUSE_BREAK = re.compile(r"(?<=[,;:])\s+|\s+")
+
+
+def _hard_split(text, max_chars):
+    """ ช่วงที่ไม่มีช่องว่างเลย: ตัดที่ขอบคำ (pythainlp) หรือตามความยาว """
+    if pythainlp_installed:
+        words = word_tokenize(text, keep_whitespace=False)
+    else:
+        words = [text[i:i + max_chars] for i in range(0, len(text), max_chars)]
+    return _pack(words, max_chars, max_chars, sep="")
+
+
+def _pack(pieces, first_max_chars, max_chars, sep=" "):
+    """ รวมช่วงสั้นๆ ที่อยู่ติดกันให้ยาวที่สุดแต่ไม่เกินขีดจำกัด """
+    chunks = []
+    current = ""
+    for piece in pieces:
+        limit = first_max_chars if not chunks else max_chars
+        candidate = current + sep + piece if current else piece
+        if current and len(candidate) > limit:
+            chunks.append(current)
+            current = piece
+        else:
+            current = candidate
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def split_text(text, first_max_chars=FIRST_CHUNK_MAX_CHARS, max_chars=CHUNK_MAX_CHARS):
+    """ แบ่งข้อความเป็นช่วงสำหรับสังเคราะห์ทีละช่วง (ช่วงแรกไม่เกิน first_max_chars, ช่วงอื่นไม่เกิน max_chars) """
+    pieces = []
+    for sentence in _SENTENCE_BREAK.split(text.strip()):
+        if not sentence:
+            continue
+        if len(sentence) <= max_chars:
+            pieces.append(sentence)
+            continue
+        for clause in _CLAUSE_BREAK.split(sentence):
+            if len(clause) <= max_chars:
+                pieces.append(clause)
+            elif clause:
+                pieces.extend(_hard_split(clause, max_chars))
+    return _pack(pieces, first_max_chars, max_chars)
+
+
+def pipelined(chunks, synthesize, ahead=1):
+    """
+    รัน synthesize(chunk) (generator ของเสียง) ของแต่ละช่วงใน thread พื้นหลัง แล้ว yield เสียงตามลำดับ
+    ahead: จำนวนช่วงที่สังเคราะห์ล่วงหน้าได้ นอกเหนือจากช่วงที่กำลังเล่น
+    ถ้าผู้ใช้หยุดอ่าน (เช่น ยกเลิก streaming) thread พื้นหลังจะหยุดสังเคราะห์ช่วงที่เหลือ
+    """
+    # thread พื้นหลังรันใน context ของผู้เรียก (ตอนนี้ ไม่ใช่ตอนเริ่มอ่าน) → span ของการสังเคราะห์อยู่ใน turn เดียวกัน
+    return _pipelined(chunks, synthesize, ahead, contextvars.copy_context())
+
+
+def _pipelined(chunks, synthesize, ahead, context):
+    done = object()
+    pieces = queue.Queue()
+    slots = threading.Semaphore(ahead + 1)
+    stop = threading.Event()
+
+    def produce():
+        try:
+            for chunk in chunks:
+                while not slots.acquire(timeout=0.1):
+                    if stop.is_set():
+                        return
+                if stop.is_set():
+                    return
+                stream = synthesize(chunk)
+                try:
+                    for piece in stream:
+                        if stop.is_set():
+                            return
+                        pieces.put(piece)
+                finally:
+                    stream.close()
+                pieces.put(done)  # จบช่วงนี้
+        except Exception as e:
+            pieces.put(e)
+        finally:
+            pieces.put(None)
+
+    producer = threading.Thread(target=context.run, args=(produce,), name="tts-pipeline", daemon=True)
+    producer.start()
+    try:
+        while True:
+            piece = pieces.get()
+            if piece is None:
+                break
+            if piece is done:
+                slots.release()
+                continue
+            if isinstance(piece, Exception):
+                raise piece
+            yield piece
+    finally:
+        stop.set()
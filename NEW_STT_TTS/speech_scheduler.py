@@ -0,0 +1,187 @@
+# speech_scheduler.py
+# คิวงานพูดแบบจำกัดขนาด + worker จำนวนคงที่ สำหรับ /speak
+# - งานของ avatar เดียวกันทำทีละงาน (ไม่แย่ง player ของ A2F)
+# - คิวเต็ม → เลือก policy: drop_oldest / reject (429) / coalesce
+# - มี metrics: ความยาวคิว, เวลารอในคิว
+# - งานรันใน context ของผู้ส่งงาน → correlation id ของ tracing ตามไปถึง worker
+import contextvars
+import threading
+import time
+from collections import deque
+
+from py_audio2face import tracing
+
+
+OVERFLOW_POLICIES = ("drop_oldest", "reject", "coalesce")
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class SpeechJob:
+    def __init__(self, avatar, args, kwargs):
+        self.avatar = avatar
+        self.args = args
+        self.kwargs = kwargs
+        self.enqueued_at = time.perf_counter()
+        self.context = contextvars.copy_context()
+        self.started_at = None
+        self.finished = threading.Event()
+        self.status = "queued"  # queued / running / done / failed / dropped / coalesced
+
+    @property
+    def wait_time(self):
+        if self.started_at is None:
+            return None
+        return self.started_at - self.enqueued_at
+
+
+class SpeechScheduler:
+    def __init__(self, handler, workers=1, max_queue=8, overflow="reject", wait_samples=500):
+        """
+        handler: ฟังก์ชันที่ทำงานพูด เช่น tts_with_emotion(text, emotion)
+        workers: จำนวน worker thread
+        max_queue: จำนวนงานที่รอในคิวได้สูงสุด (ไม่นับงานที่กำลังทำ)
+        overflow: drop_oldest / reject / coalesce
+        wait_samples: จำนวนเวลารอล่าสุดที่เก็บไว้คำนวณ percentile
+        """
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"overflow ต้องเป็นหนึ่งใน {OVERFLOW_POLICIES}")
+
+        self.handler = handler
+        self.max_queue = max_queue
+        self.overflow = overflow
+
+        self._cond = threading.Condition()
+        self._pending = deque()   # งานที่รอ เรียงตามเวลาเข้าคิว
+        self._busy = set()        # avatar ที่กำลังพูดอยู่
+        self._stopped = False
+
+        self._waits = deque(maxlen=wait_samples)
+        self._counters = {"submitted": 0, "completed": 0, "failed": 0, "dropped": 0, "rejected": 0, "coalesced": 0}
+
+        self._workers = [
+            threading.Thread(target=self._worker, name=f"speech-worker-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for t in self._workers:
+            t.start()
+
+    # ---------- เข้าคิว ----------
+    def submit(self, avatar, *args, **kwargs):
+        job = SpeechJob(avatar, args, kwargs)
+        with self._cond:
+            if self._stopped:
+                raise RuntimeError("scheduler ถูกปิดแล้ว")
+
+            if len(self._pending) >= self.max_queue:
+                self._handle_overflow(job)
+
+            self._pending.append(job)
+            self._counters["submitted"] += 1
+            self._cond.notify()
+        return job
+
+    def _handle_overflow(self, job):
+        # เรียกภายใต้ self._cond
+        if self.overflow == "drop_oldest":
+            oldest = self._pending.popleft()
+            self._finish(oldest, "dropped")
+            self._counters["dropped"] += 1
+            return
+
+        if self.overflow == "coalesce":
+            # งานใหม่ของ avatar เดียวกันแทนที่งานเก่าที่ยังไม่เริ่ม
+            same = [j for j in self._pending if j.avatar == job.avatar]
+            if same:
+                for j in same:
+                    self._pending.remove(j)
+                    self._finish(j, "coalesced")
+                self._counters["coalesced"] += len(same)
+                return
+
+        self._counters["rejected"] += 1
+        raise QueueFullError(f"คิวเต็ม ({self.max_queue} งาน)")
+
+    @staticmethod
+    def _finish(job, status):
+        job.status = status
+        job.finished.set()
+
+    # ---------- worker ----------
+    def _next_job(self):
+        # งานที่เก่าที่สุดที่ avatar ไม่ได้พูดอยู่
+        for job in self._pending:
+            if job.avatar not in self._busy:
+                self._pending.remove(job)
+                return job
+        return None
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                job = self._next_job()
+                while job is None:
+                    if self._stopped:
+                        return
+                    self._cond.wait()
+                    job = self._next_job()
+                self._busy.add(job.avatar)
+                job.started_at = time.perf_counter()
+                job.status = "running"
+                self._waits.append(job.wait_time)
+
+            status = "done"
+            try:
+                job.context.run(self._run, job)
+            except Exception as e:
+                status = "failed"
+                print(f"❌ งานพูดของ {job.avatar} ผิดพลาด: {e}")
+
+            with self._cond:
+                self._busy.discard(job.avatar)
+                self._counters["completed" if status == "done" else "failed"] += 1
+                self._finish(job, status)
+                self._cond.notify_all()  # avatar นี้ว่างแล้ว งานถัดไปของ avatar นี้เริ่มได้
+
+    def _run(self, job):
+        with tracing.span("speech.job", avatar=job.avatar, queue_wait_ms=1000 * job.wait_time):
+            self.handler(*job.args, **job.kwargs)
+
+    # ---------- metrics ----------
+    def metrics(self):
+        with self._cond:
+            waits = sorted(self._waits)
+            per_avatar = {}
+            for job in self._pending:
+                per_avatar[job.avatar] = per_avatar.get(job.avatar, 0) + 1
+
+            def pct(p):
+                if not waits:
+                    return 0.0
+                return 1000 * waits[min(len(waits) - 1, int(p * len(waits)))]
+
+            return {
+                "queue_depth": len(self._pending),
+                "queue_depth_per_avatar": per_avatar,
+                "running": len(self._busy),
+                "workers": len(self._workers),
+                "max_queue": self.max_queue,
+                "overflow": self.overflow,
+                **self._counters,
+                "wait_ms": {
+                    "mean": 1000 * sum(waits) / len(waits) if waits else 0.0,
+                    "p50": pct(0.50),
+                    "p95": pct(0.95),
+                    "max": 1000 * waits[-1] if waits else 0.0,
+                },
+            }
+
+    def shutdown(self, wait=True):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        if wait:
+            for t in self._workers:
+                t.join()
@@ -0,0 +1,220 @@
+# synthesizer_pool.py
+# Pool ของ Azure SpeechSynthesizer ที่เชื่อมต่อ (TLS/websocket) ไว้ล่วงหน้า แยกตาม (voice, output format)
+# - warmup() ตอนเริ่มโปรแกรม → คำขอแรกไม่ต้องรอเปิด connection
+# - health check: ติดตาม connected/disconnected ของแต่ละตัว แล้วเปิดใหม่ก่อนใช้
+# - recycle: สร้างใหม่เมื่อใช้ครบ max_uses ครั้ง หรืออายุเกิน max_age_s
+# - stats(): เวลา warmup และ first-byte latency แยก warm/cold
+import queue
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import azure.cognitiveservices.speech as speechsdk
+
+
+class PooledSynthesizer:
+    def __init__(self, key, speech_config):
+        self.key = key
+        self.created_at = time.perf_counter()
+        self.uses = 0
+        self.connected = False
+        self.warmup_ms = None
+
+        self.synthesizer = speechsdk.SpeechSynthesizer(speech_config=speech_config, audio_config=None)
+        self.connection = speechsdk.Connection.from_speech_synthesizer(self.synthesizer)
+        self.connection.connected.connect(self._on_connected)
+        self.connection.disconnected.connect(self._on_disconnected)
+
+    def _on_connected(self, evt):
+        self.connected = True
+        if self.warmup_ms is None:
+            self.warmup_ms = 1000 * (time.perf_counter() - self.created_at)
+
+    def _on_disconnected(self, evt):
+        self.connected = False
+
+    def open(self):
+        # เปิด websocket ล่วงหน้า (async, event connected จะมาทีหลัง)
+        self.connection.open(False)
+
+    def close(self):
+        try:
+            self.connection.close()
+        except Exception:
+            pass
+
+
+class SynthesizerPool:
+    def __init__(self, speech_key, region, idle_per_key=2, max_uses=500, max_age_s=600, latency_samples=200):
+        self.speech_key = speech_key
+        self.region = region
+        self.idle_per_key = idle_per_key
+        self.max_uses = max_uses
+        self.max_age_s = max_age_s
+
+        self._lock = threading.Lock()
+        self._idle = {}  # (voice, output_format) -> deque[PooledSynthesizer]
+        self._counters = {"created": 0, "recycled": 0, "reconnected": 0, "leases": 0}
+        self._warmup_ms = deque(maxlen=latency_samples)
+        self._first_byte_ms = {"warm": deque(maxlen=latency_samples), "cold": deque(maxlen=latency_samples)}
+
+    # ---------- สร้าง / warmup ----------
+    def _create(self, key):
+        voice, output_format = key
+        speech_config = speechsdk.SpeechConfig(subscription=self.speech_key, region=self.region)
+        if voice:
+            speech_config.speech_synthesis_voice_name = voice
+        if output_format is not None:
+            speech_config.set_speech_synthesis_output_format(output_format)
+        ps = PooledSynthesizer(key, speech_config)
+        ps.open()
+        with self._lock:
+            self._counters["created"] += 1
+        return ps
+
+    def warmup(self, keys, per_key=1, timeout=5.0):
+        """ สร้างและเชื่อมต่อ synthesizer ล่วงหน้า, คืนค่าเวลา warmup (ms) ของแต่ละตัว """
+        created = [self._create(key) for key in keys for _ in range(per_key)]
+        deadline = time.perf_counter() + timeout
+        while time.perf_counter() < deadline and not all(ps.connected for ps in created):
+            time.sleep(0.01)
+
+        with self._lock:
+            for ps in created:
+                self._idle.setdefault(ps.key, deque()).append(ps)
+                if ps.warmup_ms is not None:
+                    self._warmup_ms.append(ps.warmup_ms)
+        return [ps.warmup_ms for ps in created]
+
+    # ---------- ยืม / คืน ----------
+    def _expired(self, ps):
+        return ps.uses >= self.max_uses or time.perf_counter() - ps.created_at > self.max_age_s
+
+    @contextmanager
+    def lease(self, voice, output_format):
+        key = (voice, output_format)
+        ps = None
+        with self._lock:
+            self._counters["leases"] += 1
+            idle = self._idle.get(key)
+            while idle:
+                candidate = idle.popleft()
+                if self._expired(candidate):
+                    self._counters["recycled"] += 1
+                    candidate.close()
+                    continue
+                ps = candidate
+                break
+
+        if ps is None:
+            ps = self._create(key)
+        elif not ps.connected:
+            # health check ไม่ผ่าน (เช่น idle timeout ของ Azure) → เปิดใหม่
+            ps.open()
+            with self._lock:
+                self._counters["reconnected"] += 1
+
+        healthy = True
+        try:
+            yield ps
+        except Exception:
+            healthy = False
+            raise
+        finally:
+            ps.uses += 1
+            with self._lock:
+                idle = self._idle.setdefault(key, deque())
+                if healthy and len(idle) < self.idle_per_key and not self._expired(ps):
+                    idle.append(ps)
+                else:
+                    ps.close()
+
+    def _record_first_byte(self, warm, ms):
+        with self._lock:
+            self._first_byte_ms["warm" if warm else "cold"].append(ms)
+
+    # ---------- สังเคราะห์เสียง ----------
+    def speak(self, ssml_or_text, voice=None, output_format=None, is_ssml=True):
+        """ สังเคราะห์ทั้งประโยค → SpeechSynthesisResult (audio อยู่ใน result.audio_data) """
+        with self.lease(voice, output_format) as ps:
+            warm = ps.connected
+            synth = ps.synthesizer
+            start = time.perf_counter()
+            first = []
+
+            def on_chunk(evt):
+                if not first:
+                    first.append(time.perf_counter())
+
+            synth.synthesizing.connect(on_chunk)
+            try:
+                if is_ssml:
+                    result = synth.speak_ssml_async(ssml_or_text).get()
+                else:
+                    result = synth.speak_text_async(ssml_or_text).get()
+            finally:
+                synth.synthesizing.disconnect_all()
+
+            if first:
+                self._record_first_byte(warm, 1000 * (first[0] - start))
+            return result
+
+    def stream(self, ssml, voice=None, output_format=None, timeout=30):
+        """ สังเคราะห์แบบ streaming: yield audio bytes ทีละก้อนตามที่ Azure ส่งมา
+            ค่า return ของ generator (StopIteration.value) = True เมื่อ Azure สังเคราะห์ครบทั้งประโยค """
+        with self.lease(voice, output_format) as ps:
+            warm = ps.connected
+            synth = ps.synthesizer
+            chunks = queue.Queue()
+            synth.synthesizing.connect(lambda evt: chunks.put(evt.result.audio_data))
+            synth.synthesis_completed.connect(lambda evt: chunks.put(None))
+            synth.synthesis_canceled.connect(lambda evt: chunks.put(evt.result))
+
+            finished = False
+            completed = False
+            try:
+                start = time.perf_counter()
+                synth.speak_ssml_async(ssml)
+                first = True
+                while True:
+                    data = chunks.get(timeout=timeout)
+                    if data is None:
+                        finished = completed = True
+                        break
+                    if not isinstance(data, bytes):
+                        finished = True
+                        details = data.cancellation_details
+                        print("❌ ไม่สามารถสร้างเสียง:", details.reason, details.error_details)
+                        break
+                    if first:
+                        self._record_first_byte(warm, 1000 * (time.perf_counter() - start))
+                        first = False
+                    yield data
+            finally:
+                if not finished:
+                    # ผู้ใช้หยุดอ่านกลางทาง → หยุด synthesizer ก่อนคืนเข้า pool
+                    synth.stop_speaking_async().get()
+                synth.synthesizing.disconnect_all()
+                synth.synthesis_completed.disconnect_all()
+                synth.synthesis_canceled.disconnect_all()
+            return completed
+
+    # ---------- stats ----------
+    def stats(self):
+        def summary(values):
+            v = sorted(values)
+            if not v:
+                return {"count": 0}
+            return {"count": len(v), "p50": v[len(v) // 2], "p95": v[min(len(v) - 1, int(0.95 * len(v)))], "max": v[-1]}
+
+        with self._lock:
+            return {
+                **self._counters,
+                "idle": {f"{k[0]}|{k[1]}": len(v) for k, v in self._idle.items()},
+                "warmup_ms": summary(self._warmup_ms),
+                "first_byte_ms": {
+                    "warm": summary(self._first_byte_ms["warm"]),
+                    "cold": summary(self._first_byte_ms["cold"]),
+                },
+            }
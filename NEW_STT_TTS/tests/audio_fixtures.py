@@ -0,0 +1,35 @@
+# test signals shared by test_vad.py and test_barge_in.py (16 kHz mono int16)
+import numpy as np
+
+RATE = 16000
+FRAME = 480  # the 30 ms frame of VadStage
+
+
+def tone(ms, amplitude=3000):
+    t = np.arange(int(RATE * ms / 1000)) / RATE
+    return (amplitude * np.sin(2 * np.pi * 220 * t)).astype(np.int16)
+
+
+def silence(ms, amplitude=20):
+    """ microphone noise floor, seeded so the same call returns the same samples """
+    return np.random.default_rng(0).integers(-amplitude, amplitude, int(RATE * ms / 1000)).astype(np.int16)
+
+
+def voiced(ms, f0=140, amplitude=8000):
+    """ harmonic, amplitude-modulated signal that webrtcvad classifies as speech """
+    t = np.arange(int(RATE * ms / 1000)) / RATE
+    signal = sum(np.sin(2 * np.pi * f0 * k * t) / k for k in range(1, 15))
+    signal *= 0.6 + 0.4 * np.sin(2 * np.pi * 4 * t)
+    return (amplitude * signal / np.abs(signal).max()).astype(np.int16)
+
+
+class LoudIsSpeech:
+    """ stand-in classifier: speech = peak above 1000, records how it is called """
+    def __init__(self):
+        self.calls = 0
+
+    def is_speech(self, buffer, sample_rate):
+        self.calls += 1
+        assert len(buffer) == FRAME * 2 and sample_rate == RATE  # webrtcvad takes len() as the byte count
+        frame = np.frombuffer(buffer, dtype=np.int16)
+        return int(np.abs(frame).max()) > 1000
@@ -7,19 +7,23 @@
 # uvicorn fastapi_tts:app --reload --host 192.168.1.105 --port 8000 --app-dir tests
 # uvicorn fastapi_tts:app --reload --host 192.168.1.105 --port 8000
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Header
 from pydantic import BaseModel
-import threading
+from typing import Optional
 
 # 🔗 นำเข้า function และ signal ต่าง ๆ จาก test_stream_from_azure
 from test_stream_from_azure import (
     tts_with_cancel_on_speech,           # ฟังก์ชันเล่นเสียงพูด (TTS) โดยสามารถหยุดกลางทางถ้ามีการแทรก
-    detect_human_voice_by_stt_continuous, # ฟังก์ชันเปิดไมค์ฟังเสียง → ใช้ STT ตรวจจับเสียงพูด
-    stop_signal,                          # Signal เพื่อสั่งหยุดการฟัง STT
-    cancel_signal,                        # Signal ที่บอกว่ามีคนพูดแทรก
-    start_vad_signal,                     # Signal ที่สั่งเริ่มระบบ VAD (ตรวจจับเสียงพูด)
-    intent_result                          # ตัวแปรเก็บผล Intent เช่น interrupt หรือ question
+    resume_speech,                        # พูดต่อจาก sample ที่หยุดไว้ (ไม่สังเคราะห์ใหม่)
+    get_player,                           # ลำโพง (PlaybackEngine) ที่เปิดค้างไว้
+    SAMPLE_RATE,                          # sample rate ของเสียง TTS (แปลงตำแหน่งที่หยุดเป็นวินาที)
+    warmup_tts,                            # เชื่อมต่อ Azure TTS ไว้ล่วงหน้า
+    synth_pool,                            # pool ของ SpeechSynthesizer
+    tracing                                # span + correlation id (py_audio2face.tracing)
 )
+import logging
+from log_writer import write_log, LogWriterHandler   # log ลงไฟล์ผ่าน thread พื้นหลัง (ไฟล์เดียวกับ mic_to_text)
+from echo_canceller import get_echo_canceller        # ไมค์ตัวเดียวที่เปิดค้างไว้ + ตัด echo ของลำโพง
 
 # ✅ สร้าง FastAPI app
 app = FastAPI()
@@ -40,7 +44,8 @@ async def tts(text: str):
     if not text:
         raise HTTPException(status_code=400, detail="กรุณาระบุพารามิเตอร์ text")
 
-    intent = run_tts_pipeline(text)    # รัน TTS Pipeline
+    with tracing.trace_turn():
+        intent = run_tts_pipeline(text)    # รัน TTS Pipeline
 
     return {
         "message": f"TTS for \"{text}\" finished",
@@ -51,74 +56,88 @@ async def tts(text: str):
 # ---------------------------
 # 🔊 POST Endpoint สำหรับพูด
 @app.post("/speak/")
-async def speak(item: Item):
+async def speak(item: Item, x_correlation_id: Optional[str] = Header(None)):
     if not item.text:
         raise HTTPException(status_code=400, detail="กรุณาระบุพารามิเตอร์ text")
 
-    print("🔊 ข้อความที่จะพูด:", item.text)
-    print("😊 อารมณ์:", item.emotion)
-    print("🕺 ท่าทาง:", item.gesture)
+    write_log("🔊 ข้อความที่จะพูด:", item.text)
+    write_log("😊 อารมณ์:", item.emotion)
+    write_log("🕺 ท่าทาง:", item.gesture)
 
-    # ✅ พูดเฉพาะ text (ซึ่งคือ answer)
-    intent = run_tts_pipeline(item.text)
+    # ✅ พูดเฉพาะ text (ซึ่งคือ answer) ใน turn เดียวกับ chatbot (header X-Correlation-ID)
+    with tracing.trace_turn(x_correlation_id) as turn_id:
+        intent = run_tts_pipeline(item.text)
 
     return {
         "message": f"TTS for \"{item.text}\" finished",
-        "intent": intent
+        "intent": intent,
+        "turn_id": turn_id
     }
 
 
 # ---------------------------
-# 🏠 เช็คว่า API ทำงานปกติ
-@app.get("/")
-async def read_root():
-    return {"status": "ok", "message": "Azure TTS + STT Interrupt + Intent API is running"}
+# ⏯️ พูดต่อจากจุดที่ถูกขัดด้วยคำถาม (เช่น หลังตอบคำถามเสร็จ) → ไม่สังเคราะห์ใหม่ ไม่พูดส่วนที่พูดไปแล้วซ้ำ
+@app.post("/resume/")
+async def resume(x_correlation_id: Optional[str] = Header(None)):
+    with tracing.trace_turn(x_correlation_id) as turn_id:
+        intent = run_tts_pipeline(None, resume=True)
+
+    return {
+        "message": "resume finished",
+        "intent": intent,
+        "turn_id": turn_id
+    }
 
 
 # ---------------------------
-# 🔥 Pipeline หลัก → เล่นเสียงพูด + ตรวจจับว่ามีคนพูดแทรกหรือไม่
-def run_tts_pipeline(text):
-    global intent_result
+# 🔌 เปิด connection ไปยัง Azure ตอนเริ่ม server
+@app.on_event("startup")
+def startup():
+    tracing.configure_from_env()   # TRACE_JSONL / TRACE_OTLP_ENDPOINT
+    # log ของ uvicorn ลงไฟล์เดียวกัน (บนจอ uvicorn แสดงเองอยู่แล้ว)
+    for name in ("uvicorn", "uvicorn.access"):  # uvicorn.error ส่งต่อไปที่ uvicorn
+        logging.getLogger(name).addHandler(LogWriterHandler())
+    warmup_tts()
+    get_echo_canceller()           # เปิดไมค์ค้างไว้ตั้งแต่เริ่ม service
+    get_player().start()           # เปิดลำโพงค้างไว้ (callback ส่งความเงียบเมื่อไม่มีเสียง)
 
-    # ✅ เริ่มต้น → เคลียร์ signal ทั้งหมด
-    stop_signal.clear()                # ไม่หยุด
-    cancel_signal.clear()              # ไม่มีการแทรก
-    start_vad_signal.clear()           # ยังไม่เริ่ม VAD
-    intent_result = None               # เคลียร์ผล intent
 
-    # ✅ เริ่ม Thread สำหรับ STT ฟังเสียง
-    mic_thread = threading.Thread(target=detect_human_voice_by_stt_continuous)
-    mic_thread.start()
+# ---------------------------
+# 📊 เวลา warmup และ first-byte latency ของ synthesizer
+@app.get("/metrics/")
+async def metrics():
+    return synth_pool.stats()
 
-    try:
-        start_vad_signal.set()         # 🔥 สั่งเริ่ม VAD → ตรวจจับเสียงพูดระหว่างเล่น TTS
 
-        print(f"▶️ เริ่มพูด: {text}")
-        tts_with_cancel_on_speech(text)  # 🔊 เริ่มพูดข้อความ
+# ---------------------------
+# 🏠 เช็คว่า API ทำงานปกติ
+@app.get("/")
+async def read_root():
+    return {"status": "ok", "message": "Azure TTS + STT Interrupt + Intent API is running"}
 
-        # 🔥 เช็คว่าระหว่างพูด มี cancel_signal เกิดขึ้นไหม (แปลว่ามีคนพูดแทรก)
-        if cancel_signal.is_set():
-            if intent_result == "interrupt":
-                # 👉 เจอการแทรก → หยุดชั่วคราว แล้วพูดข้อความต่อ
-                print("👉 เป็นการแทรก → พูดต่อจนจบ")
-                remaining_text = text  # ✅ ในอนาคตสามารถปรับให้แบ่งข้อความได้
-                tts_with_cancel_on_speech(remaining_text)
 
-            elif intent_result == "question":
-                # 👉 ถ้าเป็นคำถาม → หยุดพูด แล้วส่งข้อความต่อไปยัง Chatbot (ยังไม่เขียนในโค้ดนี้)
-                print("👉 เป็นคำถาม → หยุดพูดแล้วไปตอบคำถาม")
-                print("🤖 [AI] → ตอบคำถามตรงนี้")
-                return "question"
+# ---------------------------
+# 🔥 Pipeline หลัก → เล่นเสียงพูด + ตรวจจับว่ามีคนพูดแทรกหรือไม่
+def run_tts_pipeline(text, resume=False):
+    # ✅ ตรวจจับการพูดแทรกอยู่ใน speak_audio แล้ว: แค่แทรก → พูดต่อจาก sample ที่หยุด (ไม่สังเคราะห์ใหม่ ไม่พูดซ้ำ)
+    try:
+        if resume:
+            write_log("▶️ พูดต่อจากที่หยุดไว้")
+            result = resume_speech()
+        else:
+            write_log(f"▶️ เริ่มพูด: {text}")
+            result = tts_with_cancel_on_speech(text)  # 🔊 เริ่มพูดข้อความ
+
+        if result is None:
+            return "none"
+        intent, resume_offset = result
+        if intent == "question":
+            # 👉 ถ้าเป็นคำถาม → หยุดพูดไว้ตรงนั้น (เรียก /resume/ เพื่อพูดต่อหลังตอบ)
+            write_log(f"👉 เป็นคำถาม → หยุดพูดที่ {resume_offset / SAMPLE_RATE:.2f} วินาที แล้วไปตอบคำถาม")
+            write_log("🤖 [AI] → ตอบคำถามตรงนี้")
 
         # ✅ จบ → คืนค่าผล intent ถ้ามี, ถ้าไม่มี → คืนค่า 'none'
-        return intent_result if intent_result else "none"
+        return intent if intent else "none"
 
     finally:
-        # ✅ ไม่ว่าจะเกิดอะไรขึ้น → สั่งหยุด STT และ VAD
-        stop_signal.set()
-        start_vad_signal.clear()
-        mic_thread.join()
-        print("🛑 เสร็จสิ้น")
-
-
-
+        write_log("🛑 เสร็จสิ้น")
@@ -1,8 +1,21 @@
 # py_audio2face/tests/test_audio2face.py
 
+import asyncio
+import os
+import sys
+import tempfile
+import time
 import unittest
 from unittest.mock import patch, MagicMock
+
+import numpy as np
+import requests
 from py_audio2face.audio2face import Audio2Face
+from py_audio2face.async_audio2face import AsyncAudio2Face
+from py_audio2face.audio2face_pool import Audio2FacePool
+from py_audio2face.export_cache import ExportCache
+from py_audio2face.modules._framing import PcmFramer
+from py_audio2face.modules._supervisor import HeadlessSupervisor, get_headless_launcher
 
 
 class TestAudio2Face(unittest.TestCase):
@@ -15,7 +28,7 @@ class TestAudio2Face(unittest.TestCase):
         # Optional: Clean up after each test
         pass
 
-    @patch('py_audio2face.audio2face.requests.get')
+    @patch('py_audio2face.modules.clients._http_client.requests.Session.request')
     def test_start_headless_server_success(self, mock_get):
         # Simulate a successful status response
         mock_get.return_value.json.return_value = "OK"
@@ -25,44 +38,409 @@ class TestAudio2Face(unittest.TestCase):
 
         self.assertEqual(status, "OK")
 
-    @patch('py_audio2face.audio2face.requests.get')
-    def test_start_headless_server_timeout(self, mock_get):
-        # Simulate a timeout scenario
+    @patch('py_audio2face.modules.clients._http_client.HeadlessSupervisor')
+    @patch('py_audio2face.modules.clients._http_client.get_headless_launcher', MagicMock())
+    @patch('py_audio2face.modules.clients._http_client.requests.Session.request')
+    def test_start_headless_server_timeout(self, mock_get, mock_supervisor):
+        # Simulate a server that is started but never answers the status check in time
         mock_get.return_value.json.return_value = "NOT OK"
+        supervisor = mock_supervisor.return_value
+        supervisor.wait_ready.return_value = False
+        supervisor.running = True
+        supervisor.phase_timings = {}
 
-        a2f = Audio2Face()
-        status = a2f.start_headless_server()
+        a2f = Audio2Face(a2f_install_path="a2f/")
+        status = a2f.start_headless_server(timeout=0.1)
 
         self.assertEqual(status, "timeout")
+        supervisor.start.assert_called_once()
+        supervisor.wait_ready.assert_called_once_with(0.1)
 
-    @patch('py_audio2face.audio2face.os.path.isfile', MagicMock(return_value=True))
-    def test_audio2face_single_with_sample_file(self):
-        # Mocking necessary methods for file existence check
+        supervisor.running = False  # the process died while starting
+        self.assertEqual(a2f.start_headless_server(timeout=0.1), "exited")
 
+    def test_audio2face_single_with_sample_file(self):
+        # Mocking the server calls; without export cache every call exports
         with patch('py_audio2face.audio2face.Audio2Face.init_a2f') as mock_init_a2f, \
                 patch('py_audio2face.audio2face.Audio2Face.set_root_path') as mock_set_root_path, \
                 patch('py_audio2face.audio2face.Audio2Face.set_track') as mock_set_track, \
-                patch('py_audio2face.audio2face.Audio2Face.export_blend_shape') as mock_export_blend_shape:
+                patch('py_audio2face.audio2face.Audio2Face.export') as mock_export:
+            mock_export.return_value = 'path/to/output/sample_animation.usd'
             a2f = Audio2Face()
             sample_audio_file = 'path/to/assets/test_audio_0.wav'
-            output_path = 'path/to/output/sample_animation.usd'
-            a2f.audio2face_single(sample_audio_file, output_path, fps=60)
+            output_path = 'path/to/output/sample_animation'
+            of = a2f.audio2face_single(sample_audio_file, output_path, fps=60)
 
+            self.assertEqual(of, mock_export.return_value)
             mock_init_a2f.assert_called_once()
-            mock_set_root_path.assert_called_once_with('path/to/assets')
+            mock_set_root_path.assert_called_once_with(sample_audio_file)
             mock_set_track.assert_called_once_with(sample_audio_file)
-            mock_export_blend_shape.assert_called_once_with(output_path=output_path, fps=60)
+            mock_export.assert_called_once_with(
+                output_path=output_path, fps=60, format="usd", emotion_auto_detect=True, raise_on_error=False
+            )
+
+    @patch('py_audio2face.audio2face.utils.get_audio2face_install_path', MagicMock(return_value=None))
+    @patch('py_audio2face.modules.clients._http_client.requests.Session.request')
+    def test_install_path_only_needed_to_start_the_server(self, mock_request):
+        mock_request.side_effect = requests.exceptions.ConnectionError("refused")
+
+        a2f = Audio2Face(api_url="http://remote-a2f:8011")  # e.g. a remote server, no local install
+        self.assertIsNone(a2f.a2f_install_path)
+        with self.assertRaises(FileNotFoundError):
+            a2f.start_headless_server()
 
     def test_shutdown_a2f(self):
         # Optional: Write tests for shutdown_a2f method
         pass
 
-    def test_make_request(self):
-        # Optional: Write tests for make_request method
-        pass
+    @patch('py_audio2face.modules.clients._http_client.time.sleep', MagicMock())
+    @patch('py_audio2face.modules.clients._http_client.requests.Session.request')
+    def test_make_request_retries_connection_reset(self, mock_request):
+        ok_response = MagicMock()
+        ok_response.json.return_value = "OK"
+        ok_response.elapsed.total_seconds.return_value = 0.01
+        mock_request.side_effect = [requests.exceptions.ConnectionError("reset"), ok_response]
+
+        a2f = Audio2Face(a2f_install_path="a2f/")
+        status = a2f.make_request("status")
+
+        self.assertEqual(status, "OK")
+        self.assertEqual(mock_request.call_count, 2)
+        stats = a2f.http_stats.summary()["status"]
+        self.assertEqual(stats["calls"], 1)
+        self.assertEqual(stats["retries"], 1)
+        self.assertEqual(stats["errors"], 0)
+
+    @patch('py_audio2face.modules.clients._http_client.time.sleep', MagicMock())
+    def test_refused_connection_is_retried_for_every_route(self):
+        a2f = Audio2Face(api_url="http://127.0.0.1:1", a2f_install_path="a2f/", http_max_retries=2)
+        a2f.post("A2F/Exporter/ExportBlendshapes", payload={})  # nothing was sent, safe to send again
+
+        stats = a2f.http_stats.summary()["A2F/Exporter/ExportBlendshapes"]
+        self.assertEqual((stats["retries"], stats["errors"]), (2, 1))
+
+    def test_reset_after_sending_is_not_retried_for_exports(self):
+        from py_audio2face.mock_server import MockAudio2FaceServer
+
+        with MockAudio2FaceServer(grpc_port=None) as server:
+            a2f = Audio2Face(api_url=server.api_url, a2f_install_path="a2f/")
+            a2f.init_a2f()
+            server.fail_next("A2F/Exporter/ExportBlendshapes", mode="disconnect")
+            res = a2f.post("A2F/Exporter/ExportBlendshapes", payload={})
+            self.assertIsInstance(res, str)  # the caller decides whether to export again
+            self.assertEqual(server.stats()["routes"]["A2F/Exporter/ExportBlendshapes"]["calls"], 1)
+
+            server.fail_next("A2F/Player/SetTrack", mode="disconnect")
+            self.assertEqual(a2f.post("A2F/Player/SetTrack", payload={"file_name": "a.wav"})["status"], "OK")
+            self.assertEqual(server.stats()["routes"]["A2F/Player/SetTrack"]["calls"], 2)
+
+    @patch('py_audio2face.modules.clients._http_client.requests.Session.request')
+    def test_post_uses_route_timeout(self, mock_request):
+        mock_request.return_value.json.return_value = {"status": "OK"}
+        mock_request.return_value.elapsed.total_seconds.return_value = 0.01
+
+        a2f = Audio2Face(a2f_install_path="a2f/", http_timeouts={"A2F/Player/SetTrack": 7})
+        a2f.post("A2F/Player/SetTrack", payload={})
+
+        self.assertEqual(mock_request.call_args.kwargs["timeout"], 7)
+
+    @patch('py_audio2face.modules.clients._http_client.time.sleep', MagicMock())
+    @patch('py_audio2face.modules.clients._http_client.requests.Session.request')
+    def test_setters_only_send_changed_state(self, mock_request):
+        mock_request.return_value.json.return_value = {"status": "OK"}
+        mock_request.return_value.elapsed.total_seconds.return_value = 0.01
+
+        a2f = Audio2Face(a2f_install_path="a2f/")
+        a2f.loaded_scene = "scene.usd"
+
+        a2f.set_emotion(joy=0.8)
+        a2f.set_enable_streaming(True)
+        self.assertEqual(mock_request.call_count, 3)  # SetSettings, SetEmotion, EnableStreaming
+
+        mock_request.reset_mock()
+        a2f.set_emotion(joy=0.8)
+        a2f.set_enable_streaming(True)
+        mock_request.assert_not_called()
+
+        a2f.a2e_set_settings(a2e_contrast=2.0)
+        self.assertEqual(
+            mock_request.call_args.kwargs["json"], {"a2f_instance": a2f.a2e_settings["a2f_instance"], "a2e_contrast": 2.0}
+        )
+
+        # a reset connection means the server may have restarted -> everything is sent again
+        mock_request.reset_mock()
+        ok_response = mock_request.return_value
+        mock_request.side_effect = [requests.exceptions.ConnectionError("reset"), ok_response, ok_response]
+        a2f.set_enable_streaming(True)  # unchanged, not sent
+        a2f.make_request("status")
+        a2f.set_enable_streaming(True)
+        self.assertEqual(mock_request.call_count, 3)
+        self.assertEqual(mock_request.call_args.args[1], "http://localhost:8011/A2F/A2E/EnableStreaming")
+
+    @patch('py_audio2face.modules.clients._http_client.time.sleep', MagicMock())
+    @patch('py_audio2face.modules.clients._http_client.requests.Session.request')
+    def test_scene_is_only_reloaded_after_server_restart(self, mock_request):
+        server = {"instances": [], "reset": False}
+        routes = []
+
+        def request(method, url, json=None, timeout=None):
+            route = url.split("8011/")[1]
+            if server["reset"]:
+                server["reset"] = False
+                raise requests.exceptions.ConnectionError("reset")
+            routes.append(route)
+            if route == "A2F/USD/Load":
+                server["instances"] = ["/World/audio2face/CoreFullface"]
+            response = MagicMock()
+            response.elapsed.total_seconds.return_value = 0.01
+            response.json.return_value = "OK" if route == "status" else {
+                "status": "OK", "result": {"fullface_instances": server["instances"]}
+            }
+            return response
+
+        mock_request.side_effect = request
+        a2f = Audio2Face(a2f_install_path="a2f/")
+
+        a2f.init_a2f()
+        self.assertEqual(routes, ["status", "A2F/GetInstances", "A2F/USD/Load", "A2F/GetInstances"])
+
+        routes.clear()
+        a2f.init_a2f()
+        a2f.set_emotion(joy=0.5)
+        self.assertNotIn("status", routes)
+        self.assertNotIn("A2F/GetInstances", routes)
+
+        # the server restarts: the connection is reset and the new server has no scene
+        server.update(instances=[], reset=True)
+        a2f.make_request("status")
+        self.assertIsNone(a2f.loaded_scene)
+
+        routes.clear()
+        a2f.init_a2f()
+        self.assertIn("A2F/USD/Load", routes)
+        self.assertEqual(a2f.scene_registry.server_epoch, 1)
 
     # Add more test methods as needed
 
 
+@unittest.skipIf(sys.platform == "win32", "uses a shell script as fake headless server")
+class TestHeadlessSupervisor(unittest.TestCase):
+
+    def make_launcher(self, tmp, body):
+        launcher = os.path.join(tmp, "audio2face_headless.sh")
+        with open(launcher, "w") as f:
+            f.write("#!/bin/sh\n" + body)
+        os.chmod(launcher, 0o755)
+        self.assertEqual(get_headless_launcher(tmp), launcher)
+        return launcher
+
+    def test_ready_line_triggers_status_check(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            launcher = self.make_launcher(
+                tmp, 'echo "[ext: omni.audio2face.core] startup"\nsleep 0.2\necho "app ready"\nsleep 5\n'
+            )
+            supervisor = HeadlessSupervisor(launcher, auto_restart=False, poll_interval=30)
+            with patch.object(HeadlessSupervisor, 'check_status', lambda s: s._log_ready.is_set()):
+                supervisor.start()
+                self.assertTrue(supervisor.wait_ready(5))
+            supervisor.stop()
+
+        phases = supervisor.phase_timings
+        self.assertLess(phases["extensions_loading"], phases["app_ready"])
+        self.assertLessEqual(phases["app_ready"], phases["status_ok"])
+        self.assertIn("app ready", supervisor.log)
+        self.assertLess(phases["status_ok"], 5)
+
+    def test_crashed_server_is_restarted(self):
+        started = []
+        with tempfile.TemporaryDirectory() as tmp:
+            launcher = self.make_launcher(tmp, 'echo "app ready"\nsleep 0.2\nexit 3\n')
+            supervisor = HeadlessSupervisor(launcher, on_started=started.append, restart_backoff=0.01)
+            with patch.object(HeadlessSupervisor, 'check_status', lambda s: s._log_ready.is_set()):
+                supervisor.start()
+                self.assertTrue(supervisor.wait_ready(5))
+                deadline = time.time() + 5
+                while supervisor.restarts < 1 and time.time() < deadline:
+                    time.sleep(0.01)
+            supervisor.stop()
+
+        self.assertGreaterEqual(supervisor.restarts, 1)
+        self.assertEqual(supervisor.starts[0]["exit_code"], 3)
+        self.assertEqual(len(started), len(supervisor.starts))
+
+
+class TestAudio2FacePool(unittest.TestCase):
+
+    def test_failed_file_is_retried_on_other_instance(self):
+        files = [f'in/audio_{i}.wav' for i in range(6)]
+
+        def export(self, output_path, raise_on_error=False, **kwargs):
+            if self.api_url.endswith("8011") and output_path.endswith("audio_2_a2f_animation"):
+                raise RuntimeError("export failed")
+            return output_path
+
+        with patch('py_audio2face.audio2face_pool.utils.get_files_in_dir', MagicMock(return_value=files)), \
+                patch('py_audio2face.audio2face.Audio2Face.init_a2f'), \
+                patch('py_audio2face.audio2face.Audio2Face.set_root_path'), \
+                patch('py_audio2face.audio2face.Audio2Face.set_track'), \
+                patch('py_audio2face.audio2face.Audio2Face.export', export):
+            pool = Audio2FacePool(["http://localhost:8011", "http://localhost:8012"], a2f_install_path="a2f/")
+            outputs = pool.audio2face_folder("in", "out")
+
+        self.assertEqual(outputs, [f'out/audio_{i}_a2f_animation' for i in range(6)])
+        self.assertEqual(pool.failed_files, [])
+
+
+class TestExportCache(unittest.TestCase):
+
+    def test_hit_miss_and_invalidation(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            audio = os.path.join(tmp, "line.wav")
+            with open(audio, "wb") as f:
+                f.write(b"RIFF0000WAVE")
+            output = os.path.join(tmp, "out", "line_a2f_animation")
+            os.makedirs(os.path.dirname(output))
+            with open(output + ".usd", "w") as f:
+                f.write("animation")
+
+            cache = ExportCache(os.path.join(tmp, "cache"))
+            settings = Audio2Face.get_default_a2e_settings()
+            key = cache.make_key(audio, settings, None, 60, "usd", False)
+            self.assertIsNone(cache.lookup(key, output, "usd"))
+            cache.store(key, output, "usd")
+            cache.flush()
+
+            # a new cache instance reads the persisted index
+            cache = ExportCache(os.path.join(tmp, "cache"))
+            self.assertEqual(cache.lookup(key, output, "usd"), output)
+
+            # other settings -> other key
+            other_key = cache.make_key(audio, settings, None, 30, "usd", False)
+            self.assertNotEqual(key, other_key)
+            self.assertIsNone(cache.lookup(other_key, output, "usd"))
+
+            # changed output file -> invalid
+            with open(output + ".usd", "w") as f:
+                f.write("changed animation")
+            self.assertIsNone(cache.lookup(key, output, "usd"))
+            self.assertEqual(cache.stats()["hits"], 1)
+            self.assertEqual(cache.stats()["invalidated"], 1)
+
+
+class TestPcmFramer(unittest.TestCase):
+
+    def test_int16_chunks_are_coalesced(self):
+        framer = PcmFramer(16000, target_ms=10, bytes_dtype="int16")  # 160 samples per message
+        chunks = [np.full(50, 16384, dtype=np.int16).tobytes() for _ in range(7)]
+
+        messages = list(framer.frames(chunks))
+
+        self.assertEqual([len(m) // 4 for m in messages], [160, 160, 30])
+        samples = np.frombuffer(b"".join(messages), dtype=np.float32)
+        np.testing.assert_allclose(samples, 0.5)
+
+    def test_resampling_keeps_duration(self):
+        framer = PcmFramer(16000, target_ms=100, target_samplerate=44100)
+        audio = np.sin(np.linspace(0, 100, 16000)).astype(np.float64)
+
+        messages = list(framer.frames(np.array_split(audio, 37)))
+
+        n_out = sum(len(m) for m in messages) // 4
+        self.assertEqual(framer.out_samplerate, 44100)
+        self.assertAlmostEqual(n_out, 44100, delta=3)
+
+
+class TestAsyncAudio2Face(unittest.IsolatedAsyncioTestCase):
+
+    async def test_set_track_posts_payload(self):
+        import httpx
+
+        requests_seen = []
+
+        def handler(request):
+            requests_seen.append(request)
+            return httpx.Response(200, json={"status": "OK"})
+
+        a2f = AsyncAudio2Face(a2f_install_path="a2f/")
+        a2f.http_client = httpx.AsyncClient(base_url=a2f.api_url, transport=httpx.MockTransport(handler))
+        async with a2f:
+            with patch('py_audio2face.async_audio2face.os.path.isfile', MagicMock(return_value=True)):
+                res = await a2f.set_track('path/to/assets/test_audio_0.wav')
+
+        self.assertEqual(res, {"status": "OK"})
+        self.assertEqual(requests_seen[0].url.path, "/A2F/Player/SetTrack")
+        self.assertEqual(a2f.http_stats.summary()["A2F/Player/SetTrack"]["calls"], 1)
+
+
+    async def test_stream_audio_reuses_the_grpc_channel(self):
+        from py_audio2face.mock_server import MockAudio2FaceServer
+
+        with MockAudio2FaceServer(playback_speed=100.0) as server:
+            async with AsyncAudio2Face(api_url=server.api_url, a2f_install_path="a2f/") as a2f:
+                for _ in range(2):
+                    success = await a2f.stream_audio(
+                        [np.zeros(4410, np.float32)], samplerate=44100, grpc_port=server.grpc_port
+                    )
+                    self.assertTrue(success)
+                    self.assertEqual(len(a2f.grpc_channels), 1)
+                channel = a2f.grpc_channels[("localhost", server.grpc_port)]
+                self.assertIs(a2f.get_grpc_channel(server.grpc_port), channel)
+            self.assertEqual(a2f.grpc_channels, {})  # closed with the client
+            self.assertEqual(server.stats()["streaming"]["samples"], 2 * 4410)
+
+    async def test_matches_the_sync_setters_and_export(self):
+        from py_audio2face.mock_server import MockAudio2FaceServer
+
+        with MockAudio2FaceServer(grpc_port=None) as server:
+            async with AsyncAudio2Face(api_url=server.api_url, a2f_install_path="a2f/") as a2f:
+                await a2f.set_emotion(joy=1.0)
+                self.assertEqual(a2f.emotion[6], 1.0)
+
+                server.fail_next("A2F/Exporter/ExportBlendshapes", mode="error")
+                with tempfile.TemporaryDirectory() as tmp, self.assertRaises(RuntimeError):
+                    await a2f.export(os.path.join(tmp, "anim"), raise_on_error=True)
+
+    async def test_stream_audio_in_background_can_be_cancelled(self):
+        from py_audio2face.mock_server import MockAudio2FaceServer
+
+        async def endless_audio():
+            while True:
+                yield np.zeros(441, np.float32)
+                await asyncio.sleep(0.01)
+
+        events = []
+        with MockAudio2FaceServer(playback_speed=1.0) as server:
+            async with AsyncAudio2Face(api_url=server.api_url, a2f_install_path="a2f/") as a2f:
+                task = a2f.stream_audio_in_background(
+                    endless_audio(), samplerate=44100, grpc_port=server.grpc_port, on_progress=events.append
+                )
+                await asyncio.sleep(0.3)
+                task.cancel()
+                with self.assertRaises(asyncio.CancelledError):
+                    await task
+
+        self.assertEqual(events[-1].state, "cancelled")
+        self.assertTrue(any(e.state == "sending" for e in events))
+        self.assertGreater(events[-1].samples_sent, 0)
+
+    async def test_folder_export_is_cached(self):
+        from py_audio2face.mock_server import MockAudio2FaceServer
+
+        with tempfile.TemporaryDirectory() as tmp, MockAudio2FaceServer(grpc_port=None) as server:
+            audio_dir, out_dir = os.path.join(tmp, "audio"), os.path.join(tmp, "out")
+            os.makedirs(audio_dir)
+            os.makedirs(out_dir)
+            with open(os.path.join(audio_dir, "a.wav"), "wb") as f:
+                f.write(b"RIFF0000WAVE")
+
+            for _ in range(2):
+                async with AsyncAudio2Face(
+                        api_url=server.api_url, a2f_install_path="a2f/", export_cache_dir=os.path.join(tmp, "cache")
+                ) as a2f:
+                    files = await a2f.audio2face_folder(audio_dir, out_dir)
+            self.assertEqual(len(files), 1)
+            self.assertTrue(files[0].startswith(os.path.join(out_dir, "a_a2f_animation")))
+            self.assertEqual(server.stats()["routes"]["A2F/Exporter/ExportBlendshapes"]["calls"], 1)
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,73 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from py_audio2face.audio_conversion import (
+    PolyphaseResampler, StreamConverter, convert_buffer, convert_wav_file, read_wav, resample, to_int16, to_mono,
+    write_wav
+)
+
+
+def sine(freq, rate, seconds, amplitude=0.5):
+    t = np.arange(int(rate * seconds)) / rate
+    return amplitude * np.sin(2 * np.pi * freq * t)
+
+
+class TestAudioConversion(unittest.TestCase):
+
+    def test_resample_matches_reference_sine(self):
+        # the reference output is the same sine sampled at the target rate
+        for src, dst in [(16000, 44100), (24000, 44100), (48000, 44100), (44100, 16000)]:
+            audio = sine(440, src, 1.0).astype(np.float32)
+            out = resample(audio, src, dst)
+            reference = sine(440, dst, 1.0)
+
+            self.assertEqual(len(out), dst)
+            # skip the filter edges, where the reference has no zero padded history
+            np.testing.assert_allclose(out[200:-200], reference[200:-200], atol=1e-3)
+
+    def test_streamed_chunks_match_whole_buffer(self):
+        audio = np.random.default_rng(0).standard_normal(24000).astype(np.float32) * 0.1
+        whole = resample(audio, 24000, 44100)
+
+        r = PolyphaseResampler(24000, 44100)
+        chunks = [r.process(c) for c in np.array_split(audio, 37)] + [r.flush()]
+
+        np.testing.assert_allclose(np.concatenate(chunks), whole, atol=1e-6)
+
+    def test_downmix_and_int16(self):
+        stereo = np.stack([np.full(10, 1000, np.int16), np.full(10, 3000, np.int16)], axis=1)
+        np.testing.assert_array_equal(to_mono(stereo), np.full(10, 2000, np.int16))
+
+        np.testing.assert_array_equal(to_int16(np.array([0.0, 0.5, -1.0, 2.0])), [0, 16384, -32768, 32767])
+
+    def test_stream_converter_matches_convert_buffer(self):
+        stereo = (np.stack([sine(300, 16000, 0.5), sine(500, 16000, 0.5)], axis=1) * 32767).astype(np.int16)
+        whole = convert_buffer(stereo, 16000)
+
+        conv = StreamConverter(16000)
+        streamed = np.concatenate([conv.process(c) for c in np.array_split(stereo, 9)] + [conv.flush()])
+
+        self.assertEqual(whole.dtype, np.int16)
+        self.assertEqual(len(whole), 44100 // 2)
+        np.testing.assert_allclose(streamed.astype(np.int32), whole.astype(np.int32), atol=1)
+
+    def test_convert_wav_file(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            src = os.path.join(tmp, "in.wav")
+            dst = os.path.join(tmp, "out.wav")
+            write_wav(src, sine(440, 16000, 0.25), 16000)
+
+            convert_wav_file(src, dst)
+            audio, rate = read_wav(dst)
+
+        self.assertEqual(rate, 44100)
+        self.assertEqual(audio.dtype, np.int16)
+        self.assertEqual(audio.ndim, 1)
+        self.assertEqual(len(audio), 44100 // 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
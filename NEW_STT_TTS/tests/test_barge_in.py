@@ -0,0 +1,114 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from audio_fixtures import RATE, LoudIsSpeech, silence, tone, voiced
+from barge_in import BargeInDetector
+from log_writer import close_log, configure_log
+from mic_hub import MicHub
+from vad import webrtcvad_installed
+
+class TestBargeInDetector(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        configure_log(os.path.join(self.tmp.name, "log.txt"), echo=False)
+        self.hub = MicHub(sample_rate=RATE)
+        self.barge_in = threading.Event()
+        self.hub_position_at_barge_in = []
+        self.utterances = []
+        self.utterance_ready = threading.Event()
+
+    def tearDown(self):
+        close_log()
+        self.tmp.cleanup()
+
+    def on_barge_in(self):
+        self.hub_position_at_barge_in.append(self.hub.position)
+        self.barge_in.set()
+
+    def on_utterance(self, audio):
+        self.utterances.append(audio)
+        self.utterance_ready.set()
+
+    def feed(self, audio, block_ms=30):
+        block = int(RATE * block_ms / 1000)
+        for i in range(0, len(audio), block):
+            self.hub.feed(audio[i:i + block])
+
+    def test_cancels_within_tens_of_ms_and_hands_over_the_utterance(self):
+        detector = BargeInDetector(self.hub, self.on_barge_in, self.on_utterance, vad=LoudIsSpeech(),
+                                   start_ms=60, hangover_ms=300, preroll_ms=120)
+        with detector:
+            self.feed(silence(600))
+            speech_start = self.hub.position
+            self.feed(tone(60))
+            self.assertTrue(self.barge_in.wait(1))
+            # fired once two 30ms frames of speech were seen, not after the utterance
+            self.assertLessEqual(self.hub_position_at_barge_in[0] - speech_start, int(RATE * 0.09))
+            self.assertFalse(self.utterance_ready.is_set())
+
+            self.feed(tone(840))
+            self.feed(silence(600))
+            self.assertTrue(self.utterance_ready.wait(1))
+
+        audio = self.utterances[0]
+        # preroll + 900ms of speech, without the hangover that ended it
+        self.assertEqual(len(audio), int(RATE * (0.12 + 0.9)))
+        self.assertEqual(audio[:int(RATE * 0.12)].tolist(), silence(600)[-int(RATE * 0.12):].tolist())
+        self.assertEqual(audio[int(RATE * 0.12):int(RATE * 0.18)].tolist(), tone(60).tolist())
+        self.assertEqual(detector.stats()["barge_ins"], 1)
+
+    def test_noise_below_the_energy_gate_is_ignored(self):
+        detector = BargeInDetector(self.hub, self.on_barge_in, self.on_utterance, vad=LoudIsSpeech())
+        with detector:
+            self.feed(tone(1000, amplitude=200))
+        self.assertFalse(self.barge_in.is_set())
+        self.assertEqual(detector.stats()["vad"]["gated"], 33)
+
+    def test_long_speech_is_truncated(self):
+        detector = BargeInDetector(self.hub, self.on_barge_in, self.on_utterance, vad=LoudIsSpeech(),
+                                   preroll_ms=0, max_utterance_s=1)
+        with detector:
+            self.feed(tone(1500))
+            self.assertTrue(self.utterance_ready.wait(1))
+        self.assertEqual(detector.stats()["truncated"], 1)
+        self.assertEqual(len(self.utterances[0]), RATE)
+
+
+    @unittest.skipUnless(webrtcvad_installed, "webrtcvad is not installed")
+    def test_real_vad(self):
+        detector = BargeInDetector(self.hub, self.on_barge_in, self.on_utterance)
+        with detector:
+            self.feed(silence(600))
+            self.feed(voiced(900))
+            self.assertTrue(self.barge_in.wait(1))
+            self.feed(silence(900))
+            self.assertTrue(self.utterance_ready.wait(1))
+        stats = detector.stats()
+        self.assertIsNone(stats["error"])
+        self.assertEqual(stats["barge_ins"], 1)
+        self.assertGreater(stats["vad"]["vad_calls"], 0)
+
+    def test_broken_vad_is_reported(self):
+        class Broken:
+            def is_speech(self, buffer, sample_rate):
+                raise RuntimeError("Error while processing frame")
+
+        errors = []
+        failed = threading.Event()
+        detector = BargeInDetector(self.hub, self.on_barge_in, self.on_utterance, vad=Broken(),
+                                   on_error=lambda e: (errors.append(e), failed.set()))
+        with detector:
+            for _ in range(40):  # one failing callback per block, at device pace
+                self.feed(tone(30))
+                time.sleep(0.002)
+            self.assertTrue(failed.wait(2))
+        self.assertFalse(self.barge_in.is_set())
+        self.assertIs(detector.error, errors[0])
+        self.assertIn("Error while processing frame", detector.stats()["error"])
+
+if __name__ == '__main__':
+    unittest.main()
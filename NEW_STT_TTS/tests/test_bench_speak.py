@@ -0,0 +1,45 @@
+import unittest
+
+from bench_speak import compare_with_baseline, percentile, run_benchmark
+
+
+class TestBenchSpeak(unittest.TestCase):
+
+    def test_percentile_nearest_rank(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 95), 95)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([7], 99), 7)
+        self.assertIsNone(percentile([], 50))
+
+    def test_run_against_mock_server(self):
+        results = run_benchmark(
+            jobs=2, concurrency=(1, 2), repeat=1,
+            synth_first_byte_ms=5, synth_realtime_factor=100, rest_latency_ms=0, playback_speed=100
+        )
+        for stage in ("synthesis_first_chunk", "conversion_stream", "send_grpc_stream", "send_file_copy",
+                      "speak_streaming.playback_start", "speak_file", "speak_cached"):
+            self.assertEqual(results["stages"][stage]["count"], 1, stage)
+        self.assertEqual([level["concurrency"] for level in results["concurrency"]], [1, 2])
+        for level in results["concurrency"]:
+            self.assertEqual(level["failures"], 0)
+            self.assertEqual(level["latency"]["count"], 2)
+            self.assertGreater(level["audio_s_per_s"], 0)
+
+        self.assertEqual(compare_with_baseline(results, results), [])
+
+    def test_regression_against_baseline(self):
+        def stage(p95):
+            return {"count": 10, "p50": p95 / 2, "p95": p95, "p99": p95}
+
+        baseline = {"stages": {"synthesis": stage(100), "conversion_stream": stage(1)}, "concurrency": []}
+        results = {"stages": {"synthesis": stage(150), "conversion_stream": stage(2)}, "concurrency": []}
+
+        regressions = compare_with_baseline(results, baseline, tolerance=0.25, min_delta_ms=2.0)
+        self.assertEqual(len(regressions), 1)  # conversion_stream doubled, but only by 1 ms
+        self.assertTrue(regressions[0].startswith("synthesis"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import time
+import unittest
+
+import numpy as np
+
+from echo_canceller import EchoCanceller
+from mic_hub import MicHub
+
+RATE = 16000
+BLOCK = 480
+
+
+def energy(samples):
+    samples = samples.astype(np.float64)
+    return float(np.dot(samples, samples))
+
+
+class TestEchoCanceller(unittest.TestCase):
+
+    def setUp(self):
+        self.hub = MicHub(sample_rate=RATE)
+        self.canceller = EchoCanceller(self.hub)
+        self.received = []
+        self.canceller.start().subscribe(self.received.append, "test")
+
+    def tearDown(self):
+        self.canceller.stop()
+
+    def play(self, reference, mic):
+        """ push each speaker block, then feed the mic block captured while it played, at device pace """
+        for i in range(0, len(mic), BLOCK):
+            if reference is not None and i < len(reference):
+                self.canceller.push_reference(reference[i:i + BLOCK])
+            self.hub.feed(mic[i:i + BLOCK])
+            deadline = time.perf_counter() + 1
+            while self.canceller.output.position < self.hub.position and time.perf_counter() < deadline:
+                time.sleep(0.0005)
+        time.sleep(0.05)
+        return np.concatenate(self.received)
+
+    def test_removes_delayed_echo_and_keeps_the_user(self):
+        rng = np.random.default_rng(1)
+        avatar = (rng.standard_normal(RATE * 2) * 3000).astype(np.int16)
+        delay = int(RATE * 0.08)
+        echo = np.concatenate((np.zeros(delay), 0.4 * avatar[:-delay]))
+        user = np.zeros(RATE * 2)
+        user[int(RATE * 1.5):] = 2500 * np.sin(2 * np.pi * 300 * np.arange(RATE // 2) / RATE)
+        mic = (echo + user).astype(np.int16)
+
+        out = self.play(avatar, mic)
+        stats = self.canceller.stats()
+        self.assertEqual(stats["delay_ms"], 80)
+        self.assertAlmostEqual(stats["gain"], 0.4, delta=0.02)
+
+        echo_only = slice(int(RATE * 0.5), int(RATE * 1.5))
+        self.assertLess(energy(out[echo_only]), 0.01 * energy(mic[echo_only]))
+        double_talk = slice(int(RATE * 1.6), RATE * 2)
+        self.assertGreater(energy(out[double_talk]), 0.8 * energy(user[double_talk]))
+        self.assertGreater(stats["erle_db"], 20)
+
+    def test_passthrough_without_reference(self):
+        mic = (np.random.default_rng(2).standard_normal(RATE) * 1000).astype(np.int16)
+        out = self.play(None, mic)
+        self.assertEqual(out.tolist(), mic.tolist())
+        self.assertIsNone(self.canceller.stats()["delay_ms"])
+
+
+if __name__ == '__main__':
+    unittest.main()
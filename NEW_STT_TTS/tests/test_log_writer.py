@@ -0,0 +1,88 @@
+import logging
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from log_writer import BufferedLogWriter, LogWriterHandler
+
+
+class TestLogWriter(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "log.txt")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def read(self, path=None):
+        with open(path or self.path, encoding="utf-8") as f:
+            return f.read().splitlines()
+
+    def test_lines_are_written_in_order_with_timestamp(self):
+        writer = BufferedLogWriter(self.path, echo=False)
+        for i in range(100):
+            writer.write(f"ข้อความ {i}", time.time())
+        writer.write("no timestamp")
+        writer.close()
+
+        lines = self.read()
+        self.assertEqual(len(lines), 101)
+        self.assertTrue(lines[0].startswith("[") and lines[0].endswith("] ข้อความ 0"))
+        self.assertEqual(lines[-1], "no timestamp")
+        self.assertLess(writer.stats()["batches"], 101)
+
+    def test_rotation_by_size_and_time(self):
+        writer = BufferedLogWriter(self.path, max_bytes=50, backup_count=2, rotate_interval_s=0, echo=False)
+        for i in range(4):
+            writer.write("x" * 40)
+            writer.flush()
+        writer.close()
+        self.assertEqual(writer.stats()["rotations"], 3)
+        self.assertTrue(os.path.exists(self.path + ".2"))
+        self.assertFalse(os.path.exists(self.path + ".3"))  # only backup_count old files are kept
+
+        path = os.path.join(self.tmp.name, "daily.txt")
+        writer = BufferedLogWriter(path, max_bytes=0, backup_count=5, rotate_interval_s=0.05, echo=False)
+        writer.write("before")
+        writer.flush()
+        time.sleep(0.1)
+        writer.write("after")
+        writer.close()
+        self.assertEqual(self.read(path), ["after"])
+        self.assertEqual(self.read(path + ".1"), ["before"])
+
+    def test_full_queue_drops_instead_of_blocking(self):
+        writer = BufferedLogWriter(self.path, queue_size=5, echo=False)
+        release = threading.Event()
+        write_batch = writer._write_batch
+        writer._write_batch = lambda batch: (release.wait(5), write_batch(batch))
+        writer.write("blocks the writer thread")
+        time.sleep(0.05)
+
+        start = time.perf_counter()
+        accepted = sum(writer.write(f"line {i}") for i in range(20))
+        self.assertLess(time.perf_counter() - start, 0.1)
+        self.assertEqual(accepted, 5)
+        self.assertEqual(writer.stats()["dropped"], 15)
+
+        release.set()
+        writer.close()
+        self.assertEqual(len(self.read()), 6)
+
+    def test_logging_handler(self):
+        writer = BufferedLogWriter(self.path, echo=False)
+        logger = logging.getLogger("test_log_writer")
+        logger.addHandler(LogWriterHandler(writer))
+        try:
+            logger.warning("uvicorn line")
+        finally:
+            logger.handlers.clear()
+        writer.close()
+        self.assertTrue(self.read()[0].endswith("test_log_writer WARNING: uvicorn line"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+import wave
+
+import numpy as np
+
+from log_writer import close_log, configure_log
+from mic_hub import MicHub, RingBuffer
+
+
+class TestMicHub(unittest.TestCase):
+
+    def test_ring_buffer_wraps_and_reports_lost_samples(self):
+        ring = RingBuffer(10)
+        ring.write(np.arange(7, dtype=np.int16))
+        data, cursor, lost = ring.read(0)
+        self.assertEqual(data.tolist(), list(range(7)))
+        self.assertEqual((cursor, lost), (7, 0))
+
+        ring.write(np.arange(7, 14, dtype=np.int16))  # wraps around the end of the buffer
+        data, cursor, lost = ring.read(cursor)
+        self.assertEqual(data.tolist(), list(range(7, 14)))
+
+        ring.write(np.arange(14, 40, dtype=np.int16))  # reader falls more than a buffer behind
+        data, cursor, lost = ring.read(cursor)
+        self.assertEqual(data.tolist(), list(range(30, 40)))
+        self.assertEqual((cursor, lost), (40, 16))
+
+    def test_fan_out_frames_without_gaps(self):
+        hub = MicHub(sample_rate=16000, buffer_s=2)
+        hub.feed(np.full(160, -1, dtype=np.int16))  # 10ms before anyone subscribes
+        received = {"vad": [], "stt": []}
+        vad = hub.subscribe(received["vad"].append, "vad", frame_ms=30)
+        stt = hub.subscribe(received["stt"].append, "stt", preroll_ms=10)
+
+        audio = np.arange(16000, dtype=np.int16)
+        for i in range(0, len(audio), 333):  # blocks that do not line up with VAD frames
+            hub.feed(audio[i:i + 333])
+        vad.close()
+        stt.close()
+
+        frames = received["vad"]
+        self.assertTrue(all(len(f) == 480 for f in frames))
+        self.assertEqual(np.concatenate(frames).tolist(), audio[:len(frames) * 480].tolist())
+        self.assertEqual(len(frames), 16000 // 480)
+        self.assertEqual(np.concatenate(received["stt"]).tolist(), [-1] * 160 + audio.tolist())
+        self.assertEqual(hub.stats()["active"], [])
+
+    def test_slow_subscriber_does_not_block_others(self):
+        hub = MicHub(sample_rate=1000, buffer_s=1)
+        release = threading.Event()
+        fast = []
+        slow = hub.subscribe(lambda samples: release.wait(5), "slow")
+        fast_sub = hub.subscribe(fast.append, "fast")
+
+        hub.feed(np.zeros(10, dtype=np.int16))
+        time.sleep(0.05)  # slow subscriber is now stuck in its callback
+        start = time.perf_counter()
+        for _ in range(30):
+            for _ in range(10):
+                hub.feed(np.ones(10, dtype=np.int16))
+            while fast_sub.position < hub.position and time.perf_counter() - start < 5:  # pace like a real device
+                time.sleep(0.001)
+        self.assertLess(time.perf_counter() - start, 1)
+
+        fast_sub.close()
+        self.assertEqual(sum(len(s) for s in fast), 3010)
+        release.set()
+        slow.close()
+        self.assertEqual(slow.dropped, 3000 - 1000)
+
+    def test_failing_callback_is_closed_and_reported(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        configure_log(os.path.join(tmp.name, "log.txt"), echo=False)
+        self.addCleanup(close_log)
+        hub = MicHub(sample_rate=16000)
+        failed = threading.Event()
+        errors = []
+
+        def broken(samples):
+            raise ValueError("bad frame")
+
+        sub = hub.subscribe(broken, "broken", frame_ms=30,
+                            on_error=lambda e: (errors.append(e), failed.set()))
+        hub.feed(np.zeros(480 * 30, dtype=np.int16))
+        self.assertTrue(failed.wait(2))
+        sub.close()
+
+        self.assertEqual(sub.errors, 20)  # stops calling after MAX_CONSECUTIVE_ERRORS
+        self.assertIsInstance(errors[0], ValueError)
+        with self.assertRaises(RuntimeError) as ctx:
+            sub.raise_if_failed()
+        self.assertIs(ctx.exception.__cause__, errors[0])
+        self.assertEqual(hub.stats()["failed"], 1)
+        self.assertEqual(hub.stats()["active"], [])
+
+    def test_record_to_wav(self):
+        hub = MicHub(sample_rate=16000)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "mic.wav")
+            recorder = hub.record(path)
+            hub.feed(np.arange(1600, dtype=np.int16))
+            recorder.close()
+            with wave.open(path, "rb") as wav:
+                self.assertEqual(wav.getframerate(), 16000)
+                self.assertEqual(wav.readframes(wav.getnframes()), np.arange(1600, dtype=np.int16).tobytes())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+import json
+import os
+import tempfile
+import time
+import unittest
+
+import numpy as np
+
+from py_audio2face import tracing
+from py_audio2face.audio2face import Audio2Face
+from py_audio2face.audio_conversion import write_wav
+from py_audio2face.mock_server import MockAudio2FaceServer
+
+
+class TestMockServer(unittest.TestCase):
+
+    def setUp(self):
+        self.server = MockAudio2FaceServer(playback_speed=1.0, seed=0).start()
+        self.a2f = Audio2Face(api_url=self.server.api_url, a2f_install_path="a2f/")
+
+    def tearDown(self):
+        self.a2f.close_streaming_sessions()
+        self.server.stop()
+
+    def test_export_against_mock(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            audio = os.path.join(tmp, "hello.wav")
+            write_wav(audio, np.zeros(22050, np.int16), 44100)
+
+            self.a2f.audio2face_single(audio, os.path.join(tmp, "out", "hello_anim"), fps=30, emotion_auto_detect=False)
+
+            self.assertTrue(os.path.isfile(os.path.join(tmp, "out", "hello_anim.usd")))
+        routes = self.server.stats()["routes"]
+        self.assertEqual(routes["A2F/USD/Load"]["calls"], 1)
+        self.assertEqual(routes["A2F/Exporter/ExportBlendshapes"]["failures"], 0)
+
+    def test_streaming_follows_playback_clock(self):
+        start = time.perf_counter()
+        success = self.a2f.stream_audio(
+            (np.zeros(4410, np.float32) for _ in range(5)), samplerate=44100, grpc_port=self.server.grpc_port
+        )
+
+        self.assertTrue(success)
+        self.assertGreaterEqual(time.perf_counter() - start, 0.5)  # 0.5 s of audio, blocking until played
+        self.assertEqual(self.server.stats()["streaming"]["samples"], 5 * 4410)
+
+    def test_failure_injection_and_restart(self):
+        self.a2f.init_a2f()
+        self.server.fail_next("A2F/A2E/SetEmotion", mode="error")
+        self.assertEqual(self.a2f.set_emotion(joy=1.0)["status"], "ERROR")
+        self.assertEqual(self.a2f.set_emotion(joy=1.0)["status"], "OK")
+
+        # restarted while we were calling: the connection is refused and the scene reloaded on the next call
+        self.server.stop()
+        self.a2f.make_request("status", retries=0)
+        self.server.start()
+        self.a2f.set_emotion(joy=1.0)
+        self.assertIsNotNone(self.server.state.usd_file)
+        self.assertEqual(self.server.state.emotion[6], 1.0)
+
+        # restarted between two calls: noticed once the scene check interval passed
+        self.server.restart()
+        self.a2f.scene_registry.check_interval = 0
+        self.a2f.set_emotion(joy=1.0)
+        self.assertIsNotNone(self.server.state.usd_file)
+        self.assertEqual(self.server.state.emotion[6], 1.0)
+
+
+    def test_setters_keep_the_streaming_scene(self):
+        self.a2f.stream_audio(np.zeros(4410, np.float32), samplerate=44100, grpc_port=self.server.grpc_port)
+        streaming_scene = self.server.state.usd_file
+        self.assertIn("streaming", streaming_scene)
+
+        self.a2f.scene_registry.check_interval = 0  # the scene check expired
+        self.a2f.set_emotion(joy=1.0)
+        self.assertEqual(self.server.state.usd_file, streaming_scene)
+        self.assertEqual(self.server.stats()["routes"]["A2F/USD/Load"]["calls"], 1)
+
+    def test_background_stream_updates_the_scene_registry_and_trace(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        trace_path = os.path.join(tmp.name, "trace.jsonl")
+        tracing.configure(jsonl_path=trace_path)
+        self.addCleanup(tracing.shutdown)
+
+        # the player instance is missing: the scene is checked again before the next stream
+        handle = self.a2f.stream_audio_in_background(
+            [np.zeros(441, np.float32)], samplerate=44100, instance_name="/World/missing",
+            grpc_port=self.server.grpc_port
+        )
+        self.assertFalse(handle.result(timeout=5))
+        self.assertFalse(self.a2f.scene_registry.is_loaded())
+
+        # the server went away while streaming
+        self.a2f.init_a2f(streaming=True)
+        self.server.stop()
+        handle = self.a2f.stream_audio_in_background(
+            [np.zeros(441, np.float32)], samplerate=44100, grpc_port=self.server.grpc_port
+        )
+        with self.assertRaises(Exception):
+            handle.result(timeout=15)
+        self.assertFalse(self.a2f.scene_registry.server_up)
+
+        tracing.flush()
+        with open(trace_path, encoding="utf-8") as f:
+            spans = [s for s in map(json.loads, f) if s["name"] == "a2f.stream"]
+        self.assertEqual(len(spans), 2)
+        self.assertEqual(spans[0]["attributes"]["state"], "finished")
+        self.assertFalse(spans[0]["attributes"]["success"])
+        self.assertEqual(spans[1]["status"], "error")
+
+    def test_failed_scene_load_is_not_registered(self):
+        self.server.fail_next("A2F/USD/Load", mode="error")
+        self.a2f.init_a2f()
+        self.assertFalse(self.a2f.scene_registry.is_loaded())
+        self.assertIsNone(self.a2f.loaded_scene)
+
+        self.a2f.init_a2f()  # loaded on the next call
+        self.assertTrue(self.a2f.scene_registry.is_loaded())
+        self.assertEqual(self.server.stats()["routes"]["A2F/USD/Load"]["calls"], 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from phrase_cache import PhraseCache
+
+
+class TestPhraseCache(unittest.TestCase):
+
+    def test_key_ignores_whitespace_but_not_voice_or_emotion(self):
+        cache = PhraseCache(None)
+        a = cache.make_key("th-TH-AcharaNeural", "happy", "<speak>\n  <voice>สวัสดีค่ะ</voice>\n</speak>")
+        b = cache.make_key("th-TH-AcharaNeural", "happy", "<speak><voice>สวัสดีค่ะ</voice></speak>")
+        self.assertEqual(a, b)
+        self.assertNotEqual(a, cache.make_key("th-TH-AcharaNeural", "sad", "<speak><voice>สวัสดีค่ะ</voice></speak>"))
+        self.assertNotEqual(a, cache.make_key("th-TH-NiwatNeural", "happy", "<speak><voice>สวัสดีค่ะ</voice></speak>"))
+
+    def test_memory_lru(self):
+        cache = PhraseCache(None, memory_bytes=2 * 200)  # 2 phrases of 100 int16 samples
+        for key in ("a", "b"):
+            cache.put(key, np.full(100, 1, np.int16))
+        cache.get("a")
+        cache.put("c", np.full(100, 1, np.int16))
+
+        self.assertIsNotNone(cache.get("a"))
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.stats()["memory_items"], 2)
+
+    def test_disk_tier_survives_restart_and_is_capped(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = PhraseCache(tmp, memory_bytes=0, disk_bytes=3 * 200)
+            for i, key in enumerate("abcd"):
+                cache.put(key, np.full(100, i, np.int16))
+                os.utime(os.path.join(tmp, key + ".pcm"), (i, i))
+
+            self.assertEqual(sorted(os.listdir(tmp)), ["b.pcm", "c.pcm", "d.pcm"])
+
+            reopened = PhraseCache(tmp)
+            np.testing.assert_array_equal(reopened.get("c"), np.full(100, 2, np.int16))
+            self.assertIsNone(reopened.get("a"))
+            self.assertEqual(reopened.stats()["disk_hits"], 1)
+            self.assertEqual(reopened.stats()["disk_bytes"], 3 * 200)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+import os
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+
+from log_writer import close_log, configure_log
+from playback import FINISHED, PAUSED, PLAYING, PlaybackEngine
+
+BLOCK = 160
+
+
+class TestPlaybackEngine(unittest.TestCase):
+
+    def setUp(self):
+        self.played = []
+        self.engine = PlaybackEngine(sample_rate=16000, block_ms=10, fade_ms=5,
+                                     on_output=lambda out: self.played.append(out.copy()))
+        self.audio = np.full(16000, 1000, dtype=np.int16)
+
+    def render(self, blocks=1):
+        for _ in range(blocks):
+            self.engine.render(np.empty(BLOCK, dtype=np.int16))
+
+    def test_plays_to_the_end(self):
+        self.engine.load(np.arange(400, dtype=np.int16))
+        self.render(4)
+        heard = np.concatenate(self.played)
+        self.assertEqual(heard[:400].tolist(), list(range(400)))
+        self.assertEqual(heard[400:].tolist(), [0] * 80)
+        self.assertEqual(self.engine.wait(0), FINISHED)
+        self.assertEqual(self.engine.remaining, 0)
+
+    def test_pause_fades_within_one_block_and_resumes_at_the_exact_sample(self):
+        self.engine.load(self.audio)
+        self.render(3)
+        offset = self.engine.pause(wait=False)  # requested from another thread, e.g. barge-in
+        self.assertEqual(offset, 3 * BLOCK)
+        self.render()
+
+        fade = self.played[-1]
+        self.assertEqual(fade[0], 1000)
+        self.assertTrue(np.all(np.diff(fade[:80]) <= 0))
+        self.assertEqual(fade[80:].tolist(), [0] * 80)
+        self.assertEqual(self.engine.wait(0), PAUSED)
+        resume_offset = self.engine.position
+        self.assertEqual(resume_offset, 3 * BLOCK + 80)  # the faded samples count as heard
+
+        out = np.ones(BLOCK, dtype=np.int16)
+        self.engine.render(out)
+        self.assertEqual(out.tolist(), [0] * BLOCK)  # silence while paused
+        self.assertEqual(len(self.played), 4)        # and nothing reported as speaker output
+
+        self.engine.resume()
+        self.render()
+        fade_in = self.played[-1]
+        self.assertEqual(fade_in[0], 0)
+        self.assertEqual(fade_in[80:].tolist(), [1000] * 80)
+        self.assertEqual(self.engine.position, resume_offset + BLOCK)
+        self.assertEqual(self.engine.state, PLAYING)
+
+    def test_load_from_a_resume_offset_and_stop(self):
+        audio = np.arange(1000, dtype=np.int16)
+        self.engine.load(audio, start=600)
+        self.render()
+        self.assertEqual(self.played[0][80:].tolist(), list(range(680, 760)))
+        self.assertEqual(self.engine.stop(wait=False), 760)
+        self.render()
+        self.assertEqual(self.engine.wait(0), FINISHED)
+        self.assertEqual(self.engine.position, 840)
+
+    def test_wait_returns_when_paused_from_another_thread(self):
+        self.engine.load(self.audio)
+        result = []
+        waiter = threading.Thread(target=lambda: result.append(self.engine.wait(2)))
+        waiter.start()
+        self.render()
+        self.engine.pause(wait=False)
+        self.render()
+        waiter.join(2)
+        self.assertEqual(result, [PAUSED])
+
+    def test_load_during_a_render_is_not_overwritten_by_the_old_block(self):
+        old = np.arange(200, dtype=np.int16)
+        new = np.full(1000, 7, dtype=np.int16)
+        self.engine.load(old, start=100)  # the last block of the old audio, with a fade-in
+        linspace = np.linspace
+
+        def load_while_rendering(*args, **kwargs):
+            self.engine.load(new)  # e.g. the next sentence, loaded from another thread
+            return linspace(*args, **kwargs)
+
+        with patch("playback.np.linspace", side_effect=load_while_rendering):
+            self.render()
+
+        self.assertEqual(self.engine.state, PLAYING)  # not FINISHED by the old audio
+        self.assertEqual(self.engine.position, 0)
+        self.assertEqual(self.played, [])
+        self.render()
+        self.assertEqual(self.played[-1].tolist(), [7] * BLOCK)
+
+    def test_output_errors_are_counted_and_the_callback_kept(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        log_path = os.path.join(tmp.name, "log.txt")
+        configure_log(log_path, echo=False)
+        calls = []
+
+        def flaky(out):
+            calls.append(len(out))
+            if len(calls) <= 2:
+                raise ValueError("reference buffer busy")
+
+        self.engine.on_output = flaky
+        self.engine.load(self.audio)
+        self.render(4)
+        close_log()
+
+        self.assertEqual(len(calls), 4)  # still called after the failures
+        stats = self.engine.stats()
+        self.assertEqual(stats["output_errors"], 2)
+        self.assertIn("reference buffer busy", stats["last_output_error"])
+        with open(log_path, encoding="utf-8") as f:
+            self.assertEqual(f.read().count("reference buffer busy"), 1)
+
+if __name__ == '__main__':
+    unittest.main()
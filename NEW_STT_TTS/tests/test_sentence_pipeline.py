@@ -0,0 +1,74 @@
+import threading
+import time
+import unittest
+
+from sentence_pipeline import pipelined, split_text
+
+
+class TestSentencePipeline(unittest.TestCase):
+
+    def test_split_thai_at_spaces_and_english_at_punctuation(self):
+        thai = "สวัสดีค่ะ ยินดีต้อนรับสู่ร้านของเรา วันนี้มีโปรโมชั่นพิเศษสำหรับสมาชิก สนใจสอบถามพนักงานได้เลยค่ะ"
+        self.assertEqual(
+            split_text(thai, first_max_chars=20, max_chars=60),
+            ["สวัสดีค่ะ", "ยินดีต้อนรับสู่ร้านของเรา วันนี้มีโปรโมชั่นพิเศษสำหรับสมาชิก", "สนใจสอบถามพนักงานได้เลยค่ะ"]
+        )
+        self.assertEqual(
+            split_text("Hi there. How can I help you today? Ask me anything.", first_max_chars=10, max_chars=40),
+            ["Hi there.", "How can I help you today?", "Ask me anything."]
+        )
+
+    def test_chunks_respect_limits(self):
+        text = "This answer is long, it has clauses; and a lot of words " * 5 + "ก" * 300
+        chunks = split_text(text, first_max_chars=30, max_chars=80)
+
+        self.assertLessEqual(len(chunks[0]), 30)
+        self.assertTrue(all(len(c) <= 80 for c in chunks))
+        self.assertEqual("".join(chunks).replace(" ", ""), text.replace(" ", ""))
+
+    def test_pipelined_keeps_order_and_synthesizes_ahead(self):
+        started = []
+
+        def synthesize(chunk):
+            started.append(chunk)
+            for i in range(3):
+                time.sleep(0.005)
+                yield f"{chunk}{i}"
+
+        out = []
+        for piece in pipelined(["a", "b", "c"], synthesize, ahead=1):
+            if piece == "a0":
+                time.sleep(0.1)
+                # the next chunk is synthesized while the first one is still being consumed, but no further
+                self.assertEqual(started, ["a", "b"])
+            out.append(piece)
+
+        self.assertEqual(out, ["a0", "a1", "a2", "b0", "b1", "b2", "c0", "c1", "c2"])
+
+    def test_pipelined_stops_when_consumer_stops(self):
+        closed = threading.Event()
+
+        def synthesize(chunk):
+            try:
+                while True:
+                    time.sleep(0.005)
+                    yield chunk
+            finally:
+                closed.set()
+
+        stream = pipelined(["a", "b"], synthesize)
+        self.assertEqual(next(stream), "a")
+        stream.close()
+        self.assertTrue(closed.wait(1))
+
+    def test_pipelined_reraises_errors(self):
+        def synthesize(chunk):
+            yield chunk
+            raise RuntimeError("azure error")
+
+        with self.assertRaises(RuntimeError):
+            list(pipelined(["a"], synthesize))
+
+
+if __name__ == '__main__':
+    unittest.main()
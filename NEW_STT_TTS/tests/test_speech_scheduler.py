@@ -0,0 +1,70 @@
+import threading
+import time
+import unittest
+
+from speech_scheduler import QueueFullError, SpeechScheduler
+
+
+class TestSpeechScheduler(unittest.TestCase):
+
+    def test_same_avatar_is_serialized(self):
+        running = {}
+        overlaps = []
+        lock = threading.Lock()
+
+        def handler(avatar):
+            with lock:
+                if running.get(avatar):
+                    overlaps.append(avatar)
+                running[avatar] = True
+            time.sleep(0.02)
+            with lock:
+                running[avatar] = False
+
+        scheduler = SpeechScheduler(handler, workers=3, max_queue=20)
+        jobs = [scheduler.submit(avatar, avatar) for avatar in ["a", "a", "b", "a", "b"]]
+        for job in jobs:
+            self.assertTrue(job.finished.wait(2))
+        scheduler.shutdown()
+
+        self.assertEqual(overlaps, [])
+        self.assertEqual(scheduler.metrics()["completed"], 5)
+
+    def test_overflow_policies(self):
+        gate = threading.Event()
+
+        def handler(text):
+            gate.wait(2)
+
+        reject = SpeechScheduler(handler, workers=1, max_queue=1, overflow="reject")
+        reject.submit("a", "running")
+        time.sleep(0.05)
+        reject.submit("a", "queued")
+        with self.assertRaises(QueueFullError):
+            reject.submit("a", "too much")
+
+        drop = SpeechScheduler(handler, workers=1, max_queue=1, overflow="drop_oldest")
+        drop.submit("a", "running")
+        time.sleep(0.05)
+        oldest = drop.submit("a", "queued")
+        drop.submit("a", "newest")
+        self.assertEqual(oldest.status, "dropped")
+
+        coalesce = SpeechScheduler(handler, workers=1, max_queue=1, overflow="coalesce")
+        coalesce.submit("a", "running")
+        time.sleep(0.05)
+        old = coalesce.submit("a", "old")
+        coalesce.submit("a", "new")
+        self.assertEqual(old.status, "coalesced")
+        with self.assertRaises(QueueFullError):
+            coalesce.submit("b", "other avatar")
+
+        gate.set()
+        for scheduler in (reject, drop, coalesce):
+            scheduler.shutdown()
+        self.assertEqual(reject.metrics()["rejected"], 1)
+        self.assertEqual(drop.metrics()["queue_depth"], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,5 @@
 # นำเข้า Library ที่ใช้
 import azure.cognitiveservices.speech as speechsdk
-import sounddevice as sd
 import numpy as np
 import threading
 import time
@@ -8,6 +7,14 @@ import os
 from dotenv import load_dotenv
 from pathlib import Path
 import random
+import sys
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))  # โมดูลที่อยู่ระดับบนของโปรเจกต์
+from synthesizer_pool import SynthesizerPool
+from py_audio2face import tracing
+from barge_in import BargeInDetector
+from echo_canceller import get_echo_canceller
+from playback import PlaybackEngine, PAUSED
 
 
 # ---------- Load API KEY ----------
@@ -22,12 +29,24 @@ AZURE_REGION = os.getenv("AZURE_SPEECH_REGION")
 SAMPLE_RATE = 16000
 FRAME_DURATION = 30
 FRAME_SIZE = int(SAMPLE_RATE * FRAME_DURATION / 1000)
+INTENT_TIMEOUT_S = 10     # รอคนพูดแทรกจบ + Azure ถอดความ นานสุดเท่านี้
+
+
+# ---------- Synthesizer pool (เชื่อมต่อ Azure ไว้ล่วงหน้า) ----------
+TTS_OUTPUT_FORMAT = speechsdk.SpeechSynthesisOutputFormat.Raw16Khz16BitMonoPcm
+synth_pool = SynthesizerPool(AZURE_SPEECH_KEY, AZURE_REGION)
+
+
+def warmup_tts():
+    warmup_ms = synth_pool.warmup([(None, TTS_OUTPUT_FORMAT)])
+    print("🔌 warmup synthesizer (ms):", warmup_ms)
 
 
 # ---------- Signal ----------
 stop_signal = threading.Event()
 cancel_signal = threading.Event()
 start_vad_signal = threading.Event()
+intent_ready = threading.Event()   # ถอดความเสียงที่พูดแทรกและแยก intent เสร็จแล้ว
 intent_result = None
 
 
@@ -51,175 +70,179 @@ def check_intent(text):
     return "interrupt"
 
 
-# ---------- STT Detect ----------
-def detect_human_voice_by_stt_continuous():
-    global intent_result
-
+# ---------- STT เฉพาะเสียงที่พูดแทรก ----------
+def recognize_audio(audio_np):
+    """ ถอดความเสียง int16 16kHz ที่ตัดมาแล้ว (recognize_once บน PushAudioInputStream) """
     speech_config = speechsdk.SpeechConfig(subscription=AZURE_SPEECH_KEY, region=AZURE_REGION)
     speech_config.speech_recognition_language = "th-TH"
-    audio_config = speechsdk.audio.AudioConfig(use_default_microphone=True)
+    stream_format = speechsdk.audio.AudioStreamFormat(samples_per_second=SAMPLE_RATE, bits_per_sample=16, channels=1)
+    push_stream = speechsdk.audio.PushAudioInputStream(stream_format=stream_format)
+    push_stream.write(audio_np.tobytes())
+    push_stream.close()
 
     recognizer = speechsdk.SpeechRecognizer(
-        speech_config=speech_config, audio_config=audio_config
+        speech_config=speech_config, audio_config=speechsdk.audio.AudioConfig(stream=push_stream)
     )
+    result = recognizer.recognize_once()
+    if result.reason == speechsdk.ResultReason.RecognizedSpeech:
+        return result.text.strip()
+    return ""
 
-    def recognized(evt):
-        global intent_result
-        if start_vad_signal.is_set():
-            text = evt.result.text.strip()
-            if text:
-                print(f"🛑 ตรวจพบเสียงพูด: {text}")
-                intent_result = check_intent(text)
-                cancel_signal.set()
 
-    def canceled(evt):
-        print(f"❌ STT ยกเลิก: {evt}")
+# ---------- Barge-in Detect (VAD ในเครื่อง) ----------
+def on_barge_in():
+    # 🔥 เรียกทันทีที่ VAD เจอเสียงพูด → หยุดพูดก่อน แล้วค่อยรู้ intent ทีหลัง
+    if start_vad_signal.is_set():
+        intent_ready.clear()
+        cancel_signal.set()
+        if _player is not None:
+            _player.pause(wait=False)  # fade-out ใน block ถัดไปของลำโพง (ไม่ต้องรอ thread ที่เล่นเสียง)
 
-    recognizer.recognized.connect(recognized)
-    recognizer.canceled.connect(canceled)
 
-    recognizer.start_continuous_recognition()
+def on_interruption_audio(audio_np):
+    # 🎙️ คนพูดแทรกจบแล้ว → ถอดความเฉพาะเสียงช่วงนี้ แล้วแยก intent
+    global intent_result
+    with tracing.span("stt.barge_in", audio_s=len(audio_np) / SAMPLE_RATE) as span:
+        try:
+            text = recognize_audio(audio_np)
+        except Exception as e:
+            span.record_error(e)
+            text = ""
+        span.set(chars=len(text))
+    if text:
+        print(f"🛑 ตรวจพบเสียงพูด: {text}")
+        intent_result = check_intent(text)
+    else:
+        print("🔇 ไม่ได้ยินเป็นคำพูด → พูดต่อ")
+        intent_result = None
+    intent_ready.set()
 
-    while not stop_signal.is_set():
-        time.sleep(0.2)
 
-    recognizer.stop_continuous_recognition()
+def on_barge_in_error(e):
+    print(f"❌ ตรวจจับการพูดแทรกไม่ได้แล้ว (พูดต่อจนจบโดยไม่ฟังไมค์): {e}")
 
 
-# ---------- TTS ----------
-# ---------- TTS ----------
+def detect_barge_in():
+    # ✅ VAD บนไมค์ตัวเดียวที่เปิดค้างไว้ → cancel_signal ภายในหลักสิบ ms หลังเริ่มพูด (ไม่ต้องรอ Azure)
+    # ✅ ฟังเสียงที่ตัด echo แล้ว → เสียง avatar เองที่รั่วจากลำโพงไม่นับเป็นการพูดแทรก
+    with BargeInDetector(get_echo_canceller().output, on_barge_in, on_interruption_audio,
+                         on_error=on_barge_in_error):
+        stop_signal.wait()
 
-def tts_with_cancel_on_speech(text):
-    global intent_result
 
-    if not AZURE_SPEECH_KEY or not AZURE_REGION:
-        print("❌ กรุณาใส่คีย์ใน .env")
-        return
-
-    cancel_signal.clear()
-    start_vad_signal.clear()
-    intent_result = None
+def wait_for_intent():
+    """ รอให้คนพูดแทรกจบและแยก intent เสร็จ, คืนค่า intent (None = ไม่ใช่คำพูด/หมดเวลา → พูดต่อ) """
+    if not intent_ready.wait(INTENT_TIMEOUT_S):
+        print("⌛ รอ intent นานเกินไป → พูดต่อ")
+    return intent_result
 
-    speech_config = speechsdk.SpeechConfig(subscription=AZURE_SPEECH_KEY, region=AZURE_REGION)
-    speech_config.set_speech_synthesis_output_format(
-        speechsdk.SpeechSynthesisOutputFormat.Raw16Khz16BitMonoPcm
-    )
 
-    synthesizer = speechsdk.SpeechSynthesizer(speech_config=speech_config, audio_config=None)
-    result = synthesizer.speak_text_async(text).get()
+# ---------- Playback ----------
+_player = None
+last_audio = None       # เสียงล่าสุดที่พูด → พูดต่อได้โดยไม่ต้องสังเคราะห์ใหม่
+resume_offset = 0       # sample ของ last_audio ที่ยังไม่ได้เล่น
 
-    if result.reason != speechsdk.ResultReason.SynthesizingAudioCompleted:
-        print("❌ ผิดพลาด:", speechsdk.CancellationDetails.from_result(result).error_details)
-        return
 
-    audio_data = result.audio_data
-    audio_np = np.frombuffer(audio_data, dtype=np.int16)
+def get_player():
+    # ✅ ลำโพงตัวเดียวที่เปิดค้างไว้ เล่นผ่าน callback, ส่ง PCM ทุก block เป็น reference ให้ตัวตัด echo
+    global _player
+    if _player is None:
+        _player = PlaybackEngine(SAMPLE_RATE, on_output=get_echo_canceller().push_reference)
+    return _player
 
-    audio_duration = len(audio_np) / SAMPLE_RATE
-    print(f"🕒 ความยาวเสียง {audio_duration:.2f} วินาที")
 
-    chunk_size = int(SAMPLE_RATE * 0.3)
+def speak_audio(audio_np, start=0):
+    """ เล่นเสียงตั้งแต่ sample ที่ start พร้อมตรวจจับการพูดแทรก
+        แทรกแต่ไม่ใช่คำถาม → เล่นต่อจาก sample ที่หยุด, เป็นคำถาม → หยุดแล้วคืนค่าตำแหน่งที่หยุดไว้
+        คืนค่า (intent, resume_offset) """
+    global intent_result, last_audio, resume_offset
 
-    print("▶️ เริ่มพูด...")
+    player = get_player()
+    last_audio, resume_offset = audio_np, start
 
     stop_signal.clear()
     cancel_signal.clear()
+    intent_ready.clear()
     start_vad_signal.set()
     intent_result = None
 
-    mic_thread = threading.Thread(target=detect_human_voice_by_stt_continuous)
+    mic_thread = threading.Thread(target=tracing.bind(detect_barge_in))  # span ของ STT อยู่ใน turn เดียวกัน
     mic_thread.start()
 
     start_time = time.time()
+    try:
+        with tracing.span("playback", audio_s=(len(audio_np) - start) / SAMPLE_RATE,
+                          start_s=start / SAMPLE_RATE) as playback_span:
+            player.play(audio_np, start)
+            playback_span.add_event("first_audio")
 
-    with sd.OutputStream(samplerate=SAMPLE_RATE, channels=1, dtype='int16') as stream:
-        i = 0
-        while i < len(audio_np):
-            if cancel_signal.is_set():
+            while player.wait() == PAUSED:  # on_barge_in สั่ง pause → fade-out ภายใน 1 block ของลำโพง
+                resume_offset = player.position
                 interrupt_emotion = get_interrupt_emotion()
                 interrupt_gesture = get_interrupt_gesture()
 
-                print("🛑 หยุดพูดเพราะมีเสียงพูดแทรก")
+                print(f"🛑 หยุดพูดเพราะมีเสียงพูดแทรก (ที่ {resume_offset / SAMPLE_RATE:.2f} วินาที)")
                 print(f"🤖 [Emotion: {interrupt_emotion}] [Gesture: {interrupt_gesture}] → แสดงอารมณ์ตอนโดนขัด")
+                playback_span.add_event("barge_in", position_s=resume_offset / SAMPLE_RATE)
 
-                if intent_result == "question":
-                    print("👉 เป็นคำถาม → หยุดเล่าแล้วไปตอบคำถาม")
-                    print("🤖 [AI] → ตอบคำถามตรงนี้")
-                    stop_signal.set()
-                    start_vad_signal.clear()
-                    mic_thread.join()
-                    return  # ⛔ หยุดพูดทันทีเพื่อไปตอบ
-
-                elif intent_result == "interrupt":
-                    print("👉 เป็นแค่การแทรก → หยุด 2 วินาทีแล้วพูดต่อ")
-                    time.sleep(4)  # 🛑 หยุด 2 วินาที
-                    cancel_signal.clear()  # 🟩 เคลียร์ signal เพื่อพูดต่อ
-
-            end = min(i + chunk_size, len(audio_np))
-            stream.write(audio_np[i:end])
-            i = end
+                intent = wait_for_intent()  # รอคนพูดจบ + ถอดความเฉพาะเสียงที่พูดแทรก
+                playback_span.add_event("interrupted", intent=intent, position_s=resume_offset / SAMPLE_RATE)
 
-    elapsed_time = time.time() - start_time
-    print(f"🕒 ใช้เวลาพูดจริง {elapsed_time:.2f} วินาที")
+                if intent == "question":
+                    print("👉 เป็นคำถาม → หยุดเล่าแล้วไปตอบคำถาม (พูดต่อภายหลังได้ด้วย resume_speech)")
+                    print("🤖 [AI] → ตอบคำถามตรงนี้")
+                    player.stop()
+                    return intent, resume_offset  # ⛔ หยุดพูดเพื่อไปตอบ
 
-    start_vad_signal.clear()
-    stop_signal.set()
-    mic_thread.join()
+                print("👉 เป็นแค่การแทรก → พูดต่อจาก sample ที่หยุด")
+                cancel_signal.clear()  # 🟩 เคลียร์ signal เพื่อพูดต่อ
+                player.resume()
+    finally:
+        start_vad_signal.clear()
+        stop_signal.set()
+        mic_thread.join()
 
+    resume_offset = len(audio_np)
+    print(f"🕒 ใช้เวลาพูดจริง {time.time() - start_time:.2f} วินาที")
     print("✅ พูดจนจบ")
+    return intent_result, resume_offset
 
 
-# ---------- ฟังก์ชันพูดต่อ ----------
-def tts_with_cancel_on_speech_from_audio(audio_np):
-    chunk_size = int(SAMPLE_RATE * 0.3)
+# ---------- TTS ----------
+def tts_with_cancel_on_speech(text):
+    """ สังเคราะห์แล้วพูด, คืนค่า (intent, resume_offset) ของ speak_audio หรือ None ถ้าสังเคราะห์ไม่ได้ """
+    if not AZURE_SPEECH_KEY or not AZURE_REGION:
+        print("❌ กรุณาใส่คีย์ใน .env")
+        return None
 
-    stop_signal.clear()
-    cancel_signal.clear()
-    start_vad_signal.set()
-    global intent_result
-    intent_result = None
+    with tracing.span("tts.synthesis", chars=len(text), streaming=False) as span:
+        result = synth_pool.speak(text, output_format=TTS_OUTPUT_FORMAT, is_ssml=False)
+        if result.reason != speechsdk.ResultReason.SynthesizingAudioCompleted:
+            span.record_error(result.reason)
 
-    mic_thread = threading.Thread(target=detect_human_voice_by_stt_continuous)
-    mic_thread.start()
+    if result.reason != speechsdk.ResultReason.SynthesizingAudioCompleted:
+        print("❌ ผิดพลาด:", speechsdk.CancellationDetails.from_result(result).error_details)
+        return None
 
-    start_time = time.time()
+    audio_np = np.frombuffer(result.audio_data, dtype=np.int16)
+    print(f"🕒 ความยาวเสียง {len(audio_np) / SAMPLE_RATE:.2f} วินาที")
+    print("▶️ เริ่มพูด...")
+    return speak_audio(audio_np)
 
-    with sd.OutputStream(samplerate=SAMPLE_RATE, channels=1, dtype='int16') as stream:
-        i = 0
-        while i < len(audio_np):
-            if cancel_signal.is_set():
-                interrupt_emotion = get_interrupt_emotion()
-                interrupt_gesture = get_interrupt_gesture()
 
-                print("🛑 หยุดพูดเพราะมีเสียงพูดแทรก")
-                print(f"🤖 [Emotion: {interrupt_emotion}] [Gesture: {interrupt_gesture}] → แสดงอารมณ์ตอนโดนขัด")
-                time.sleep(2)  # ✅ หยุด 2 วินาทีหลังถูกขัด
-                break
-
-            end = min(i + chunk_size, len(audio_np))
-            stream.write(audio_np[i:end])
-            i = end
-
-    elapsed_time = time.time() - start_time
-    print(f"🕒 ใช้เวลาพูดต่อ {elapsed_time:.2f} วินาที")
-
-    start_vad_signal.clear()
-    stop_signal.set()
-    mic_thread.join()
-
-    if cancel_signal.is_set():
-        if intent_result == "interrupt":
-            print("👉 เป็นแค่การแทรก → พูดต่อจากที่หยุด")
-            remaining_audio = audio_np[i:]
-            if len(remaining_audio) > 0:
-                tts_with_cancel_on_speech_from_audio(remaining_audio)
-            else:
-                print("✅ ไม่มีเนื้อหาค้าง → จบแล้ว")
-        elif intent_result == "question":
-            print("👉 เป็นคำถาม → หยุดเล่าแล้วไปตอบคำถาม")
-            print("🤖 [AI] → ตอบคำถามตรงนี้")
-    else:
-        print("✅ พูดจนจบ")
+# ---------- ฟังก์ชันพูดต่อ ----------
+def tts_with_cancel_on_speech_from_audio(audio_np, start=0):
+    # เสียงที่สังเคราะห์ไว้แล้ว → เล่นต่อจาก sample ที่ start
+    return speak_audio(audio_np, start)
+
+
+def resume_speech():
+    """ พูดต่อจากจุดที่หยุดไว้ (เช่น หลังตอบคำถามเสร็จ) โดยไม่สังเคราะห์ใหม่และไม่พูดซ้ำ """
+    if last_audio is None or resume_offset >= len(last_audio):
+        print("✅ ไม่มีเนื้อหาค้าง → จบแล้ว")
+        return None
+    print(f"▶️ พูดต่อจาก {resume_offset / SAMPLE_RATE:.2f} วินาที")
+    return speak_audio(last_audio, resume_offset)
 
 
 # ---------- Main ----------
@@ -0,0 +1,120 @@
+import json
+import os
+import tempfile
+import threading
+import unittest
+
+from py_audio2face import tracing
+from py_audio2face.audio2face import Audio2Face
+from py_audio2face.mock_server import MockAudio2FaceServer
+from speech_scheduler import SpeechScheduler
+
+
+class TestTracing(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "trace.jsonl")
+
+    def tearDown(self):
+        tracing.shutdown()
+        self.tmp.cleanup()
+
+    def read_spans(self):
+        tracing.flush()
+        with open(self.path, encoding="utf-8") as f:
+            return {s["name"]: s for s in map(json.loads, f)}
+
+    def test_disabled_is_noop(self):
+        self.assertFalse(tracing.tracer.enabled)
+        with tracing.span("tts.synthesis", chars=3) as span:
+            span.set(first_chunk_ms=1)
+        self.assertIs(span, tracing.NOOP_SPAN)
+
+    def test_turn_spans_across_threads(self):
+        tracing.configure(jsonl_path=self.path)
+        with tracing.trace_turn() as turn_id:
+            with tracing.span("tts.speak"):
+                worker = threading.Thread(target=tracing.bind(lambda: tracing.span("tts.synthesis").end()))
+                worker.start()
+                worker.join()
+                with self.assertRaises(ValueError):
+                    with tracing.span("tts.conversion"):
+                        raise ValueError("bad wav")
+        with tracing.span("outside"):
+            pass
+
+        spans = self.read_spans()
+        speak = spans["tts.speak"]
+        self.assertEqual(speak["trace_id"], turn_id)
+        self.assertIsNone(speak["parent_id"])
+        self.assertEqual(spans["tts.synthesis"]["trace_id"], turn_id)
+        self.assertEqual(spans["tts.synthesis"]["parent_id"], speak["span_id"])
+        self.assertEqual(spans["tts.conversion"]["status"], "error")
+        self.assertIn("bad wav", spans["tts.conversion"]["error"])
+        self.assertNotEqual(spans["outside"]["trace_id"], turn_id)
+
+    def test_otlp_encoding(self):
+        exporter = tracing.OtlpHttpExporter("http://localhost:4318/v1/traces", service_name="test")
+        try:
+            tracing.configure(exporters=[exporter])
+            span = tracing.start_span("a2f.rest", route="status", status_code=200, ok=True, ms=1.5)
+            span.add_event("first_audio")
+            span.record_error("timeout")
+            encoded = exporter.encode([span])
+        finally:
+            tracing.shutdown()
+
+        resource = encoded["resourceSpans"][0]
+        self.assertEqual(resource["resource"]["attributes"][0]["value"], {"stringValue": "test"})
+        otlp_span = resource["scopeSpans"][0]["spans"][0]
+        self.assertEqual(len(otlp_span["traceId"]), 32)
+        self.assertEqual(len(otlp_span["spanId"]), 16)
+        attributes = {a["key"]: a["value"] for a in otlp_span["attributes"]}
+        self.assertEqual(attributes["status_code"], {"intValue": "200"})
+        self.assertEqual(attributes["ok"], {"boolValue": True})
+        self.assertEqual(attributes["ms"], {"doubleValue": 1.5})
+        self.assertEqual(otlp_span["events"][0]["name"], "first_audio")
+        self.assertEqual(otlp_span["status"], {"code": 2, "message": "timeout"})
+
+    def test_correlation_id_that_is_not_a_trace_id(self):
+        tracing.configure(jsonl_path=self.path)
+        with tracing.trace_turn("req-42") as turn_id:
+            self.assertEqual(turn_id, "req-42")
+            self.assertEqual(tracing.current_turn_id(), "req-42")
+            with tracing.span("tts.speak"):
+                pass
+        with tracing.trace_turn("0af7651916cd43dd8448eb211c80319c"):
+            with tracing.span("stt.recognize"):
+                pass
+
+        spans = self.read_spans()
+        speak = spans["tts.speak"]
+        self.assertRegex(speak["trace_id"], "^[0-9a-f]{32}$")
+        self.assertEqual(speak["trace_id"], tracing.trace_id_for("req-42"))  # same id → same trace in every service
+        self.assertEqual(speak["attributes"]["correlation_id"], "req-42")
+        recognize = spans["stt.recognize"]
+        self.assertEqual(recognize["trace_id"], "0af7651916cd43dd8448eb211c80319c")
+        self.assertNotIn("correlation_id", recognize["attributes"])
+
+    def test_a2f_calls_and_scheduler_jobs_join_the_turn(self):
+        tracing.configure(jsonl_path=self.path)
+        with MockAudio2FaceServer(grpc_port=None) as server:
+            a2f = Audio2Face(api_url=server.api_url, a2f_install_path="a2f/")
+            scheduler = SpeechScheduler(lambda: a2f.make_request("status"), workers=1)
+            with tracing.trace_turn("turn-1"):
+                job = scheduler.submit("default")
+            job.finished.wait(5)
+            scheduler.shutdown()
+
+        spans = self.read_spans()
+        trace_id = tracing.trace_id_for("turn-1")
+        self.assertEqual(spans["speech.job"]["trace_id"], trace_id)
+        self.assertEqual(spans["a2f.rest"]["trace_id"], trace_id)
+        self.assertEqual(spans["a2f.rest"]["attributes"]["correlation_id"], "turn-1")
+        self.assertEqual(spans["a2f.rest"]["parent_id"], spans["speech.job"]["span_id"])
+        self.assertEqual(spans["a2f.rest"]["attributes"]["status_code"], 200)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+import unittest
+
+import numpy as np
+
+from audio_fixtures import FRAME, RATE, LoudIsSpeech, silence, tone, voiced
+from vad import VadStage, webrtcvad_installed
+
+
+class TestVadStage(unittest.TestCase):
+
+    def test_energy_gate_skips_classifier_on_silence(self):
+        classifier = LoudIsSpeech()
+        vad = VadStage(sample_rate=RATE, vad=classifier)
+        vad.process(silence(3000))
+        self.assertEqual(classifier.calls, 0)
+        self.assertEqual(vad.stats()["gated"], 100)
+        self.assertEqual(vad.silence_samples, 100 * FRAME)
+        self.assertAlmostEqual(vad.silence_s, 3.0)
+
+        vad.process(tone(300))
+        self.assertEqual(classifier.calls, 10)
+        self.assertEqual(vad.silence_samples, 0)
+
+    def test_smoothing_and_hangover(self):
+        events = []
+        vad = VadStage(sample_rate=RATE, vad=LoudIsSpeech(), start_frames=2, hangover_ms=300,
+                       on_speech_start=lambda pos: events.append(("start", pos)),
+                       on_speech_end=lambda pos: events.append(("end", pos)))
+        audio = np.concatenate([
+            silence(300),
+            tone(30),         # a single click frame is not speech
+            silence(300),
+            tone(600),        # speech starts after 2 frames, reported at its first frame
+            silence(150),     # short pause stays inside the utterance
+            tone(300),
+            silence(600),     # ends after the hangover
+        ])
+        # feed in blocks that do not line up with 30ms frames
+        for i in range(0, len(audio), 333):
+            vad.process(audio[i:i + 333])
+
+        speech_start = int(RATE * 0.63)
+        speech_end = int(RATE * 1.68)
+        self.assertEqual(events, [("start", speech_start), ("end", speech_end)])
+        self.assertFalse(vad.in_speech)
+        self.assertEqual(vad.position, len(audio) // FRAME * FRAME)
+
+    def test_frames_are_views_of_the_input(self):
+        seen = []
+
+        class Recorder:
+            def is_speech(self, buffer, sample_rate):
+                seen.append(buffer)
+                return True
+
+        vad = VadStage(sample_rate=RATE, vad=Recorder(), energy_threshold=0)
+        audio = tone(90)
+        vad.process(audio)
+        self.assertEqual(len(seen), 3)
+        self.assertIsInstance(seen[0], memoryview)
+        self.assertEqual(len(seen[0]), FRAME * 2)
+        self.assertIs(seen[1].obj.base, audio)  # no per-frame copies when blocks are frame-aligned
+
+    def test_loud_frames_pass_the_energy_gate(self):
+        # 480 × 30000² overflows a 32-bit sum (the numpy default on Windows)
+        vad = VadStage(sample_rate=RATE, vad=LoudIsSpeech(), start_frames=1)
+        vad.process(np.full(FRAME, 30000, dtype=np.int16))
+        self.assertEqual(vad.stats()["gated"], 0)
+        self.assertTrue(vad.in_speech)
+
+    @unittest.skipUnless(webrtcvad_installed, "webrtcvad is not installed")
+    def test_real_webrtcvad(self):
+        events = []
+        vad = VadStage(sample_rate=RATE, hangover_ms=300,
+                       on_speech_start=lambda pos: events.append("start"),
+                       on_speech_end=lambda pos: events.append("end"))
+        audio = np.concatenate([silence(300), voiced(900), silence(600)])
+        for i in range(0, len(audio), 333):
+            vad.process(audio[i:i + 333])
+        self.assertEqual(events, ["start", "end"])
+        self.assertGreater(vad.stats()["speech_frames"], 20)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,10 +1,21 @@
 import azure.cognitiveservices.speech as speechsdk
 import requests
+import io
 import os
 import shutil
-import subprocess
 import html
 import re
+import time
+import numpy as np
+from py_audio2face import Audio2Face, tracing
+from py_audio2face.modules._state import is_ok_response
+from py_audio2face.audio_conversion import (
+    convert_wav_file, convert_buffer, read_wav, write_wav, StreamConverter, A2F_SAMPLE_RATE
+)
+from synthesizer_pool import SynthesizerPool
+from phrase_cache import PhraseCache
+from sentence_pipeline import split_text, pipelined
+from log_writer import write_log
 
 AZURE_SPEECH_KEY = "F7LohbW2EaI1JKreS1P9QxlcpM8K2Y09PPLq9eMp0cUITCPzvCuEJQQJ99BEACqBBLyXJ3w3AAAYACOGqVT5"
 AZURE_REGION = "southeastasia"
@@ -14,6 +25,10 @@ LOCAL_WAV_PATH = "D:/TTSPYthon/audio/autoplay.wav"
 CONVERTED_WAV_PATH = "D:/TTSPYthon/audio/autoplay_converted.wav"
 A2F_AUDIO_DIR = "D:/Omniverse"
 A2F_PLAYER_PATH = "/World/audio2face/Player"
+A2F_API_URL = "http://localhost:8011"
+A2F_INSTALL_PATH = None   # ใช้เฉพาะตอนต้องเปิด headless server เอง (None = หาจากที่ติดตั้งปกติ), A2F ที่รันอยู่/เครื่องอื่นไม่ต้องตั้ง
+A2F_GRPC_PORT = 50051
+PHRASE_CACHE_DIR = os.getenv("PHRASE_CACHE_DIR", "D:/TTSPYthon/audio/phrase_cache")  # สร้างตอนใช้ครั้งแรก
 
 def prepare_ssml_text(text):
     safe_text = html.escape(text.strip())
@@ -21,42 +36,130 @@ def prepare_ssml_text(text):
     safe_text = re.sub(r'\s{2,}', r'<break time="300ms"/>', safe_text)
     return safe_text
 
-def tts_with_emotion(text, emotion="neutral"):
-    print(f"สร้างเสียงพร้อมอารมณ์: {emotion}")
-    emotion_presets = {
-        "neutral":  {"rate": "default", "pitch": "+0st"},
-        "happy":    {"rate": "110%", "pitch": "+2st"},
-        "sad":      {"rate": "90%",  "pitch": "-1st"},
-        "angry":    {"rate": "100%", "pitch": "+1st"},
-        "serious":  {"rate": "95%",  "pitch": "-1st"},
-        "excited":  {"rate": "110%", "pitch": "+3st"},
-        "fear":     {"rate": "98%",  "pitch": "-1st"},
-    }
-
-    emo = emotion_presets.get(emotion, emotion_presets["neutral"])
-    rate = emo["rate"]
-    pitch = emo["pitch"]
+EMOTION_PRESETS = {
+    "neutral":  {"rate": "default", "pitch": "+0st"},
+    "happy":    {"rate": "110%", "pitch": "+2st"},
+    "sad":      {"rate": "90%",  "pitch": "-1st"},
+    "angry":    {"rate": "100%", "pitch": "+1st"},
+    "serious":  {"rate": "95%",  "pitch": "-1st"},
+    "excited":  {"rate": "110%", "pitch": "+3st"},
+    "fear":     {"rate": "98%",  "pitch": "-1st"},
+}
+
+# ✅ Streaming: Azure PCM → A2F Streaming Player ผ่าน gRPC โดยไม่เขียนไฟล์
+STREAM_TO_A2F = True
+STREAM_SAMPLE_RATE = 24000
+STREAM_OUTPUT_FORMAT = speechsdk.SpeechSynthesisOutputFormat.Raw24Khz16BitMonoPcm
+STREAM_READ_BYTES = 4800  # 100ms ของ 24kHz 16bit mono
+
+# ✅ คำตอบยาว: แบ่งเป็นช่วงประโยค แล้วสังเคราะห์ช่วงถัดไประหว่างที่ช่วงปัจจุบันกำลังเล่น
+PIPELINE_AHEAD_CHUNKS = 1
+
+FILE_OUTPUT_FORMAT = speechsdk.SpeechSynthesisOutputFormat.Riff24Khz16BitMonoPcm
+
+# ✅ Synthesizer pool: ไม่ต้องสร้าง SpeechConfig/SpeechSynthesizer ใหม่ทุกครั้ง
+# ✅ Phrase cache: ประโยคที่พูดซ้ำ (ทักทาย, fallback) เก็บเป็น PCM ที่พร้อมส่งเข้า A2F แล้ว
+# สร้างตอนเรียกครั้งแรก (ไม่ใช่ตอน import) → import โมดูลนี้ไม่สร้างโฟลเดอร์ cache หรือ synthesizer
+_synth_pool = None
+_phrase_cache = None
+_a2f = None
+
+def get_synth_pool():
+    global _synth_pool
+    if _synth_pool is None:
+        _synth_pool = SynthesizerPool(AZURE_SPEECH_KEY, AZURE_REGION)
+    return _synth_pool
 
+def get_phrase_cache():
+    global _phrase_cache
+    if _phrase_cache is None:
+        _phrase_cache = PhraseCache(PHRASE_CACHE_DIR, samplerate=A2F_SAMPLE_RATE)
+    return _phrase_cache
+
+def get_a2f():
+    global _a2f
+    if _a2f is None:
+        _a2f = Audio2Face(api_url=A2F_API_URL, a2f_install_path=A2F_INSTALL_PATH)
+    return _a2f
+
+def build_ssml(text, emotion="neutral"):
+    emo = EMOTION_PRESETS.get(emotion, EMOTION_PRESETS["neutral"])
     ssml_text = prepare_ssml_text(text)
+    return f"""<speak version=\"1.0\" xml:lang=\"th-TH\"><voice name=\"{VOICE_NAME}\"><prosody rate=\"{emo['rate']}\" pitch=\"{emo['pitch']}\">{ssml_text}</prosody></voice></speak>"""
+
+def print_synthesis_error(result):
+    if result.reason == speechsdk.ResultReason.Canceled:
+        cancellation = result.cancellation_details
+        write_log("❌ ไม่สามารถสร้างเสียง:", cancellation.reason)
+        if cancellation.reason == speechsdk.CancellationReason.Error:
+            write_log("🛑 Error details:", cancellation.error_details)
+
+def tts_with_emotion(text, emotion="neutral"):
+    # ✅ tracing: ทุกขั้นตอนข้างในเป็น span ลูกของ tts.speak (ดู py_audio2face/tracing.py)
+    with tracing.span("tts.speak", emotion=emotion, chars=len(text)) as span:
+        phrase_cache = get_phrase_cache()
+        cache_key = phrase_cache.make_key(VOICE_NAME, emotion, build_ssml(text, emotion))
+        pcm = phrase_cache.get(cache_key)
+        if pcm is not None:
+            write_log(f"⚡ ใช้เสียงจาก phrase cache: {emotion}")
+            span.set(path="cache")
+            return play_cached_phrase(pcm)
 
-    ssml = f"""<speak version=\"1.0\" xml:lang=\"th-TH\"><voice name=\"{VOICE_NAME}\"><prosody rate=\"{rate}\" pitch=\"{pitch}\">{ssml_text}</prosody></voice></speak>"""
-    print("\U0001F4C4 SSML ที่ส่ง:", ssml)
+        if STREAM_TO_A2F:
+            chunks = split_text(text)
+            if len(chunks) > 1:
+                span.set(path="pipeline", chunks=len(chunks))
+                return tts_with_emotion_pipelined(chunks, emotion)
+            span.set(path="streaming")
+            return tts_with_emotion_streaming(text, emotion, cache_key)
+        span.set(path="file")
+        return tts_with_emotion_file(text, emotion, cache_key)
 
-    speech_config = speechsdk.SpeechConfig(subscription=AZURE_SPEECH_KEY, region=AZURE_REGION)
-    audio_config = speechsdk.audio.AudioOutputConfig(filename=LOCAL_WAV_PATH)
-    synthesizer = speechsdk.SpeechSynthesizer(speech_config=speech_config, audio_config=audio_config)
-    result = synthesizer.speak_ssml_async(ssml).get()
+def play_cached_phrase(pcm):
+    """ ส่ง PCM จาก cache (mono int16 44.1kHz) เข้า A2F โดยไม่เรียก Azure และไม่แปลงไฟล์ """
+    enable_emotion_streaming()
+    enable_auto_generate_emotion()
+
+    if not STREAM_TO_A2F:
+        write_wav(CONVERTED_WAV_PATH, pcm, A2F_SAMPLE_RATE)
+        copy_and_send_to_a2f(CONVERTED_WAV_PATH)
+        return True
+
+    success = get_a2f().stream_audio([pcm], samplerate=A2F_SAMPLE_RATE, grpc_port=A2F_GRPC_PORT)
+    if success:
+        write_log("▶️ A2F เล่นเสียงจาก cache จบแล้ว")
+    else:
+        write_log("❌ ส่งเสียงจาก cache ไปยัง A2F ไม่สำเร็จ")
+    return success
+
+def tts_with_emotion_file(text, emotion="neutral", cache_key=None):
+    write_log(f"สร้างเสียงพร้อมอารมณ์: {emotion}")
+    ssml = build_ssml(text, emotion)
+    write_log("\U0001F4C4 SSML ที่ส่ง:", ssml)
+
+    # ✅ ใช้ synthesizer จาก pool (เชื่อมต่อไว้แล้ว) → ได้ WAV ใน memory
+    with tracing.span("tts.synthesis", voice=VOICE_NAME, streaming=False) as span:
+        result = get_synth_pool().speak(ssml, VOICE_NAME, FILE_OUTPUT_FORMAT)
+        if result.reason != speechsdk.ResultReason.SynthesizingAudioCompleted:
+            span.record_error(result.reason)
 
     if result.reason != speechsdk.ResultReason.SynthesizingAudioCompleted:
-        if result.reason == speechsdk.ResultReason.Canceled:
-            cancellation = result.cancellation_details
-            print("❌ ไม่สามารถสร้างเสียง:", cancellation.reason)
-            if cancellation.reason == speechsdk.CancellationReason.Error:
-                print("🛑 Error details:", cancellation.error_details)
+        print_synthesis_error(result)
+        return
+
+    write_log("✅ สร้างเสียงสำเร็จ")
+    try:
+        with tracing.span("tts.conversion", dst_rate=A2F_SAMPLE_RATE):
+            audio, rate = read_wav(io.BytesIO(result.audio_data))
+            converted = convert_buffer(audio, rate, A2F_SAMPLE_RATE)
+            write_wav(CONVERTED_WAV_PATH, converted, A2F_SAMPLE_RATE)
+        write_log("✅ แปลงไฟล์เรียบร้อย:", CONVERTED_WAV_PATH)
+    except Exception as e:
+        write_log("❌ แปลงไฟล์ไม่สำเร็จ:", e)
         return
 
-    print("✅ สร้างเสียงสำเร็จ:", LOCAL_WAV_PATH)
-    convert_to_a2f_format(LOCAL_WAV_PATH, CONVERTED_WAV_PATH)
+    if cache_key:
+        get_phrase_cache().put(cache_key, converted)
 
     # ✅ เปิดโหมด Streaming และ Auto-Generate Emotion
     enable_emotion_streaming()
@@ -64,62 +167,156 @@ def tts_with_emotion(text, emotion="neutral"):
 
     copy_and_send_to_a2f(CONVERTED_WAV_PATH)
 
+def synthesize_pcm_stream(ssml, on_complete=None):
+    """ สร้างเสียงแบบ streaming: คืนค่า generator ที่ yield PCM 16bit mono (STREAM_SAMPLE_RATE) ทีละก้อน
+        ระหว่างที่ Azure ยังสังเคราะห์อยู่
+        on_complete(pcm_bytes) ถูกเรียกเมื่อได้เสียงครบทั้งประโยค (ใช้เก็บลง phrase cache) """
+    # span เริ่มตรงนี้ (ใน thread ของผู้เรียก) เพราะ generator อาจถูกอ่านจาก thread ของ gRPC
+    span = tracing.start_span("tts.synthesis", voice=VOICE_NAME, streaming=True)
+    return _pcm_chunks(ssml, on_complete, span)
+
+def _pcm_chunks(ssml, on_complete, span):
+    received = bytearray() if on_complete else None
+    start = time.perf_counter()
+    n_bytes = 0
+    completed = False
+    try:
+        stream = get_synth_pool().stream(ssml, VOICE_NAME, STREAM_OUTPUT_FORMAT)
+        while True:
+            try:
+                chunk = next(stream)
+            except StopIteration as stop:
+                completed = stop.value
+                break
+            if n_bytes == 0:
+                span.set(first_chunk_ms=1000 * (time.perf_counter() - start))
+            n_bytes += len(chunk)
+            if received is not None:
+                received += chunk
+            yield chunk
+    finally:
+        span.set(completed=bool(completed), audio_s=n_bytes / 2 / STREAM_SAMPLE_RATE)
+        span.end()
+
+    if completed and on_complete:
+        on_complete(bytes(received))
+
+def cache_streamed_phrase(cache_key, pcm_bytes):
+    with tracing.span("tts.conversion", dst_rate=A2F_SAMPLE_RATE, cache=True):
+        pcm = np.frombuffer(pcm_bytes, dtype=np.int16)
+        get_phrase_cache().put(cache_key, convert_buffer(pcm, STREAM_SAMPLE_RATE, A2F_SAMPLE_RATE))
+
+def warmup_tts():
+    """ เชื่อมต่อ Azure ล่วงหน้าตอนเริ่มโปรแกรม """
+    warmup_ms = get_synth_pool().warmup([(VOICE_NAME, STREAM_OUTPUT_FORMAT), (VOICE_NAME, FILE_OUTPUT_FORMAT)])
+    write_log("🔌 warmup synthesizer (ms):", warmup_ms)
+
+def tts_with_emotion_streaming(text, emotion="neutral", cache_key=None):
+    write_log(f"สร้างเสียงพร้อมอารมณ์ (streaming): {emotion}")
+    ssml = build_ssml(text, emotion)
+    write_log("\U0001F4C4 SSML ที่ส่ง:", ssml)
+
+    # ✅ เปิดโหมด Streaming และ Auto-Generate Emotion
+    enable_emotion_streaming()
+    enable_auto_generate_emotion()
+
+    # PCM int16 จาก Azure → แปลงเป็น float32 ใน process → ส่งเข้า A2F ทีละ 100ms
+    on_complete = (lambda pcm_bytes: cache_streamed_phrase(cache_key, pcm_bytes)) if cache_key else None
+    success = get_a2f().stream_audio(
+        synthesize_pcm_stream(ssml, on_complete),
+        samplerate=STREAM_SAMPLE_RATE,
+        bytes_dtype="int16",
+        grpc_port=A2F_GRPC_PORT
+    )
+    if success:
+        write_log("▶️ A2F เล่นเสียง streaming จบแล้ว")
+    else:
+        write_log("❌ ส่งเสียง streaming ไปยัง A2F ไม่สำเร็จ")
+    return success
+
+def synthesize_a2f_chunk(text, emotion="neutral"):
+    """ เสียงของหนึ่งช่วงประโยค เป็น PCM int16 44.1kHz (จาก phrase cache หรือสังเคราะห์ใหม่แล้วเก็บลง cache)
+        ทุกช่วงใช้ voice และ prosody preset เดียวกัน → น้ำเสียงต่อเนื่องกันทั้งคำตอบ """
+    ssml = build_ssml(text, emotion)
+    phrase_cache = get_phrase_cache()
+    cache_key = phrase_cache.make_key(VOICE_NAME, emotion, ssml)
+    pcm = phrase_cache.get(cache_key)
+    if pcm is not None:
+        yield pcm
+        return
+
+    converter = StreamConverter(STREAM_SAMPLE_RATE, A2F_SAMPLE_RATE)
+    on_complete = lambda pcm_bytes: cache_streamed_phrase(cache_key, pcm_bytes)
+    for chunk in synthesize_pcm_stream(ssml, on_complete):
+        yield converter.process(np.frombuffer(chunk, dtype=np.int16))
+    yield converter.flush()
+
+def tts_with_emotion_pipelined(chunks, emotion="neutral"):
+    write_log(f"สร้างเสียงพร้อมอารมณ์ (pipeline {len(chunks)} ช่วง): {emotion}")
+
+    enable_emotion_streaming()
+    enable_auto_generate_emotion()
+
+    # ช่วงที่ N+1 ถูกสังเคราะห์ใน thread พื้นหลังระหว่างที่ช่วงที่ N ถูกส่งเข้า A2F
+    audio = pipelined(chunks, lambda chunk: synthesize_a2f_chunk(chunk, emotion), ahead=PIPELINE_AHEAD_CHUNKS)
+    success = get_a2f().stream_audio(audio, samplerate=A2F_SAMPLE_RATE, grpc_port=A2F_GRPC_PORT)
+    if success:
+        write_log("▶️ A2F เล่นเสียง pipeline จบแล้ว")
+    else:
+        write_log("❌ ส่งเสียง pipeline ไปยัง A2F ไม่สำเร็จ")
+    return success
+
 def convert_to_a2f_format(input_path, output_path):
-    print("\U0001F501 แปลงไฟล์ด้วย ffmpeg...")
-    cmd = ["ffmpeg", "-y", "-i", input_path, "-ac", "1", "-ar", "44100", "-sample_fmt", "s16", output_path]
-    subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-    print("✅ แปลงไฟล์เรียบร้อย:", output_path)
+    write_log("\U0001F501 แปลงไฟล์ (mono 44.1kHz 16bit)...")
+    convert_wav_file(input_path, output_path, dst_rate=A2F_SAMPLE_RATE)
+    write_log("✅ แปลงไฟล์เรียบร้อย:", output_path)
 
 def copy_and_send_to_a2f(filepath):
+    with tracing.span("a2f.file_send", file=os.path.basename(filepath)):
+        _copy_and_send_to_a2f(filepath)
+
+def _copy_and_send_to_a2f(filepath):
     filename = os.path.basename(filepath)
     dest_path = os.path.join(A2F_AUDIO_DIR, filename)
     os.makedirs(A2F_AUDIO_DIR, exist_ok=True)
     shutil.copy2(filepath, dest_path)
-    print("📁 คัดลอกไฟล์ไปยัง A2F:", dest_path)
+    write_log("📁 คัดลอกไฟล์ไปยัง A2F:", dest_path)
 
-    url_set = "http://localhost:8011/A2F/Player/SetTrack"
+    url_set = f"{A2F_API_URL}/A2F/Player/SetTrack"
     payload_set = { "a2f_player": A2F_PLAYER_PATH, "file_name": filename, "time_range": [0, -1] }
     response_set = requests.post(url_set, json=payload_set)
     if response_set.ok:
-        print("✅ โหลดเข้า Player:", filename)
+        write_log("✅ โหลดเข้า Player:", filename)
 
-        url_loop = "http://localhost:8011/A2F/Player/SetLooping"
+        url_loop = f"{A2F_API_URL}/A2F/Player/SetLooping"
         payload_loop = { "a2f_player": A2F_PLAYER_PATH, "loop_audio": False }
         requests.post(url_loop, json=payload_loop)
 
-        url_play = "http://localhost:8011/A2F/Player/Play"
+        url_play = f"{A2F_API_URL}/A2F/Player/Play"
         payload_play = { "a2f_player": A2F_PLAYER_PATH }
         response_play = requests.post(url_play, json=payload_play)
 
         if response_play.ok:
-            print("▶️ A2F เริ่มเล่นเสียง (ไม่วน)")
+            write_log("▶️ A2F เริ่มเล่นเสียง (ไม่วน)")
         else:
-            print("❌ เล่นเสียงไม่สำเร็จ:", response_play.status_code, response_play.text)
+            write_log("❌ เล่นเสียงไม่สำเร็จ:", response_play.status_code, response_play.text)
     else:
-        print("❌ โหลดเสียงไม่สำเร็จ:", response_set.status_code, response_set.text)
+        write_log("❌ โหลดเสียงไม่สำเร็จ:", response_set.status_code, response_set.text)
 
 # ✅ ฟังก์ชันเปิดโหมด Streaming Emotion
+# ส่งผ่าน Audio2Face client: ถ้าค่าบน A2F เป็นแบบนี้อยู่แล้วจะไม่ส่ง HTTP ซ้ำทุกประโยค
 def enable_emotion_streaming():
-    url = "http://localhost:8011/A2F/A2E/EnableStreaming"
-    payload = {
-        "a2f_instance": A2F_PLAYER_PATH,
-        "enable": True  # ✅ ต้องใส่ค่า enable ด้วย
-    }
-    response = requests.post(url, json=payload)
-    if response.ok:
-        print("✅ เปิดโหมด Emotion Streaming")
+    response = get_a2f().set_enable_streaming(True, a2f_instance=A2F_PLAYER_PATH)
+    if is_ok_response(response):
+        write_log("✅ เปิดโหมด Emotion Streaming")
     else:
-        print("❌ เปิด Emotion Streaming ไม่สำเร็จ:", response.status_code, response.text)
+        write_log("❌ เปิด Emotion Streaming ไม่สำเร็จ:", response)
 
 
 # ✅ ฟังก์ชันเปิด Auto-Generate Emotion จากเสียง
 def enable_auto_generate_emotion():
-    url = "http://localhost:8011/A2F/A2E/EnableAutoGenerateOnTrackChange"
-    payload = { "a2f_instance": A2F_PLAYER_PATH, "enable": False }
-    response = requests.post(url, json=payload)
-    if response.ok:
-        print("✅ เปิด Auto-Generate Emotion จากเสียง")
+    response = get_a2f().set_enable_auto_generate_on_track_change(False, a2f_instance=A2F_PLAYER_PATH)
+    if is_ok_response(response):
+        write_log("✅ เปิด Auto-Generate Emotion จากเสียง")
     else:
-        print("❌ เปิด Auto-Generate Emotion ไม่สำเร็จ:", response.status_code, response.text)
-
- 
\ No newline at end of file
+        write_log("❌ เปิด Auto-Generate Emotion ไม่สำเร็จ:", response)
@@ -0,0 +1,124 @@
+# vad.py
+# VAD สำหรับเสียงจากไมค์ (mono int16 จาก mic_hub) ที่ไม่สร้าง array ใหม่ต่อ frame
+# - เสียงที่เข้ามาถูกตัดเป็น frame 30ms: ถ้าตรงขอบ frame ใช้ view ของ array เดิม, ถ้าไม่ตรงคัดลอกลง buffer ที่จองไว้
+#   ส่งให้ webrtcvad เป็น memoryview แบบ byte (len = จำนวน byte ตามที่ webrtcvad คาด)
+# - energy gate: frame ที่เบากว่า energy_threshold (RMS) ถือว่าเงียบทันที ไม่ต้องเรียก webrtcvad
+# - smoothing: ต้องเป็นเสียงพูดติดกัน start_frames frame ถึงนับว่าเริ่มพูด (ตัดเสียงกระแทกสั้นๆ)
+# - hangover: หลังเสียงพูดหายต้องเงียบต่อเนื่อง hangover_ms ถึงนับว่าจบประโยค (ไม่ตัดช่วงหยุดหายใจ)
+# - นับความเงียบเป็นจำนวน sample ไม่ใช้ time.time() → ผลเหมือนเดิมแม้ thread จะถูกหน่วง
+import numpy as np
+
+try:
+    import webrtcvad
+    webrtcvad_installed = True
+except ImportError:
+    webrtcvad_installed = False
+
+SAMPLE_RATE = 16000
+FRAME_MS = 30              # webrtcvad รับได้ 10/20/30 ms
+VAD_AGGRESSIVENESS = 2
+ENERGY_THRESHOLD = 150     # RMS ของ int16 (~ -47 dBFS), เบากว่านี้ไม่ต้องถาม webrtcvad
+START_FRAMES = 2
+HANGOVER_MS = 300
+
+
+class VadStage:
+    def __init__(self, sample_rate=SAMPLE_RATE, frame_ms=FRAME_MS, aggressiveness=VAD_AGGRESSIVENESS,
+                 energy_threshold=ENERGY_THRESHOLD, start_frames=START_FRAMES, hangover_ms=HANGOVER_MS,
+                 vad=None, on_speech_start=None, on_speech_end=None):
+        """
+        sample_rate, frame_ms: ต้องเป็นค่าที่ webrtcvad รองรับ (8/16/32/48 kHz, 10/20/30 ms)
+        aggressiveness: 0-3 ของ webrtcvad
+        energy_threshold: RMS ต่ำกว่านี้ = เงียบ (0 = ส่งทุก frame ให้ webrtcvad)
+        start_frames: จำนวน frame เสียงพูดติดกันก่อนนับว่าเริ่มพูด
+        hangover_ms: เงียบต่อเนื่องนานเท่านี้ถึงนับว่าพูดจบ
+        vad: ตัวตัดสินเสียงพูดที่มี is_speech(buffer, sample_rate) (None = webrtcvad.Vad,
+             ถ้าไม่ได้ติดตั้ง webrtcvad จะใช้ energy gate อย่างเดียว)
+        on_speech_start(position), on_speech_end(position): position = sample ที่เริ่ม/จบเสียงพูด นับจากเริ่ม stage
+        """
+        self.sample_rate = sample_rate
+        self.frame_samples = int(sample_rate * frame_ms / 1000)
+        self.start_frames = start_frames
+        self.hangover_samples = int(sample_rate * hangover_ms / 1000)
+        self.on_speech_start = on_speech_start
+        self.on_speech_end = on_speech_end
+        if vad is None and webrtcvad_installed:
+            vad = webrtcvad.Vad(aggressiveness)
+        self.vad = vad
+        # เทียบพลังงานรวมของ frame (sum of squares) แทน RMS → ไม่ต้องหาร/ถอดราก
+        self._energy_threshold = int(energy_threshold) ** 2 * self.frame_samples
+
+        self._frame = np.zeros(self.frame_samples, dtype=np.int16)   # frame ที่ยังไม่เต็ม
+        self._squares = np.zeros(self.frame_samples, dtype=np.int32)  # ที่คำนวณ energy (int16² ล้น int16)
+        self._fill = 0
+        self.reset()
+
+    def reset(self):
+        self.in_speech = False
+        self.position = 0            # จำนวน sample ที่ประมวลผลแล้ว (เฉพาะ frame เต็ม)
+        self.silence_samples = 0     # เงียบต่อเนื่องมากี่ sample แล้ว
+        self.speech_start = None     # position ที่เริ่มพูดรอบล่าสุด
+        self._speech_run = 0
+        self._fill = 0
+        self._counters = {"frames": 0, "gated": 0, "vad_calls": 0, "speech_frames": 0}
+
+    @property
+    def silence_s(self):
+        return self.silence_samples / self.sample_rate
+
+    def process(self, samples):
+        """ ป้อนเสียง int16 ความยาวเท่าไหร่ก็ได้ คืนค่าสถานะล่าสุด (True = กำลังพูด) """
+        n = len(samples)
+        i = 0
+        if self._fill:  # เติม frame ที่ค้างจากรอบก่อน
+            take = min(self.frame_samples - self._fill, n)
+            self._frame[self._fill:self._fill + take] = samples[:take]
+            self._fill += take
+            i = take
+            if self._fill < self.frame_samples:
+                return self.in_speech
+            self._process_frame(self._frame)
+            self._fill = 0
+
+        end = i + (n - i) // self.frame_samples * self.frame_samples
+        for start in range(i, end, self.frame_samples):
+            self._process_frame(samples[start:start + self.frame_samples])  # view ไม่คัดลอก
+        if end < n:
+            self._fill = n - end
+            self._frame[:self._fill] = samples[end:]
+        return self.in_speech
+
+    def _process_frame(self, frame):
+        self._counters["frames"] += 1
+        np.multiply(frame, frame, out=self._squares, dtype=np.int32)
+        # ผลรวมต้องเป็น int64 เสมอ: บน Windows ค่าเริ่มต้นของ sum() เป็น int32 → เสียงดังล้นกลายเป็นค่าติดลบ
+        if self._squares.sum(dtype=np.int64) < self._energy_threshold:
+            self._counters["gated"] += 1
+            speech = False
+        elif self.vad is None:
+            speech = True
+        else:
+            self._counters["vad_calls"] += 1
+            # webrtcvad นับความยาวจาก len(buffer) เป็น byte → ส่ง view แบบ uint8 (ไม่คัดลอก)
+            speech = self.vad.is_speech(frame.view(np.uint8).data, self.sample_rate)
+
+        self.position += self.frame_samples
+        if speech:
+            self._counters["speech_frames"] += 1
+            self._speech_run += 1
+            self.silence_samples = 0
+            if not self.in_speech and self._speech_run >= self.start_frames:
+                self.in_speech = True
+                self.speech_start = self.position - self._speech_run * self.frame_samples
+                if self.on_speech_start is not None:
+                    self.on_speech_start(self.speech_start)
+        else:
+            self._speech_run = 0
+            self.silence_samples += self.frame_samples
+            if self.in_speech and self.silence_samples >= self.hangover_samples:
+                self.in_speech = False
+                if self.on_speech_end is not None:
+                    self.on_speech_end(self.position - self.silence_samples)
+
+    def stats(self):
+        return {**self._counters, "in_speech": self.in_speech, "silence_s": self.silence_s}